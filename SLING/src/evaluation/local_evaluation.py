@@ -1,6 +1,13 @@
 import argparse
 import json
-from relation_linking_core.relation_linking_service import KBQARelationLinkingService
+import multiprocessing
+import os
+import time
+from relation_linking_core.import_timer import ImportTimer
+from relation_linking_core.logging_utils import configure_logging
+from relation_linking_core.score_capture import ScoreCapture
+from relation_linking_core.sparql_cache.sparql_cache import is_shared_by_processes
+from relation_linking_core.tracing import Tracer
 
 
 def precision_recall_f1(predictions, golds):
@@ -19,12 +26,78 @@ def f1_score(p, r):
     return 2 * ((p * r) / (p + r))
 
 
+# the service of a worker process, built once by init_worker
+worker_service = None
+
+
+def init_worker(config, log_level, trace_origin):
+    global worker_service
+    configure_logging(log_level)
+    # imported here so that only the enabled relation linking modules (and their dependencies) are imported
+    from relation_linking_core.relation_linking_service import KBQARelationLinkingService
+    worker_service = KBQARelationLinkingService(config)
+    # perf_counter is system-wide, sharing the origin keeps the spans of all workers on the same timeline
+    worker_service.tracer.origin = trace_origin
+
+
+def link_batch(batch):
+    """
+    Links a batch of questions in a worker process.
+    :param batch: list of (q_id, question_text, amr_graph) tuples
+    :return: (list of q_ids, list of predicted relation lists, list of trace spans, list of score captures)
+    """
+    predictions = worker_service.process_batch([(text, amr) for _, text, amr in batch])
+    spans = worker_service.tracer.spans
+    worker_service.tracer.clear()
+    captures = worker_service.score_capture.drain() if worker_service.score_capture is not None else list()
+    return [q_id for q_id, _, _ in batch], predictions, spans, captures
+
+
+def load_results(results_path):
+    """
+    :param results_path: JSONL file with one evaluated question per line
+    :return: dict of q_id -> result, a partially written last line (e.g. after a crash) is ignored
+    """
+    results = dict()
+    if not results_path or not os.path.exists(results_path):
+        return results
+    with open(results_path) as results_file:
+        for line in results_file:
+            try:
+                result = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            results[result['q_id']] = result
+    return results
+
+
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('--input_path')
     parser.add_argument('--config_path')
+    parser.add_argument('--batch_size', type=int, default=1,
+                        help='number of questions sent to the relation linking service in one call')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='number of worker processes, each with its own relation linking service')
+    parser.add_argument('--results_path',
+                        help='JSONL file the result of each question is appended to, questions already in the file '
+                             'are not evaluated again')
+    parser.add_argument('--capture_path',
+                        help='saves the module scores of every question to this .npz file for replaying the '
+                             'aggregation with other module weights (see evaluation/weight_sweep.py), not with a '
+                             'resumed --results_path')
+    parser.add_argument('--log_level', default='INFO',
+                        help='DEBUG prints the per-triple diagnostics of every module, INFO only the progress')
+    parser.add_argument('--trace_path',
+                        help='enables per-stage latency tracing and writes the spans to this path '
+                             '(.jsonl for JSON lines, otherwise Chrome trace format)')
+    parser.add_argument('--import_report', action='store_true',
+                        help='prints the time spent importing each package and loading each module at startup, in '
+                             'the format of python -X importtime (with --workers 1)')
     args = parser.parse_args()
 
+    configure_logging(args.log_level)
+
     print(f"Input Path: {args.input_path}")
     print(f"Config Path: {args.config_path}")
 
@@ -34,52 +107,120 @@ if __name__ == '__main__':
     with open(args.config_path) as json_file:
         config = json.load(json_file)
 
-    service = KBQARelationLinkingService(config)
-
-    p_tot, r_tot, f1_tot = 0.0, 0.0, 0.0
-    q_count = 0
-
-    for q_id in list(input_data.keys()):
-
-        # if q_id != 'train_53':
-        #     continue
-
-        question = input_data[q_id]
-
-        question_text = question['text']
-        eamr = question['extended_amr']
-        gold_relations = question['relations']
-        if len(gold_relations) == 0:
-            continue
-
-        print("QID: {}".format(q_id))
-        predicted_relations = service.process(question_text, eamr)
-
-        print("SPARQL: {}".format(question["sparql"]))
-        print("gold: {}".format(", ".join(gold_relations)))
-        print("predicted: {}\n".format(", ".join(predicted_relations)))
-
-        p, r, f1 = precision_recall_f1(predicted_relations, gold_relations)
-        print('---------------------------------------')
-        print("QID: {}\nQuestion: {}\n".format(q_id, question_text))
-        print("P: {}, R: {}, F1: {}".format(p, r, f1))
-        print('---------------------------------------\n\n')
-
-        p_tot += p
-        r_tot += r
-        f1_tot += f1
-        q_count += 1
+    if args.workers > 1 and not is_shared_by_processes(config):
+        # the KG entity module is the only one that queries (and caches) SPARQL results
+        from relation_linking_core.relation_linking_service import KBQARelationLinkingService
+        if 'kg_entity_recommender_scores' in KBQARelationLinkingService.get_enabled_modules(config):
+            parser.error('--workers > 1 requires "sparql_cache_backend": "sqlite", the processes would overwrite '
+                         'each other\'s entries in the JSON SPARQL cache (see the README to import it once)')
+
+    if args.trace_path:
+        config['tracing'] = True
+    tracer = Tracer(bool(args.trace_path))
+
+    if args.capture_path:
+        config['capture_scores'] = True
+    captures = list()
+
+    results = load_results(args.results_path)
+    if results:
+        print("{} questions loaded from {}".format(len(results), args.results_path))
+
+    q_ids = [q_id for q_id in input_data.keys() if len(input_data[q_id]['relations']) > 0]
+    pending_q_ids = [q_id for q_id in q_ids if q_id not in results]
+    if args.capture_path and len(pending_q_ids) < len(q_ids):
+        # the scores of the questions evaluated by the previous runs were not captured
+        parser.error('--capture_path needs the scores of every question, but {} questions are already in {}, use a '
+                     'new --results_path'.format(len(q_ids) - len(pending_q_ids), args.results_path))
+    batches = [[(q_id, input_data[q_id]['text'], input_data[q_id]['extended_amr'])
+                for q_id in pending_q_ids[batch_start:batch_start + args.batch_size]]
+               for batch_start in range(0, len(pending_q_ids), args.batch_size)]
+
+    if args.workers > 1:
+        if args.import_report:
+            print("WARNING: --import_report is only available with --workers 1")
+        pool = multiprocessing.Pool(args.workers, initializer=init_worker,
+                                    initargs=(config, args.log_level, tracer.origin))
+        batch_results = pool.imap_unordered(link_batch, batches)
+    else:
+        pool = None
+        import_timer = ImportTimer()
+        if args.import_report:
+            import_timer.install()
+        start = time.perf_counter()
+        init_worker(config, args.log_level, tracer.origin)
+        startup_time = time.perf_counter() - start
+        import_timer.uninstall()
+        if args.import_report:
+            import_timer.print_report()
+            for module_name, load_time in worker_service.load_times.items():
+                print("{} loaded in {:.3f} s".format(module_name, load_time))
+            print("Service started in {:.3f} s".format(startup_time))
+        batch_results = map(link_batch, batches)
+
+    results_file = open(args.results_path, 'a') if args.results_path else None
+
+    for batch_q_ids, batch_predictions, spans, batch_captures in batch_results:
+
+        print("QIDs: {}".format(", ".join(batch_q_ids)))
+        tracer.spans.extend(spans)
+        for q_id, predicted_relations, capture in zip(batch_q_ids, batch_predictions, batch_captures):
+            capture.update({'q_id': q_id, 'gold': input_data[q_id]['relations'], 'predicted': predicted_relations})
+            captures.append(capture)
+
+        for q_id, predicted_relations in zip(batch_q_ids, batch_predictions):
+
+            question = input_data[q_id]
+
+            question_text = question['text']
+            gold_relations = question['relations']
+
+            print("QID: {}".format(q_id))
+            print("SPARQL: {}".format(question["sparql"]))
+            print("gold: {}".format(", ".join(gold_relations)))
+            print("predicted: {}\n".format(", ".join(predicted_relations)))
+
+            p, r, f1 = precision_recall_f1(predicted_relations, gold_relations)
+            print('---------------------------------------')
+            print("QID: {}\nQuestion: {}\n".format(q_id, question_text))
+            print("P: {}, R: {}, F1: {}".format(p, r, f1))
+            print('---------------------------------------\n\n')
+
+            results[q_id] = {'q_id': q_id, 'predicted': predicted_relations, 'gold': gold_relations,
+                             'p': p, 'r': r, 'f1': f1}
+            if results_file:
+                results_file.write(json.dumps(results[q_id]) + '\n')
+                results_file.flush()
+
+        p_tot = sum([result['p'] for result in results.values()])
+        r_tot = sum([result['r'] for result in results.values()])
+        q_count = len(results)
 
         print('Global: {} questions'.format(q_count))
         print("P: {}, R: {}, F1: {}".format(p_tot/q_count, r_tot/q_count, f1_score(p_tot/q_count, r_tot/q_count)))
         print('---------------------------------------\n\n')
 
-    p_tot /= q_count
-    r_tot /= q_count
+    if results_file:
+        results_file.close()
+    if pool:
+        pool.close()
+        pool.join()
+
+    # the results file may contain questions that are no longer in the input
+    evaluated = [results[q_id] for q_id in q_ids if q_id in results]
+    q_count = len(evaluated)
+    p_tot = sum([result['p'] for result in evaluated]) / q_count
+    r_tot = sum([result['r'] for result in evaluated]) / q_count
     f1_tot = f1_score(p_tot, r_tot)
 
     print("\n\n\nFinal results:\n\t# of Qs: {}\t\nPrecision: {}\n\tRecall: {}\n\tF1: {}".format(q_count, p_tot, r_tot,
                                                                                                 f1_tot))
 
+    if args.capture_path:
+        ScoreCapture.save(args.capture_path, captures, config['module_weights'])
+        print("Module scores of {} questions written to {}".format(len(captures), args.capture_path))
 
-
+    if args.trace_path:
+        tracer.print_summary()
+        tracer.export(args.trace_path)
+        print("Trace written to {}".format(args.trace_path))
@@ -0,0 +1,72 @@
+import argparse
+import itertools
+import json
+from evaluation.local_evaluation import precision_recall_f1, f1_score
+from relation_linking_core.score_replay import ScoreReplay
+
+
+def get_weights_list(weights_spec, default_weights):
+    """
+    :param weights_spec: list of module_weights dicts, or a grid as a dict of module -> list of weights
+    :param default_weights: weights of the modules that are not in the grid
+    :return: list of module_weights dicts
+    """
+    if isinstance(weights_spec, list):
+        return weights_spec
+    modules = list(weights_spec.keys())
+    weights_list = list()
+    for values in itertools.product(*[weights_spec[module] for module in modules]):
+        module_weights = dict(default_weights)
+        module_weights.update(zip(modules, values))
+        weights_list.append(module_weights)
+    return weights_list
+
+
+def evaluate(predictions, golds):
+    p_tot, r_tot = 0.0, 0.0
+    for predicted_relations, gold_relations in zip(predictions, golds):
+        p, r, _ = precision_recall_f1(predicted_relations, gold_relations)
+        p_tot += p
+        r_tot += r
+    p_tot /= len(golds)
+    r_tot /= len(golds)
+    return p_tot, r_tot, f1_score(p_tot, r_tot)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--capture_path', help='module scores saved with local_evaluation.py --capture_path')
+    parser.add_argument('--weights_path',
+                        help='JSON file with a list of module_weights dicts, or a dict of module -> list of weights '
+                             'that is expanded to all combinations')
+    parser.add_argument('--output_path', help='JSONL file with the results of every configuration')
+    parser.add_argument('--top', type=int, default=10, help='number of best configurations to print')
+    parser.add_argument('--chunk_size', type=int, default=256, help='number of configurations replayed together')
+    args = parser.parse_args()
+
+    replay = ScoreReplay(args.capture_path)
+    print("{} questions loaded from {}".format(len(replay.questions), args.capture_path))
+
+    # the captured weights reproduce the captured predictions
+    _, baseline_predictions = next(replay.replay([replay.module_weights]))
+    matching = sum([1 for replayed, captured in zip(baseline_predictions, replay.predicted) if replayed == captured])
+    print("Captured weights: {}\n\treplayed predictions match for {}/{} questions\n\tP: {}, R: {}, F1: {}".format(
+        replay.module_weights, matching, len(replay.questions), *evaluate(baseline_predictions, replay.gold)))
+
+    with open(args.weights_path) as json_file:
+        weights_list = get_weights_list(json.load(json_file), replay.module_weights)
+    print("Replaying {} weight configurations".format(len(weights_list)))
+
+    output_file = open(args.output_path, 'w') if args.output_path else None
+    results = list()
+    for module_weights, predictions in replay.replay(weights_list, chunk_size=args.chunk_size):
+        p, r, f1 = evaluate(predictions, replay.gold)
+        results.append((f1, p, r, module_weights))
+        if output_file:
+            output_file.write(json.dumps({'module_weights': module_weights, 'p': p, 'r': r, 'f1': f1}) + '\n')
+    if output_file:
+        output_file.close()
+
+    print("\nBest configurations:")
+    for f1, p, r, module_weights in sorted(results, key=lambda x: x[0], reverse=True)[:args.top]:
+        print("P: {:.4f}, R: {:.4f}, F1: {:.4f}\t{}".format(p, r, f1, json.dumps(module_weights)))
@@ -84,23 +84,35 @@ class RankingNN(SentenceRE):
         pred = pred.item()
         return self.id2rel[pred], score
 
-    def infer_ranking(self, item):
-        self.eval()
-        item = self.sentence_encoder.tokenize(item)
-        new_item = []
-        if torch.cuda.is_available():
-            for i in range(len(item)):
-                new_item.append(item[i].cuda())
-        else:
-            new_item = item
+    def infer_ranking(self, item, k=None):
+        return self.infer_ranking_batch([item], k=k)[0]
 
-#         print(self.r_hiddens)
-#         print(new_item)
-        logits = self.forward(('emb', self.r_hiddens), *new_item)
-        logits = self.softmax(logits)
-        ranked_list = [(self.id2rel[i], x.item()) for i, x in enumerate(logits[0, :])]
-        ranked_list = sorted(ranked_list, key=lambda x: x[1], reverse=True)
-        return ranked_list
+    def infer_ranking_batch(self, items, k=None, batch_size=32):
+        """
+        Args:
+            items: list of data instances containing 'text' / 'token', 'h' and 't'
+            k: number of top relations returned for each instance, all relations if None
+            batch_size: number of instances encoded together
+        Return:
+            list of ranked (relation, score) lists, one per instance
+        """
+        self.eval()
+        ranked_lists = []
+        for start in range(0, len(items), batch_size):
+            batch = [self.sentence_encoder.tokenize(item) for item in items[start:start + batch_size]]
+            # every encoder output is (1, ...), so the instances are concatenated along the first dimension
+            new_item = [torch.cat([item[i] for item in batch], 0) for i in range(len(batch[0]))]
+            if torch.cuda.is_available():
+                new_item = [x.cuda() for x in new_item]
+
+            with torch.no_grad():
+                logits = self.forward(('emb', self.r_hiddens), *new_item)
+                logits = self.softmax(logits)
+                top_k = logits.size(-1) if k is None else min(k, logits.size(-1))
+                scores, preds = logits.topk(top_k, dim=-1) # (B, k)
+            for row_scores, row_preds in zip(scores.cpu().tolist(), preds.cpu().tolist()):
+                ranked_lists.append([(self.id2rel[pred], score) for pred, score in zip(row_preds, row_scores)])
+        return ranked_lists
     
     def get_rws(self, r):
         """
@@ -199,21 +211,33 @@ class RankingNN(SentenceRE):
             print('Error')
             return None
 
-    def forward_all_relations(self):
+    def forward_all_relations(self, chunk_size=None):
+        """
+        Args:
+            chunk_size: number of relations encoded together, all relations at once if None
+        Return:
+            relation embeddings, (N, H)
+        """
         rs = np.array(list(range(len(self.id2rel))), dtype=np.int64)
 #         rs = torch.tensor(rs).long().cuda().unsqueeze(-1)
         rs = np.expand_dims(rs, axis=-1)
-        rw, rw_mask = self.get_rws(rs)
-        
-        zero_position = torch.zeros(rw.size(0), 1).long()
-        
-        rw = rw.squeeze(1)
-        rw_mask = rw_mask.squeeze(1)
-#         print(rw.size())
-#         print(zero_position.size())
-        
-        r_hiddens = self.sentence_encoder(rw, rw_mask, zero_position, zero_position) # (N, H)
-        r_hiddens = r_hiddens.data
+        if chunk_size is None:
+            chunk_size = len(rs)
+
+        r_hiddens = []
+        for start in range(0, len(rs), chunk_size):
+            rw, rw_mask = self.get_rws(rs[start:start + chunk_size])
+
+            zero_position = torch.zeros(rw.size(0), 1).long()
+
+            rw = rw.squeeze(1)
+            rw_mask = rw_mask.squeeze(1)
+#             print(rw.size())
+#             print(zero_position.size())
+
+            r_hiddens_ = self.sentence_encoder(rw, rw_mask, zero_position, zero_position) # (C, H)
+            r_hiddens.append(r_hiddens_.data)
+        r_hiddens = torch.cat(r_hiddens, 0) # (N, H)
         return r_hiddens
     
     def forward_relations(self, r, rw, r_mask):
@@ -1,3 +1,6 @@
+from collections import Counter
+
+
 # Interface which returns final rel scores after aggregation of different module scores
 class Aggregator:
     """
@@ -13,4 +16,72 @@ class Aggregator:
         :param scores_dict:
         :return: dict of str --> dict
         """
-        raise NotImplementedError('Please implement an aggregate function')
\ No newline at end of file
+        raise NotImplementedError('Please implement an aggregate function')
+
+    def prepare_scores(self, scores_dict, inverse_scores_dict):
+        """
+        Takes in the scores_dicts of the direct and inverse directions of a triple and returns them ready to be
+        aggregated, i.e., normalized and with the statistical mapping scores of both directions merged.
+        :return: (scores_dict, inverse_scores_dict) tuple
+        """
+        return Aggregator.prepare_scores_dicts(scores_dict, inverse_scores_dict)
+
+    @classmethod
+    def prepare_scores_dicts(cls, scores_dict, inverse_scores_dict):
+        """
+        Prepares the module scores (dicts of module -> Counter) of the two directions of a triple for aggregation.
+        :return: (scores_dict, inverse_scores_dict) tuple
+        """
+        # Do min-max normalization of scores from each dict here (from the union of direct and inverse directions,
+        # to get a better triple scoring)
+        scores_dict, inverse_scores_dict = Aggregator.do_normalization(scores_dict, inverse_scores_dict)
+
+        direct_amr_scores = scores_dict['statistical_rel_mapping_scores']
+        inverse_amr_scores = inverse_scores_dict['statistical_rel_mapping_scores']
+        union_amr_scores = Counter()
+        for rel, score in direct_amr_scores.items():
+            union_amr_scores[rel] = score
+            for rel, score in inverse_amr_scores.items():
+                union_amr_scores[rel] = max(score, union_amr_scores[rel])
+            scores_dict['statistical_rel_mapping_scores'] = union_amr_scores
+            inverse_scores_dict['statistical_rel_mapping_scores'] = union_amr_scores
+
+        return scores_dict, inverse_scores_dict
+
+    @classmethod
+    def do_normalization(cls, scores_dict, inverse_scores_dict):
+        normalized_scores_dict, normalized_inverse_scores_dict = {}, {}
+
+        if set(scores_dict.keys()) != set(inverse_scores_dict.keys()):
+            raise ValueError('There is a scoring measure that is not common to both direct and inverse mappings')
+
+        for module_name in scores_dict.keys():
+            if module_name != 'corrected_question_similarity_based_rel_recommender_scores':
+                normalized_scores_dict[module_name] = scores_dict[module_name]
+                normalized_inverse_scores_dict[module_name] = inverse_scores_dict[module_name]
+                continue
+
+            direct_scores, inverse_scores = scores_dict[module_name], inverse_scores_dict[module_name]
+            normalized_direct_scores, normalized_inverse_scores = Counter(), Counter()
+
+            direct_scores_set = set(direct_scores.values())
+            inverse_scores_set = set(inverse_scores.values())
+            all_scores = direct_scores_set.union(inverse_scores_set)
+
+            if len(all_scores) == 0:
+                normalized_scores_dict[module_name] = normalized_direct_scores
+                normalized_inverse_scores_dict[module_name] = normalized_inverse_scores
+                continue
+
+            max_val, min_val = max(all_scores), min(all_scores)
+            for rel, score in direct_scores.items():
+                normalized_direct_scores[rel] = 0.0 if (max_val - min_val == 0) else (score - min_val) / (
+                            max_val - min_val)
+            for rel, score in inverse_scores.items():
+                normalized_inverse_scores[rel] = 0.0 if (max_val - min_val == 0) else (score - min_val) / (
+                            max_val - min_val)
+
+            normalized_scores_dict[module_name] = normalized_direct_scores
+            normalized_inverse_scores_dict[module_name] = normalized_inverse_scores
+
+        return normalized_scores_dict, normalized_inverse_scores_dict
@@ -0,0 +1,137 @@
+from relation_linking_core.candidate_aggregators.aggregator import Aggregator
+from collections import Counter
+import numpy as np
+import threading
+
+
+class RelationVocabulary:
+    """
+    Maps relations to integer ids shared by all the modules and triples.
+    """
+
+    def __init__(self):
+        self.relation_ids = dict()
+        self.relations = list()
+        self.lock = threading.Lock()
+
+    def get_ids(self, relations):
+        """
+        :param relations: list (or dict keys) of relations, new relations are added to the vocabulary
+        :return: array of relation ids
+        """
+        relation_ids = self.relation_ids
+        for rel in relations:
+            if rel not in relation_ids:
+                with self.lock:
+                    if rel not in relation_ids:
+                        relation_ids[rel] = len(self.relations)
+                        self.relations.append(rel)
+        return np.fromiter(map(relation_ids.__getitem__, relations), dtype=np.int64, count=len(relations))
+
+    def get_sparse_scores(self, relation_scores):
+        """
+        :param relation_scores: Counter of relation scores
+        :return: (relation ids, scores) arrays in the insertion order of the Counter
+        """
+        return self.get_ids(relation_scores.keys()), np.fromiter(relation_scores.values(), dtype=np.float64,
+                                                                 count=len(relation_scores))
+
+
+class DenseAggregator(Aggregator):
+    """
+    Same results as SimpleAggregator (with the Counter based prepare_scores), computed with NumPy on sparse
+    (relation ids, scores) arrays over a shared relation vocabulary. The module scores are converted once per triple in
+    prepare_scores; the normalization, the merge of the statistical mapping scores and the weighted sum are then array
+    operations. The insertion order of the Counters is kept, so ties are broken the same way.
+    """
+
+    def __init__(self, config=None):
+        self.module_weights = config["module_weights"]
+        self.vocabulary = RelationVocabulary()
+
+    def prepare_scores(self, scores_dict, inverse_scores_dict):
+        if set(scores_dict.keys()) != set(inverse_scores_dict.keys()):
+            raise ValueError('There is a scoring measure that is not common to both direct and inverse mappings')
+
+        sparse_scores_dict = {module: self.vocabulary.get_sparse_scores(scores_dict[module]) for module in scores_dict}
+        sparse_inverse_scores_dict = {module: self.vocabulary.get_sparse_scores(inverse_scores_dict[module])
+                                      for module in inverse_scores_dict}
+
+        module = 'corrected_question_similarity_based_rel_recommender_scores'
+        if module in sparse_scores_dict:
+            sparse_scores_dict[module], sparse_inverse_scores_dict[module] = DenseAggregator.normalize(
+                sparse_scores_dict[module], sparse_inverse_scores_dict[module])
+
+        module = 'statistical_rel_mapping_scores'
+        if len(sparse_scores_dict[module][0]) > 0:
+            union_scores = DenseAggregator.union_scores(sparse_scores_dict[module], sparse_inverse_scores_dict[module])
+            sparse_scores_dict[module] = union_scores
+            sparse_inverse_scores_dict[module] = union_scores
+
+        return sparse_scores_dict, sparse_inverse_scores_dict
+
+    @classmethod
+    def normalize(cls, direct_scores, inverse_scores):
+        """
+        Min-max normalization over the scores of both directions.
+        """
+        all_scores = np.concatenate([direct_scores[1], inverse_scores[1]])
+        if len(all_scores) == 0:
+            return direct_scores, inverse_scores
+        max_val, min_val = all_scores.max(), all_scores.min()
+        if max_val - min_val == 0:
+            return (direct_scores[0], np.zeros(len(direct_scores[0]))), \
+                   (inverse_scores[0], np.zeros(len(inverse_scores[0])))
+        return (direct_scores[0], (direct_scores[1] - min_val) / (max_val - min_val)), \
+               (inverse_scores[0], (inverse_scores[1] - min_val) / (max_val - min_val))
+
+    @classmethod
+    def union_scores(cls, direct_scores, inverse_scores):
+        """
+        Merges the statistical mapping scores of both directions as Aggregator.prepare_scores_dicts does: relations in
+        both directions get the max of the two scores, relations only in the inverse direction the max of their score
+        and 0. The first direct relation comes first, then the inverse relations and the other direct relations.
+        """
+        direct_ids, direct_values = direct_scores
+        inverse_ids, inverse_values = inverse_scores
+
+        in_direct = np.isin(inverse_ids, direct_ids)
+        in_inverse = np.isin(direct_ids, inverse_ids)
+        inverse_union_values = np.maximum(inverse_values, 0.0)
+        # relations in both directions, aligned with inverse_ids
+        if in_direct.any():
+            direct_values_by_id = dict(zip(direct_ids.tolist(), direct_values.tolist()))
+            shared_direct_values = np.array([direct_values_by_id[rel_id] for rel_id in inverse_ids[in_direct].tolist()])
+            inverse_union_values[in_direct] = np.maximum(inverse_values[in_direct], shared_direct_values)
+
+        first_id, first_value = direct_ids[:1], direct_values[:1]
+        if in_inverse[0]:
+            first_value = inverse_union_values[inverse_ids == direct_ids[0]]
+        not_first = inverse_ids != direct_ids[0]
+        rest = ~in_inverse
+        rest[0] = False
+        return np.concatenate([first_id, inverse_ids[not_first], direct_ids[rest]]), \
+               np.concatenate([first_value, inverse_union_values[not_first], direct_values[rest]])
+
+    def aggregate(self, scores_dict, params=None):
+        """
+        Takes in the sparse scores_dict returned by prepare_scores and returns a Counter of relation scores with the
+        same values and order as SimpleAggregator.
+        """
+        ids = [scores_dict[module][0] for module in scores_dict]
+        all_ids = np.concatenate(ids) if ids else np.zeros(0, dtype=np.int64)
+        if len(all_ids) == 0:
+            return Counter()
+
+        unique_ids, first_index = np.unique(all_ids, return_index=True)
+        aggregated_scores = np.zeros(len(unique_ids), dtype=np.float64)
+        for module, (module_ids, module_scores) in scores_dict.items():
+            if len(module_ids) == 0:
+                continue
+            module_weight = self.module_weights[module] if module in self.module_weights else 1
+            aggregated_scores[np.searchsorted(unique_ids, module_ids)] += module_scores * module_weight
+
+        order = np.argsort(first_index, kind='stable')
+        relations = self.vocabulary.relations
+        return Counter(dict(zip([relations[rel_id] for rel_id in unique_ids[order].tolist()],
+                                aggregated_scores[order].tolist())))
@@ -0,0 +1,76 @@
+import importlib.abc
+import sys
+import threading
+import time
+
+
+class ImportTimer(importlib.abc.MetaPathFinder):
+    """
+    Records the time spent importing each module while it is installed, as python -X importtime does: the self time
+    of a module excludes the modules it imports, its cumulative time includes them. Only the imports of the thread that
+    installed it are timed.
+    """
+
+    def __init__(self):
+        # (module name, self time, cumulative time, depth) in the order the imports complete
+        self.records = list()
+        self.nested_times = list()
+        self.thread_id = None
+
+    def install(self):
+        self.thread_id = threading.get_ident()
+        sys.meta_path.insert(0, self)
+
+    def uninstall(self):
+        if self in sys.meta_path:
+            sys.meta_path.remove(self)
+
+    def find_spec(self, fullname, path, target=None):
+        if threading.get_ident() != self.thread_id:
+            return None
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, 'find_spec'):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is not None:
+                break
+        else:
+            return None
+
+        loader = spec.loader
+        # built-in and frozen modules are imported by the loader classes themselves, a loader shared by several modules
+        # (e.g., of a zip file) may already be timing one of them, and a loader without a __dict__ can not be timed
+        if loader is None or isinstance(loader, type) or not hasattr(loader, '__dict__') or \
+                'exec_module' in loader.__dict__:
+            return spec
+
+        def exec_module(module):
+            self.nested_times.append(0.0)
+            start = time.perf_counter()
+            try:
+                type(loader).exec_module(loader, module)
+            finally:
+                del loader.exec_module
+                elapsed = time.perf_counter() - start
+                nested_time = self.nested_times.pop()
+                if self.nested_times:
+                    self.nested_times[-1] += elapsed
+                self.records.append((fullname, elapsed - nested_time, elapsed, len(self.nested_times)))
+
+        loader.exec_module = exec_module
+        return spec
+
+    def get_total_time(self):
+        return sum([cumulative for _, _, cumulative, depth in self.records if depth == 0])
+
+    def print_report(self, max_depth=1, min_time=0.01):
+        """
+        Prints the imports in the format of python -X importtime, the imports nested deeper than max_depth or faster
+        than min_time seconds are left out.
+        """
+        print("import time: self [us] | cumulative | imported package")
+        for name, self_time, cumulative, depth in self.records:
+            if depth <= max_depth and cumulative >= min_time:
+                print("import time: {:>9d} | {:>10d} | {}{}".format(int(self_time * 1e6), int(cumulative * 1e6),
+                                                                   '  ' * depth, name))
+        print("import time: {:.3f} s in total".format(self.get_total_time()))
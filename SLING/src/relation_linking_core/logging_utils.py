@@ -0,0 +1,44 @@
+import logging
+import sys
+
+
+class LazyFormat:
+    """
+    Defers building a log message argument until the record is emitted, e.g.
+
+        logger.debug("scores: %s", LazyFormat(format_scores, relation_scores))
+
+    so that expensive formatting is skipped when the level is disabled.
+    """
+
+    def __init__(self, fn, *args, **kwargs):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+
+    def __str__(self):
+        return str(self.fn(*self.args, **self.kwargs))
+
+
+def format_scores(relation_scores, n=10):
+    """
+    :param relation_scores: Counter with relation scores
+    :param n: number of top relations to include, None for all relations in insertion order
+    :return: "rel (score), ..." string
+    """
+    items = relation_scores.most_common(n) if n else relation_scores.items()
+    return ", ".join(["{} ({:.2f})".format(rel, score) for rel, score in items])
+
+
+def lazy_scores(relation_scores, n=10):
+    return LazyFormat(format_scores, relation_scores, n)
+
+
+def configure_logging(level='INFO'):
+    """
+    Configures the root logger to write bare messages to stdout, which keeps the DEBUG output identical to the former
+    print based diagnostics.
+    :param level: logging level name or number
+    """
+    logging.basicConfig(level=level if isinstance(level, int) else level.upper(), format='%(message)s',
+                        stream=sys.stdout)
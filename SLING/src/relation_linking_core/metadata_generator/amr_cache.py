@@ -0,0 +1,90 @@
+import hashlib
+import logging
+import os
+import pickle
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class AMRCache:
+    """
+    Content-addressed cache of the triples extracted from an EAMR, so that repeated questions skip the penman parsing,
+    the graph walk and the entity alignment. Entries are kept pickled in an in-process LRU and, if cache_dir is given,
+    as one file per entry in that directory, which can be shared by several processes and runs.
+
+    Values are unpickled on every get, so callers can modify them freely.
+    """
+
+    def __init__(self, max_size=10000, cache_dir=None):
+        self.max_size = max_size
+        self.cache_dir = cache_dir
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits, self.misses = 0, 0
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    @classmethod
+    def get_key(cls, question_text, amr_string, *settings):
+        """
+        :param settings: settings that change the cached value (e.g., the entity alignment mode), None is ignored
+        :return: hash of the question text, the EAMR and the settings, ignoring the whitespace around the EAMR
+        """
+        key = hashlib.sha256()
+        key.update(question_text.encode('utf-8'))
+        key.update(b'\0')
+        key.update(amr_string.strip().encode('utf-8'))
+        for setting in settings:
+            if setting is not None:
+                key.update(b'\0')
+                key.update(str(setting).encode('utf-8'))
+        return key.hexdigest()
+
+    def get(self, key):
+        """
+        :return: the cached value or None
+        """
+        with self.lock:
+            data = self.entries.get(key)
+            if data is not None:
+                self.entries.move_to_end(key)
+        if data is None and self.cache_dir:
+            try:
+                with open(self.get_path(key), 'rb') as f:
+                    data = f.read()
+                self.put_in_memory(key, data)
+            except OSError:
+                pass
+        if data is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return pickle.loads(data)
+
+    def put(self, key, value):
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        self.put_in_memory(key, data)
+        if self.cache_dir:
+            path = self.get_path(key)
+            try:
+                # written to a temporary file first so that other processes never read a partial entry
+                tmp_path = "{}.{}.{}.tmp".format(path, os.getpid(), threading.get_ident())
+                with open(tmp_path, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+            except OSError as ex:
+                logger.warning("WARNING: AMR cache entry could not be saved to %s\n\t%s", path, ex)
+
+    def put_in_memory(self, key, data):
+        if self.max_size <= 0:
+            return
+        with self.lock:
+            self.entries[key] = data
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def get_path(self, key):
+        return os.path.join(self.cache_dir, "{}.pkl".format(key))
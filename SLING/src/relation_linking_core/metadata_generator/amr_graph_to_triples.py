@@ -1,28 +1,39 @@
 import calendar
+import logging
 import re
 from itertools import combinations
-from nltk.stem import WordNetLemmatizer
+from relation_linking_core.metadata_generator.lemma_cache import LemmaCache
+
+logger = logging.getLogger(__name__)
 
 
 class AMR2Triples:
 
-    lemmatizer = WordNetLemmatizer()
+    # WordNet lemmas shared with EntityUtils, seeded from lemma_table_path by the service (nltk is only imported on the
+    # first token that is not cached)
+    lemmatizer = LemmaCache()
     op_pattern = re.compile("op([0-9]+)")
     ARG_REGEX = re.compile("ARG([0-9]+)")
     propbank_pattern = re.compile("([a-z0-9]+_)*(([a-z]+)-)+(\d\d)")
-    non_core_roles = ['accompanier', 'age', 'beneficiary', 'concession', 'condition', 'consist-of', 'destination',
-                      'direction', 'domain', 'duration', 'example', 'extent', 'frequency', 'instrument', 'location',
-                      'manner', 'medium', 'mod', 'ord', 'part', 'path', 'prep-with', 'purpose', 'quant', 'source',
-                      'subevent', 'time', 'topic', 'value']
-    conjunctions = ['or', 'and']
-    ignored_roles = ['name', 'instance', 'entities', 'entity', 'surface_form', 'type', 'uri']
+    non_core_roles = frozenset(['accompanier', 'age', 'beneficiary', 'concession', 'condition', 'consist-of',
+                                'destination', 'direction', 'domain', 'duration', 'example', 'extent', 'frequency',
+                                'instrument', 'location', 'manner', 'medium', 'mod', 'ord', 'part', 'path', 'prep-with',
+                                'purpose', 'quant', 'source', 'subevent', 'time', 'topic', 'value'])
+    conjunctions = frozenset(['or', 'and'])
+    ignored_roles = frozenset(['name', 'instance', 'entities', 'entity', 'surface_form', 'type', 'uri'])
+    # roles of the triples collected in the first pass of get_triples
+    collected_roles = frozenset(['instance', 'name', 'entities', 'entity', 'id', 'type', 'surface_form', 'uri'])
+    date_roles = frozenset(['year', 'month', 'day', 'weekday'])
+    # memoized role and value classifications
+    op_positions, arg_roles, frame_names = dict(), dict(), dict()
+    max_memoized_values = 100000
 
     @classmethod
     def print_triples(cls, triples, title):
-        print('\n{}:\n'.format(title))
+        logger.debug('\n%s:\n', title)
         for source, source_id, relation, target, target_id in triples:
-            print('{}\t{}\t{}\t{}\t{}'.format(source, source_id, relation, target, target_id))
-        print('\n')
+            logger.debug('%s\t%s\t%s\t%s\t%s', source, source_id, relation, target, target_id)
+        logger.debug('\n')
 
     @classmethod
     def concat_name(cls, names_ops):
@@ -41,22 +52,72 @@ class AMR2Triples:
             surface_text = dates[var_id]
         return surface_text.strip()
 
+    @classmethod
+    def get_op_position(cls, relation):
+        """
+        :return: the position of an op* relation (e.g., 2 for op2), None for other relations
+        """
+        try:
+            return AMR2Triples.op_positions[relation]
+        except KeyError:
+            match = AMR2Triples.op_pattern.match(relation)
+            return AMR2Triples.memoize(AMR2Triples.op_positions, relation, int(match.group(1)) if match else None)
+
+    @classmethod
+    def get_frame_name(cls, value):
+        """
+        :return: the frame name without the sense number if the value is a propbank frame (e.g., 'play-' for play-01),
+        None otherwise
+        """
+        value = str(value)
+        try:
+            return AMR2Triples.frame_names[value]
+        except KeyError:
+            match = AMR2Triples.propbank_pattern.match(value)
+            return AMR2Triples.memoize(AMR2Triples.frame_names, value, match.group(2) if match else None)
+
+    @classmethod
+    def is_arg_role(cls, relation):
+        try:
+            return AMR2Triples.arg_roles[relation]
+        except KeyError:
+            return AMR2Triples.memoize(AMR2Triples.arg_roles, relation,
+                                       AMR2Triples.ARG_REGEX.match(relation) is not None)
+
+    @classmethod
+    def memoize(cls, memo, key, value):
+        """
+        Adds the value to a memo dict, which is cleared when it is full. The memo dicts are shared by the threads of
+        the service, so the value is returned as computed rather than read back, another thread may clear the memo.
+        """
+        if len(memo) >= AMR2Triples.max_memoized_values:
+            memo.clear()
+        memo[key] = value
+        return value
+
+    @classmethod
+    def get_tokens(cls, sentence_text):
+        return sentence_text.replace('.', '').replace('?', '').split()
+
     @classmethod
     def get_triples(cls, sentence_text, graph, debug=False):
 
-        sentence_text = sentence_text.replace('.', '').replace('?', '')
-        token_list = [AMR2Triples.lemmatizer.lemmatize(token) for token in sentence_text.split()]
+        token_list = AMR2Triples.lemmatizer.lemmatize_many(AMR2Triples.get_tokens(sentence_text))
+        # position of the first occurrence of each token
+        token_positions = dict()
+        for position, token in enumerate(token_list):
+            token_positions.setdefault(token, position)
 
         triples = graph.triples()
 
         if debug:
-            print("Raw triples:")
+            logger.debug("Raw triples:")
             for trip in triples:
-                print("{}\t{}\t{}".format(trip[0], trip[1], trip[2]))
+                logger.debug("%s\t%s\t%s", trip[0], trip[1], trip[2])
 
         processed_triples = []
         # mappings between variables, their types, and names
-        name_var_list, var_to_type, var_to_name, name_to_var = list(), dict(), dict(), dict()
+        name_vars, var_to_type, var_to_name, name_to_var = set(), dict(), dict(), dict()
         # amr-unknown variable
         amr_unknown_var = None
         # info for concatenating named entity names.
@@ -64,13 +125,16 @@ class AMR2Triples:
         # map for resolving multi-words written with mod relations
         mod_maps, mod_resolved = dict(), set()
         # handling date time instances
-        date_var_list, grouped_var_to_date, dates = list(), dict(), dict()
+        date_vars, grouped_var_to_date, dates = set(), dict(), dict()
         # handling ordinals
-        ordinal_var_list, ordinal_value = list(), dict()
+        ordinal_vars, ordinal_value = set(), dict()
         # temporal quantity
-        temporal_var_list, temporal_value = list(), dict()
+        temporal_vars, temporal_value = set(), dict()
         # handle and triples
-        and_var_list, and_values = list(), dict()
+        and_vars, and_values = set(), dict()
+        # variables of each special instance type
+        typed_vars = {'name': name_vars, 'date-entity': date_vars, 'ordinal-entity': ordinal_vars,
+                      'temporal-quantity': temporal_vars, 'and': and_vars}
 
         # resolve the grouped_names_ops first
         for source, relation, target in triples:
@@ -79,16 +143,8 @@ class AMR2Triples:
                 var_to_type[source] = target
                 if target == 'amr-unknown':
                     amr_unknown_var = source
-                elif target == 'name':
-                    name_var_list.append(source)
-                elif target == 'date-entity':
-                    date_var_list.append(source)
-                elif target == 'ordinal-entity':
-                    ordinal_var_list.append(source)
-                elif target == 'temporal-quantity':
-                    temporal_var_list.append(source)
-                elif target == 'and':
-                    and_var_list.append(source)
+                elif target in typed_vars:
+                    typed_vars[target].add(source)
 
             # var - name relations
             elif relation == 'name':
@@ -98,36 +154,28 @@ class AMR2Triples:
                 # we ignore all expressive nodes
                 if target == 'expressive':
                     continue
-                mod_values = mod_maps.get(source, list())
-                mod_values.append(target)
-                mod_maps[source] = mod_values
-            elif relation in ['year', 'month', 'day', 'weekday'] and source in date_var_list:
-                var_to_date_group = grouped_var_to_date.get(source, dict())
-                var_to_date_group[relation] = target
-                grouped_var_to_date[source] = var_to_date_group
-            elif relation == 'value' and source in ordinal_var_list:
+                mod_maps.setdefault(source, list()).append(target)
+            elif relation in AMR2Triples.date_roles and source in date_vars:
+                grouped_var_to_date.setdefault(source, dict())[relation] = target
+            elif relation == 'value' and source in ordinal_vars:
                 ordinal_value[source] = target
-            elif relation == 'quant' and source in temporal_var_list:
+            elif relation == 'quant' and source in temporal_vars:
                 temporal_value[source] = target
             # collecting all op* relations
-            elif re.match(AMR2Triples.op_pattern, relation):
-                if source in name_var_list:
-                    op_pos = int(AMR2Triples.op_pattern.match(relation).group(1))
-                    name_ops = grouped_names_ops.get(source, dict())
-                    name_ops[op_pos] = str(target).replace("\"", "")
-                    grouped_names_ops[source] = name_ops
-                elif source in and_var_list:
-                    and_ops = and_values.get(source, set())
-                    and_ops.add(target)
-                    and_values[source] = and_ops
+            elif AMR2Triples.get_op_position(relation) is not None:
+                if source in name_vars:
+                    grouped_names_ops.setdefault(source, dict())[AMR2Triples.get_op_position(relation)] = \
+                        str(target).replace("\"", "")
+                elif source in and_vars:
+                    and_values.setdefault(source, set()).add(target)
 
         for var in var_to_name:
             name_to_var[var_to_name[var]] = var
 
         for var in mod_maps:
             head_word = var_to_type[var]
-            if head_word in token_list:
-                head_pos = token_list.index(head_word)
+            if head_word in token_positions:
+                head_pos = token_positions[head_word]
                 mod_type_var = dict()
                 mod_list = list()
                 for mod_var in mod_maps[var]:
@@ -142,7 +190,7 @@ class AMR2Triples:
                 filtered_tokens = token_list[init_pos:head_pos]
                 new_type_tokens = list()
                 for token in filtered_tokens:
-                    if token in mod_list:
+                    if token in mod_type_var:
                         mod_resolved.add(mod_type_var[token])
                         new_type_tokens.append(token)
                 new_type_tokens.append(head_word)
@@ -164,59 +212,53 @@ class AMR2Triples:
                 date_list.append(str(date_map['year']))
             dates[date_id] = '/'.join(date_list)
 
+        # variables whose triples have been processed above
+        processed_vars = date_vars | ordinal_vars | temporal_vars
+
         # process and values
         # TODO this does not fix the issue, this only takes one of the values. This should be fixed in a higher level.
-        new_triples = list()
-        for source, relation, target in triples:
-            if target in and_values:
-                all_values = and_values[target]
-                for value in all_values:
-                    new_triples.append([source, relation, value])
-            else:
-                new_triples.append([source, relation, target])
-        triples = new_triples
+        for source_id, relation, original_target_id in triples:
+            for target_id in and_values[original_target_id] if original_target_id in and_values \
+                    else [original_target_id]:
+                source, target = source_id, target_id
 
-        for source, relation, target in triples:
-            source_id = source
-            target_id = target
-
-            # TODO handle 'interrogative` trees
-            if target == 'interrogative':
-                continue
-            if relation in ['instance', 'name', 'entities', 'entity', 'id', 'type', 'surface_form', 'uri'] or re.match(AMR2Triples.op_pattern, relation) \
-                    or source in date_var_list or source in ordinal_var_list or source in temporal_var_list:
-                # we have already processed these triples and collected the necessary information
-                continue
-            if relation == 'mod':
-                if target == amr_unknown_var:
-                    # sometimes amr-unknown is indirectly attached with a mod relation to a variable
-                    amr_unknown_var = source
+                # TODO handle 'interrogative` trees
+                if target == 'interrogative':
                     continue
-                if target in mod_resolved:
+                if relation in AMR2Triples.collected_roles or AMR2Triples.get_op_position(relation) is not None \
+                        or source in processed_vars:
+                    # we have already processed these triples and collected the necessary information
                     continue
+                if relation == 'mod':
+                    if target == amr_unknown_var:
+                        # sometimes amr-unknown is indirectly attached with a mod relation to a variable
+                        amr_unknown_var = source
+                        continue
+                    if target in mod_resolved:
+                        continue
 
-            if relation == 'domain':
-                if target == amr_unknown_var:
-                    # sometimes amr-unknown is indirectly attached with a mod relation to a variable
-                    amr_unknown_var = source
-                    continue
+                if relation == 'domain':
+                    if target == amr_unknown_var:
+                        # sometimes amr-unknown is indirectly attached with a mod relation to a variable
+                        amr_unknown_var = source
+                        continue
 
-            if source in var_to_type:
-                source = str(var_to_type[source])
+                if source in var_to_type:
+                    source = str(var_to_type[source])
 
-            if target in dates:
-                target = dates[target]
+                if target in dates:
+                    target = dates[target]
 
-            if target in var_to_type:
-                target = str(var_to_type[target])
+                if target in var_to_type:
+                    target = str(var_to_type[target])
 
-            if target in ordinal_value:
-                target = str(ordinal_value[target])
+                if target in ordinal_value:
+                    target = str(ordinal_value[target])
 
-            if target in temporal_value:
-                target = str(temporal_value[target])
+                if target in temporal_value:
+                    target = str(temporal_value[target])
 
-            processed_triples.append([source, source_id, relation, target, target_id])
+                processed_triples.append([source, source_id, relation, target, target_id])
 
         if debug:
             AMR2Triples.print_triples(processed_triples, 'Processed triples')
@@ -248,18 +290,19 @@ class AMR2Triples:
             object_text = object_text.strip()
 
             # select subjects that are frames
-            if re.match(AMR2Triples.propbank_pattern, str(subject)):
+            if AMR2Triples.get_frame_name(subject) is not None:
                 # TODO what should we do when the object is a frame
-                if re.match(AMR2Triples.propbank_pattern, str(target)):
-                    target = re.match(AMR2Triples.propbank_pattern, str(target)).group(2)
+                target_frame_name = AMR2Triples.get_frame_name(target)
+                if target_frame_name is not None:
+                    target = target_frame_name
                 # we have handled these before (and & or)
                 if subject in AMR2Triples.conjunctions or target in AMR2Triples.conjunctions:
                     continue
                 args = frame_args.get(source_id, dict())
-                if re.match(AMR2Triples.ARG_REGEX, relation) or relation in AMR2Triples.non_core_roles:
+                if AMR2Triples.is_arg_role(relation) or relation in AMR2Triples.non_core_roles:
                     args[relation] = target_id
                 frame_args[source_id] = args
-            elif relation not in AMR2Triples.ignored_roles and not re.match(AMR2Triples.ARG_REGEX, relation):
+            elif relation not in AMR2Triples.ignored_roles and not AMR2Triples.is_arg_role(relation):
                 subject_type = str(var_to_type[source_id]).split()[-1]
 
                 triple = dict()
@@ -1,5 +1,8 @@
+import logging
 import penman
 
+logger = logging.getLogger(__name__)
+
 
 class AMRUtils:
 
@@ -7,13 +10,13 @@ class AMRUtils:
     def fix_amr_graph(cls, amr_string):
         amr_graph = penman.loads(amr_string)
         if len(amr_graph) > 1:
-            print('WARNING: enhanced AMR is mis-formatted')
+            logger.warning('WARNING: enhanced AMR is mis-formatted')
             lines = amr_string.split('\n')
             for i in range(len(lines)):
                 if ':entities' in lines[i] and lines[i - 1].strip().endswith(')'):
                     lines[i - 1] = lines[i - 1][:len(lines[i - 1]) - 1]
             new_amr = ' '.join(lines)
-            print(new_amr)
+            logger.debug(new_amr)
             amr_graph = penman.loads(' '.join(lines))[0]
         else:
             amr_graph = amr_graph[0]
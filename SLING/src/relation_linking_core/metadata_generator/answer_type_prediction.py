@@ -1,21 +1,43 @@
-import pickle
+import logging
+from collections import Counter
+from relation_linking_core.resource_store import ResourceStore
+from relation_linking_core.metadata_generator.question_fallback import QuestionFallback
+
+logger = logging.getLogger(__name__)
 
 
 class AnswerTypePredictionService:
 
     def __init__(self, config=None):
-        with open('../data/answer-types.pkl', 'rb') as f:
-            self.answer_type_cache = pickle.load(f)
-        print("Answer Type Prediction:\n\tloaded {} cached answer types!".format(len(self.answer_type_cache)))
+        config = config if config else dict()
+        # a .pkl file or the prefix of a resource store converted from it
+        self.answer_type_cache = ResourceStore.load_resource(
+            config.get('answer_type_paths', '../data/answer-types.pkl'))
+        logger.info("Answer Type Prediction:\n\tloaded %s cached answer types!", len(self.answer_type_cache))
+        # "answer_type_fallback": true predicts the answer types of new questions from the most similar cached ones
+        self.fallback = QuestionFallback(self.answer_type_cache, AnswerTypePredictionService.merge_answer_types,
+                                         config, 'answer_types') if config.get('answer_type_fallback', False) else None
 
     def get_answer_types(self, q_text):
         if q_text in self.answer_type_cache:
             return self.answer_type_cache[q_text]
-        else:
-            print("WARNING: question not found in cache.\n\t{}".format(q_text))
-            return list()
-
-
-
-
-
+        if self.fallback is not None:
+            answer_types = self.fallback.predict(q_text)
+            if answer_types is not None:
+                return answer_types
+        logger.warning("WARNING: question not found in cache.\n\t%s", q_text)
+        return list()
+
+    @classmethod
+    def merge_answer_types(cls, neighbours):
+        """
+        :param neighbours: list of (answer types, similarity) of the most similar cached questions
+        :return: the answer types with their similarity weighted mean scores, as many as those of the closest question
+        """
+        type_scores = Counter()
+        for answer_types, similarity in neighbours:
+            for answer_type, score in answer_types:
+                type_scores[answer_type] += similarity * score
+        total_similarity = sum([similarity for _, similarity in neighbours])
+        return [[answer_type, score / total_similarity]
+                for answer_type, score in type_scores.most_common(len(neighbours[0][0]))]
@@ -1,17 +1,45 @@
-import pickle
+import logging
+from collections import Counter
+from relation_linking_core.resource_store import ResourceStore
+from relation_linking_core.metadata_generator.question_fallback import QuestionFallback
+
+logger = logging.getLogger(__name__)
 
 
 class ContextualRelationsModule:
 
     def __init__(self, config=None):
-        with open('../data/contextual-relations.pkl', 'rb') as f:
-            self.contextual_relations_cache = pickle.load(f)
-        print("Contextual relations :\n\t{} loaded.".format(len(self.contextual_relations_cache)))
+        config = config if config else dict()
+        # a .pkl file or the prefix of a resource store converted from it
+        self.contextual_relations_cache = ResourceStore.load_resource(
+            config.get('contextual_relations_path', '../data/contextual-relations.pkl'))
+        logger.info("Contextual relations :\n\t%s loaded.", len(self.contextual_relations_cache))
+        # "contextual_relations_fallback": true predicts the relations of new questions from the most similar cached
+        # ones
+        self.fallback = QuestionFallback(self.contextual_relations_cache,
+                                         ContextualRelationsModule.merge_contextual_relations, config,
+                                         'contextual_relations') \
+            if config.get('contextual_relations_fallback', False) else None
 
     def get_contextual_relations(self, q_text):
         if q_text in self.contextual_relations_cache:
             return self.contextual_relations_cache[q_text]
-        else:
-            print("WARNING: question not found in cache.\n\t{}".format(q_text))
-            return list()
+        if self.fallback is not None:
+            contextual_relations = self.fallback.predict(q_text)
+            if contextual_relations is not None:
+                return contextual_relations
+        logger.warning("WARNING: question not found in cache.\n\t%s", q_text)
+        return list()
 
+    @classmethod
+    def merge_contextual_relations(cls, neighbours):
+        """
+        :param neighbours: list of (contextual relations, similarity) of the most similar cached questions
+        :return: the relations ranked by their similarity weighted reciprocal ranks, as many as those of the closest
+        question
+        """
+        relation_scores = Counter()
+        for relations, similarity in neighbours:
+            for rank, rel in enumerate(relations):
+                relation_scores[rel] += similarity / (rank + 1)
+        return [rel for rel, _ in relation_scores.most_common(len(neighbours[0][0]))]
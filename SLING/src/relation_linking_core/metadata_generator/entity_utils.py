@@ -1,13 +1,22 @@
 import json
+import logging
 import re
 import difflib
+import threading
 
 from relation_linking_core.metadata_generator.amr_graph_to_triples import AMR2Triples
 from relation_linking_core.metadata_generator.amr_types import AmrTypes
 
+logger = logging.getLogger(__name__)
+
 
 class EntityUtils:
 
+    # annotation maps already loaded, by path
+    entity_annotation_maps = dict()
+    entity_annotation_lock = threading.Lock()
+    ontology_class_pattern = re.compile('http://dbpedia.org/ontology/[A-Z]')
+
     @classmethod
     def clean_string(cls, str_value):
         if str_value:
@@ -44,8 +53,15 @@ class EntityUtils:
         return amr_entity_alignments, normalized_to_surface_form
 
     @classmethod
-    def align_entities_annotated(cls, text, amr_nodes, entites):
-        entity_map = EntityUtils.get_entity_annotation_map()
+    def align_entities_annotated(cls, text, amr_nodes, entites, annotation_path):
+        """
+        Aligns the manually annotated entities of the question to the closest AMR nodes, falls back to align_entities
+        with the EAMR entities for questions that are not annotated.
+        """
+        entity_map = EntityUtils.get_entity_annotation_map(annotation_path)
+        if text not in entity_map:
+            logger.warning("WARNING: no entity annotations for '%s'", text)
+            return EntityUtils.align_entities(amr_nodes, entites)
         amr_nodes_copy = list(amr_nodes)
 
         amr_entity_alignments = dict()
@@ -54,14 +70,45 @@ class EntityUtils:
         entities = entity_map[text]
 
         for entity in entities:
-            close_match = difflib.get_close_matches(entity, amr_nodes_copy, cutoff=0.2)
+            close_match = EntityUtils.get_close_match(entity, amr_nodes_copy, cutoff=0.2)
             if close_match:
-                amr_entity_alignments[close_match[0]] = entities[entity]
-                normalized_to_surface_form[close_match[0]] = entity
-                amr_nodes_copy.remove(close_match[0])
+                amr_entity_alignments[close_match] = entities[entity]
+                normalized_to_surface_form[close_match] = entity
+                amr_nodes_copy.remove(close_match)
 
         return amr_entity_alignments, normalized_to_surface_form
 
+    @classmethod
+    def get_trigrams(cls, term):
+        padded_term = "  {} ".format(term)
+        return {padded_term[i:i + 3] for i in range(len(padded_term) - 2)}
+
+    @classmethod
+    def get_close_match(cls, term, candidates, cutoff=0.6):
+        """
+        Same as difflib.get_close_matches(term, candidates, cutoff=cutoff)[0] (the candidate with the highest ratio, the
+        greatest candidate among ties), but candidates sharing more trigrams with the term are scored first and the
+        others are only scored if the difflib upper bounds of their ratio can still beat the best match.
+        :return: the closest candidate or None if no candidate reaches the cutoff
+        """
+        term_trigrams = EntityUtils.get_trigrams(term)
+        ranked_candidates = sorted(candidates, key=lambda candidate: len(term_trigrams & EntityUtils.get_trigrams(
+            candidate)), reverse=True)
+
+        best_match, best_score = None, cutoff
+        matcher = difflib.SequenceMatcher()
+        matcher.set_seq2(term)
+        for candidate in ranked_candidates:
+            matcher.set_seq1(candidate)
+            for score in (matcher.real_quick_ratio, matcher.quick_ratio, matcher.ratio):
+                upper_bound = score()
+                if upper_bound < best_score or (upper_bound == best_score and best_match is not None
+                                                and candidate <= best_match):
+                    break
+            else:
+                best_match, best_score = candidate, upper_bound
+        return best_match
+
     @classmethod
     def get_entities(cls, amr_tree):
         """ extract the entities from the extended AMR tree."""
@@ -143,8 +190,20 @@ class EntityUtils:
 
 
     @classmethod
-    def get_entity_annotation_map(cls):
-        path = "/Users/nandana.sampath.mihindukulasooriya@ibm.com/Downloads/FullyAnnotated_LCQuAD5000left.json"
+    def get_entity_annotation_map(cls, path):
+        """
+        :param path: annotated LC-QuAD JSON file, the "entity_annotation_path" of the config
+        :return: dict of question text -> dict of entity label -> uri, loaded once per path
+        """
+        if not path:
+            raise ValueError('aligning the annotated entities requires "entity_annotation_path" in the config')
+        with EntityUtils.entity_annotation_lock:
+            if path not in EntityUtils.entity_annotation_maps:
+                EntityUtils.entity_annotation_maps[path] = EntityUtils.load_entity_annotation_map(path)
+            return EntityUtils.entity_annotation_maps[path]
+
+    @classmethod
+    def load_entity_annotation_map(cls, path):
         with open(path) as json_file:
             en_data = json.load(json_file)
 
@@ -161,18 +220,10 @@ class EntityUtils:
                 if 'uri' not in predicate_mapping or 'label' not in predicate_mapping:
                     continue
 
-                if uri.startswith("http://dbpedia.org/resource/") or re.match('http://dbpedia.org/ontology/[A-Z]', uri):
+                if uri.startswith("http://dbpedia.org/resource/") or EntityUtils.ontology_class_pattern.match(uri):
                     entities[predicate_mapping['label']] = uri
 
             q_to_entities[text] = entities
 
+        logger.info("entity annotations of %d questions loaded from %s", len(q_to_entities), path)
         return q_to_entities
-
-
-
-
-
-
-
-
-
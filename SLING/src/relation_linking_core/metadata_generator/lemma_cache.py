@@ -0,0 +1,128 @@
+import argparse
+import json
+import logging
+import re
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class LemmaCache:
+    """
+    Memoizes the lemmas of a lemmatizer (e.g., WordNetLemmatizer) in a bounded LRU shared by the AMR triple extraction
+    and the entity normalization. It can be seeded with a precomputed lemma table (a JSON dict of token -> lemma) for
+    the question corpus; the seeded lemmas are never evicted.
+    """
+
+    def __init__(self, lemmatizer=None, max_size=100000, lemma_table_path=None):
+        """
+        :param lemmatizer: object with a lemmatize(token) method, by default a WordNetLemmatizer, which is only created
+        (and nltk imported) when the first token that is not cached is lemmatized
+        """
+        self.lemmatizer = lemmatizer
+        self.max_size = max_size
+        self.lemma_table = dict()
+        self.lemmas = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits, self.misses = 0, 0
+        if lemma_table_path:
+            self.load_table(lemma_table_path)
+
+    def load_table(self, lemma_table_path):
+        with open(lemma_table_path) as json_file:
+            lemma_table = json.load(json_file)
+        with self.lock:
+            self.lemma_table.update(lemma_table)
+        logger.info("%d lemmas loaded from %s", len(lemma_table), lemma_table_path)
+
+    def get_lemmatizer(self):
+        if self.lemmatizer is None:
+            from nltk.stem import WordNetLemmatizer
+            self.lemmatizer = WordNetLemmatizer()
+        return self.lemmatizer
+
+    def lemmatize(self, token):
+        return self.lemmatize_many([token])[0]
+
+    def lemmatize_many(self, tokens):
+        """
+        Lemmatizes a list of tokens, the distinct tokens that are not cached are lemmatized once.
+        :param tokens: list of str
+        :return: list of lemmas, one per token
+        """
+        found = dict()
+        with self.lock:
+            for token in tokens:
+                if token in found:
+                    continue
+                if token in self.lemma_table:
+                    found[token] = self.lemma_table[token]
+                elif token in self.lemmas:
+                    found[token] = self.lemmas[token]
+                    self.lemmas.move_to_end(token)
+
+        missing = [token for token in dict.fromkeys(tokens) if token not in found]
+        self.hits += len(found)
+        self.misses += len(missing)
+        if missing:
+            lemmatizer = self.get_lemmatizer()
+            new_lemmas = {token: lemmatizer.lemmatize(token) for token in missing}
+            found.update(new_lemmas)
+            if self.max_size > 0:
+                with self.lock:
+                    self.lemmas.update(new_lemmas)
+                    while len(self.lemmas) > self.max_size:
+                        self.lemmas.popitem(last=False)
+
+        return [found[token] for token in tokens]
+
+    def prefetch(self, tokens):
+        """
+        Lemmatizes the tokens in one pass before they are looked up one by one, if the cache can hold all of them.
+        Otherwise the lemmas would not be stored, or be evicted before their lookup, and the tokens lemmatized twice.
+        :param tokens: list of str
+        :return: True if the tokens were lemmatized
+        """
+        new_tokens = [token for token in dict.fromkeys(tokens) if token not in self.lemma_table]
+        if len(new_tokens) > self.max_size:
+            return False
+        self.lemmatize_many(new_tokens)
+        return True
+
+    def get_table(self):
+        """
+        :return: dict of all the known lemmas, which can be saved as a lemma table
+        """
+        with self.lock:
+            lemma_table = dict(self.lemmas)
+            lemma_table.update(self.lemma_table)
+        return lemma_table
+
+
+if __name__ == '__main__':
+    from relation_linking_core.metadata_generator.amr_graph_to_triples import AMR2Triples
+    from relation_linking_core.metadata_generator.entity_utils import EntityUtils
+
+    parser = argparse.ArgumentParser(description='precomputes the lemmas of the question tokens and entity surface '
+                                                 'forms of input files, to be set as lemma_table_path')
+    parser.add_argument('--input_paths', nargs='+', help='input files of local_evaluation.py')
+    parser.add_argument('--output_path', help='JSON lemma table')
+    args = parser.parse_args()
+
+    surface_form_pattern = re.compile(':surface_form\\s+"([^"]*)"')
+    for input_path in args.input_paths:
+        with open(input_path) as input_file:
+            questions = json.load(input_file)
+        if isinstance(questions, dict):
+            questions = list(questions.values())
+        for question in questions:
+            AMR2Triples.lemmatizer.lemmatize_many(AMR2Triples.get_tokens(question['text']))
+            for surface_form in surface_form_pattern.findall(question.get('extended_amr', '')):
+                EntityUtils.get_normalized_term(surface_form.lower())
+        print("{} questions processed from {}".format(len(questions), input_path))
+
+    lemma_table = AMR2Triples.lemmatizer.get_table()
+    with open(args.output_path, 'w') as json_file:
+        json.dump(lemma_table, json_file, indent=0, sort_keys=True)
+    print("{} lemmas saved to {}".format(len(lemma_table), args.output_path))
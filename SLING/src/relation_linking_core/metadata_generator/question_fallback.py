@@ -0,0 +1,208 @@
+import json
+import logging
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter, OrderedDict
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class QuestionIndex:
+    """
+    TF-IDF inverted index of the cached questions for cosine nearest neighbour lookups. The postings of each token are
+    (question ids, weights) arrays, and a lookup only visits the postings of the tokens of the query.
+    """
+
+    token_pattern = re.compile(r"\w+")
+
+    def __init__(self, questions):
+        self.questions = list(questions)
+        term_frequencies = [Counter(QuestionIndex.get_tokens(question)) for question in self.questions]
+        document_frequency = Counter()
+        for frequencies in term_frequencies:
+            document_frequency.update(frequencies.keys())
+        self.idf = {token: math.log((1 + len(self.questions)) / (1 + count)) + 1
+                    for token, count in document_frequency.items()}
+
+        postings = dict()
+        for question_id, frequencies in enumerate(term_frequencies):
+            weights = {token: count * self.idf[token] for token, count in frequencies.items()}
+            norm = math.sqrt(sum([weight * weight for weight in weights.values()]))
+            for token, weight in weights.items():
+                postings.setdefault(token, (list(), list()))
+                postings[token][0].append(question_id)
+                postings[token][1].append(weight / norm)
+        self.postings = {token: (np.array(ids, dtype=np.int64), np.array(weights, dtype=np.float64))
+                         for token, (ids, weights) in postings.items()}
+
+    @classmethod
+    def get_tokens(cls, text):
+        return QuestionIndex.token_pattern.findall(text.lower())
+
+    def get_neighbours(self, text, k=5, deadline=None):
+        """
+        :param text: question text
+        :param k: number of neighbours
+        :param deadline: time.perf_counter() value after which the remaining (less informative) tokens are skipped,
+        the rarest token is always used
+        :return: list of (question text, cosine similarity), most similar first
+        """
+        frequencies = Counter([token for token in QuestionIndex.get_tokens(text) if token in self.idf])
+        weights = {token: count * self.idf[token] for token, count in frequencies.items()}
+        norm = math.sqrt(sum([weight * weight for weight in weights.values()]))
+        if norm == 0:
+            return list()
+
+        scores = np.zeros(len(self.questions), dtype=np.float64)
+        # rare tokens first, so that the most informative postings are used when the deadline is reached
+        for position, token in enumerate(sorted(weights, key=lambda token: self.idf[token], reverse=True)):
+            if position > 0 and deadline is not None and time.perf_counter() > deadline:
+                logger.debug("question index lookup deadline reached for '%s'", text)
+                break
+            question_ids, question_weights = self.postings[token]
+            scores[question_ids] += question_weights * (weights[token] / norm)
+
+        k = min(k, len(self.questions))
+        if k == 0:
+            return list()
+        candidates = np.argpartition(-scores, k - 1)[:k]
+        candidates = candidates[np.argsort(-scores[candidates], kind='stable')]
+        return [(self.questions[question_id], float(scores[question_id])) for question_id in candidates.tolist()
+                if scores[question_id] > 0]
+
+
+class SqlitePredictionStore:
+    """
+    Stores the fallback predictions in a SQLite database, one row per (feature, settings, question), so that they are
+    kept across runs and shared by processes. As in SqliteSparqlCache, the database runs in WAL mode and each thread
+    (and forked process) opens its own connection.
+    """
+
+    def __init__(self, db_path, timeout=30):
+        self.db_path = db_path
+        self.timeout = timeout
+        # sqlite connections can not be shared between threads
+        self.local = threading.local()
+        self.pid = os.getpid()
+        conn = self.get_connection()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('CREATE TABLE IF NOT EXISTS fallback_predictions (feature TEXT NOT NULL, settings TEXT NOT NULL, '
+                     'question TEXT NOT NULL, prediction TEXT NOT NULL, PRIMARY KEY (feature, settings, question))')
+        conn.commit()
+
+    def get_connection(self):
+        if self.pid != os.getpid():
+            # a connection can not be used after a fork either, a forked worker opens its own
+            self.local = threading.local()
+            self.pid = os.getpid()
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=self.timeout)
+            self.local.conn = conn
+        return conn
+
+    def get(self, feature, settings, question):
+        row = self.get_connection().execute(
+            'SELECT prediction FROM fallback_predictions WHERE feature = ? AND settings = ? AND question = ?',
+            (feature, settings, question)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, feature, settings, question, prediction):
+        conn = self.get_connection()
+        with conn:
+            conn.execute('INSERT OR REPLACE INTO fallback_predictions (feature, settings, question, prediction) '
+                         'VALUES (?, ?, ?, ?)', (feature, settings, question, json.dumps(prediction)))
+
+
+class QuestionFallback:
+    """
+    Predicts a per-question feature (e.g., answer types) for the questions that are not in its precomputed cache by
+    merging the cached values of the most similar cached questions. The question index is built on the first miss.
+    A lookup that reaches the latency budget only uses the most informative tokens of the question. The predictions
+    are kept in a bounded in-memory cache and, if fallback_store_path is set, in a SQLite store that is checked before
+    the index is looked up, so that they are computed once per question, also across runs and processes.
+    """
+
+    def __init__(self, cache, merge, config=None, feature='default'):
+        """
+        :param cache: dict or ResourceStore of question text -> value
+        :param merge: function of a list of (value, similarity) of the neighbours, most similar first, to a JSON
+        serializable value
+        :param feature: name of the predicted feature in the prediction store (e.g., answer_types)
+        """
+        config = config if config else dict()
+        self.cache = cache
+        self.merge = merge
+        self.neighbours = config.get('fallback_neighbours', 5)
+        self.min_similarity = config.get('fallback_min_similarity', 0.3)
+        self.latency_budget = config.get('fallback_latency_budget_ms', 50) / 1000.0
+        self.max_size = config.get('fallback_cache_size', 10000)
+        self.index = None
+        self.predictions = OrderedDict()
+        self.lock = threading.Lock()
+
+        self.feature = feature
+        self.store = SqlitePredictionStore(config['fallback_store_path'], config.get('fallback_store_timeout', 30)) \
+            if config.get('fallback_store_path') else None
+        # the stored predictions are only reused with the same neighbours and cached questions
+        self.settings = json.dumps([self.neighbours, self.min_similarity, len(self.cache)])
+
+    def get_index(self):
+        with self.lock:
+            if self.index is None:
+                start = time.perf_counter()
+                self.index = QuestionIndex(self.cache.keys())
+                logger.info("question index of %d questions built in %.2f s", len(self.index.questions),
+                            time.perf_counter() - start)
+            return self.index
+
+    def predict(self, q_text):
+        """
+        :return: the predicted value, None if there is no similar cached question
+        """
+        with self.lock:
+            if q_text in self.predictions:
+                self.predictions.move_to_end(q_text)
+                return self.predictions[q_text]
+
+        if self.store is not None:
+            prediction = self.store.get(self.feature, self.settings, q_text)
+            if prediction is not None:
+                self.remember(q_text, prediction)
+                return prediction
+
+        index = self.get_index()
+        start = time.perf_counter()
+        neighbours = index.get_neighbours(q_text, self.neighbours, start + self.latency_budget)
+        neighbours = [(self.cache[question], similarity) for question, similarity in neighbours
+                      if similarity >= self.min_similarity]
+        prediction = self.merge(neighbours) if neighbours else None
+        elapsed = time.perf_counter() - start
+        if elapsed > self.latency_budget:
+            logger.warning("WARNING: fallback prediction took %.1f ms, over the %.1f ms budget", elapsed * 1000,
+                           self.latency_budget * 1000)
+
+        if prediction is not None:
+            self.remember(q_text, prediction)
+            if self.store is not None:
+                try:
+                    self.store.put(self.feature, self.settings, q_text, prediction)
+                except sqlite3.Error as ex:
+                    logger.warning("WARNING: fallback prediction could not be stored in %s\n\t%s", self.store.db_path,
+                                   ex)
+        return prediction
+
+    def remember(self, q_text, prediction):
+        if self.max_size <= 0:
+            return
+        with self.lock:
+            self.predictions[q_text] = prediction
+            self.predictions.move_to_end(q_text)
+            while len(self.predictions) > self.max_size:
+                self.predictions.popitem(last=False)
@@ -0,0 +1,86 @@
+import argparse
+import pickle
+import numpy as np
+
+
+class EmbeddingStore:
+    """
+    Word embeddings kept as a contiguous float32 matrix with a sorted table of the words (fixed-width utf-8 strings) and
+    the norm of each vector. The files written by convert are memory-mapped by load, so several processes share one
+    page-cache copy of the matrix and loading is almost instant.
+    """
+
+    def __init__(self, words, vectors, norms):
+        self.words = words
+        self.vectors = vectors
+        self.norms = norms
+
+    def __len__(self):
+        return len(self.words)
+
+    def __contains__(self, word):
+        return self.get_ids([word])[0] >= 0
+
+    def get_ids(self, tokens):
+        """
+        Looks up the matrix rows of the tokens
+        :param tokens: list of str
+        :return: int64 array with the row of each token, -1 for the tokens without an embedding
+        """
+        ids = np.full(len(tokens), -1, dtype=np.int64)
+        if len(tokens) == 0 or len(self.words) == 0:
+            return ids
+        encoded = [token.encode('utf-8') for token in tokens]
+        # longer tokens would be truncated to the width of the table
+        fits = np.array([len(token) <= self.words.itemsize for token in encoded])
+        if not fits.any():
+            return ids
+        keys = np.array([token for token, token_fits in zip(encoded, fits) if token_fits], dtype=self.words.dtype)
+        positions = np.minimum(np.searchsorted(self.words, keys), len(self.words) - 1)
+        found = self.words[positions] == keys
+        ids[np.flatnonzero(fits)[found]] = positions[found]
+        return ids
+
+    @classmethod
+    def from_dict(cls, embedding_dict):
+        words, vectors = EmbeddingStore.get_sorted_arrays(embedding_dict)
+        return EmbeddingStore(words, vectors, np.linalg.norm(vectors, axis=1))
+
+    @classmethod
+    def get_sorted_arrays(cls, embedding_dict):
+        encoded = sorted((word.encode('utf-8'), word) for word in embedding_dict)
+        width = max([len(word) for word, _ in encoded], default=1)
+        words = np.array([word for word, _ in encoded], dtype='S{}'.format(max(width, 1)))
+        if not encoded:
+            return words, np.zeros((0, 0), dtype=np.float32)
+        vectors = np.array([np.asarray(embedding_dict[word], dtype=np.float32) for _, word in encoded])
+        return words, vectors
+
+    @classmethod
+    def convert(cls, embedding_dict, path_prefix):
+        """
+        Writes the embeddings as <path_prefix>.words.npy, <path_prefix>.vectors.npy and <path_prefix>.norms.npy
+        """
+        words, vectors = EmbeddingStore.get_sorted_arrays(embedding_dict)
+        np.save(path_prefix + '.words.npy', words)
+        np.save(path_prefix + '.vectors.npy', vectors)
+        np.save(path_prefix + '.norms.npy', np.linalg.norm(vectors, axis=1))
+        return len(words)
+
+    @classmethod
+    def load(cls, path_prefix):
+        return EmbeddingStore(np.load(path_prefix + '.words.npy', mmap_mode='r'),
+                              np.load(path_prefix + '.vectors.npy', mmap_mode='r'),
+                              np.load(path_prefix + '.norms.npy', mmap_mode='r'))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--glove_vocab', help='pickled dict of word -> vector')
+    parser.add_argument('--output_prefix')
+    args = parser.parse_args()
+
+    with open(args.glove_vocab, 'rb') as filein:
+        embedding_dict = pickle.load(filein)
+    count = EmbeddingStore.convert(embedding_dict, args.output_prefix)
+    print("{} embeddings written to {}.*.npy".format(count, args.output_prefix))
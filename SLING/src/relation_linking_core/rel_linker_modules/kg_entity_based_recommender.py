@@ -1,9 +1,13 @@
 from collections import Counter
-import json
+import logging
 import pickle
-from SPARQLWrapper import SPARQLWrapper, JSON
 
+from relation_linking_core.logging_utils import lazy_scores
 from relation_linking_core.rel_linker_modules.rel_linker_module import RelModule
+from relation_linking_core.rel_linker_modules.sparql_client import SparqlClient
+from relation_linking_core.sparql_cache.sparql_cache import get_sparql_cache
+
+logger = logging.getLogger(__name__)
 
 
 class KBEntityBasedRecommender(RelModule):
@@ -28,11 +32,17 @@ class KBEntityBasedRecommender(RelModule):
 
         self.config = config
         self.dbpedia_endpoint = config['dbpedia_endpoint']
-
-        print("Initializing KB Entity Based Recommender ....")
-        with open(config["sparql_cache_path"]) as f:
-            self.sparql_cache = json.load(f)
-        print("\t{} cached SPARQL results are loaded!".format(len(self.sparql_cache)))
+        self.sparql_client = SparqlClient(self.dbpedia_endpoint,
+                                          max_concurrency=config.get('sparql_max_concurrency', 8),
+                                          timeout=config.get('sparql_timeout', 30))
+        # number of entities fetched by each VALUES query, 0 to send one query per entity
+        self.values_batch_size = config.get('sparql_values_batch_size', 50)
+        # result size limit of the endpoint, batched results with this many rows may be truncated
+        self.sparql_max_rows = config.get('sparql_max_rows', 10000)
+
+        logger.info("Initializing KB Entity Based Recommender ....")
+        self.sparql_cache = get_sparql_cache(config)
+        logger.info("\t%s cached SPARQL results are loaded!", len(self.sparql_cache))
 
         with open(config["datatype_rels_path"], 'rb') as f:
             datatype_relations = pickle.load(f)
@@ -40,10 +50,10 @@ class KBEntityBasedRecommender(RelModule):
         self.numeric_relations = datatype_relations['numeric']
         self.date_relations = datatype_relations['date']
 
-        print("Datatype relations:\n\tNumeric: {}\n\tDate: {}".format(len(self.numeric_relations),
-                                                                      len(self.date_relations)))
+        logger.info("Datatype relations:\n\tNumeric: %s\n\tDate: %s", len(self.numeric_relations),
+                    len(self.date_relations))
 
-        print("\tKB Entity Based Recommender Initialized.")
+        logger.info("\tKB Entity Based Recommender Initialized.")
 
     def get_relation_candidates(self, triple_data, params=None):
         relation_scores = Counter()
@@ -53,18 +63,18 @@ class KBEntityBasedRecommender(RelModule):
         obj_text, obj_type, obj_uri, obj_type_uri = triple_data['obj_text'], triple_data['obj_type'], \
                                                     triple_data['obj_uri'], triple_data['obj_type_uri']
 
-        print("\t------------ Fetching KB relations: ------------")
+        logger.debug("\t------------ Fetching KB relations: ------------")
         if subj_uri or obj_uri or subj_type_uri or obj_type_uri:
             all_relations = self.get_all_relations(subj=subj_uri, obj=obj_uri)
-            print('\tAll entity relations: {}'.format(len(all_relations)))
+            logger.debug('\tAll entity relations: %s', len(all_relations))
             if len(all_relations) < 20:
-                print('\t\t{}'.format(all_relations))
+                logger.debug('\t\t%s', all_relations)
             datatype_matched = []
             strict_relations, strict_weight = self.get_strict_relations(subj=subj_uri, subj_type=subj_type_uri,
                                                                                obj=obj_uri, obj_type=obj_type_uri)
             if triple_data['obj_id'] == triple_data['amr_unknown_var'] and 'answer_datatype' in triple_data:
                 if triple_data['answer_datatype']:
-                    print("\t\tDatatype range: {}".format(triple_data['answer_datatype']))
+                    logger.debug("\t\tDatatype range: %s", triple_data['answer_datatype'])
                 if triple_data['answer_datatype'] in ['AGE', 'CARDINAL', 'MEASURE']:
                     datatype_matched = self.numeric_relations.intersection(set(all_relations))
                 elif triple_data['answer_datatype'] == 'DATE':
@@ -79,9 +89,9 @@ class KBEntityBasedRecommender(RelModule):
                 strict_relations = datatype_matched
                 strict_weight = 2
 
-            print('\tRelations with constraints: {}'.format(len(strict_relations)))
+            logger.debug('\tRelations with constraints: %s', len(strict_relations))
             if len(strict_relations) < 20:
-                print('\t\t{}'.format(strict_relations))
+                logger.debug('\t\t%s', strict_relations)
 
             if strict_relations:
                 for rel in strict_relations:
@@ -91,14 +101,142 @@ class KBEntityBasedRecommender(RelModule):
                     if rel not in strict_relations:
                         relation_scores[rel] += 1
 
-        print("\t\tRelation scores: {}".format(", ".join(
-            ["{} ({:.2f})".format(count[0], count[1]) for count in relation_scores.items()])).encode("UTF-8"))
+        logger.debug("\t\tRelation scores: %s", lazy_scores(relation_scores, None))
 
-        print("\t ------------ KB relations done ------------")
-        print("\n")
+        logger.debug("\t ------------ KB relations done ------------\n")
 
         return relation_scores
 
+    def get_relation_candidates_batch(self, triple_data_list, params_list=None):
+        self.prefetch_relations(triple_data_list)
+        return super().get_relation_candidates_batch(triple_data_list, params_list)
+
+    def prefetch_relations(self, triple_data_list):
+        """
+        Runs all the SPARQL queries needed for the triples that are not in the cache concurrently and stores their
+        results in the cache.
+        """
+        query_limits, subject_uris, object_uris = dict(), list(), list()
+        for triple_data in triple_data_list:
+            subj_uri, subj_type_uri = triple_data['subj_uri'], triple_data['subj_type_uri']
+            obj_uri, obj_type_uri = triple_data['obj_uri'], triple_data['obj_type_uri']
+            if not (subj_uri or obj_uri or subj_type_uri or obj_type_uri):
+                continue
+            # the same query string can be both an "all" and a "strict" query; the first one is run as it is done
+            # when the triples are processed one by one
+            all_query_string = KBEntityBasedRecommender.get_all_relations_query(subj=subj_uri, obj=obj_uri)
+            if all_query_string:
+                query_limits.setdefault(all_query_string, "")
+                if obj_uri:
+                    object_uris.append(obj_uri)
+                else:
+                    subject_uris.append(subj_uri)
+            strict_query_string, _ = KBEntityBasedRecommender.get_strict_relations_query(
+                subj=subj_uri, subj_type=subj_type_uri, obj=obj_uri, obj_type=obj_type_uri)
+            if strict_query_string:
+                query_limits.setdefault(strict_query_string, " LIMIT 200")
+
+        if self.values_batch_size > 0:
+            batch_queries = self.get_entity_batch_queries(subject_uris, object_uris)
+        else:
+            batch_queries = dict()
+        batched_query_strings = {query_string for entity_queries in batch_queries.values()
+                                 for query_string in entity_queries.values()}
+
+        missing_queries = {query_string: limit for query_string, limit in query_limits.items()
+                           if query_string not in batched_query_strings and self.sparql_cache.get(query_string) is None}
+        if not missing_queries and not batch_queries:
+            return
+
+        logger.info("\tRunning %s uncached SPARQL queries", len(missing_queries) + len(batch_queries))
+        results = self.sparql_client.query_all(list(batch_queries) +
+                                               [query_string + limit for query_string, limit in missing_queries.items()])
+
+        query_to_relations = dict()
+        failed_queries = dict()
+        for batch_query_string, entity_queries in batch_queries.items():
+            entity_relations = self.get_entity_batch_relations(batch_query_string, results[batch_query_string])
+            if entity_relations is None:
+                # falling back to one query per entity
+                failed_queries.update({query_string: "" for query_string in entity_queries.values()})
+                continue
+            for uri, query_string in entity_queries.items():
+                query_to_relations[query_string] = entity_relations.get(uri, list())
+        if failed_queries:
+            results.update(self.sparql_client.query_all(list(failed_queries)))
+            missing_queries.update(failed_queries)
+
+        for query_string, limit in missing_queries.items():
+            result = results[query_string + limit]
+            if isinstance(result, Exception):
+                logger.warning("WARNING - SPARQL - query failed\n\t%s\n\t%s", query_string, result)
+                continue
+            query_to_relations[query_string] = KBEntityBasedRecommender.get_result_relations(result)
+        self.sparql_cache.put_all(query_to_relations)
+
+    def prefetch_entity_relations(self, subject_uris=(), object_uris=()):
+        """
+        Fetches the relations of many subject and object entities with batched VALUES queries and stores them in the
+        cache under the query of each entity. Useful to pre-warm the cache for a whole evaluation set.
+        """
+        batch_queries = self.get_entity_batch_queries(subject_uris, object_uris)
+        if not batch_queries:
+            return
+
+        logger.info("\tRunning %s batched SPARQL queries", len(batch_queries))
+        results = self.sparql_client.query_all(list(batch_queries))
+        query_to_relations = dict()
+        for batch_query_string, entity_queries in batch_queries.items():
+            entity_relations = self.get_entity_batch_relations(batch_query_string, results[batch_query_string])
+            if entity_relations is None:
+                continue
+            for uri, query_string in entity_queries.items():
+                query_to_relations[query_string] = entity_relations.get(uri, list())
+        self.sparql_cache.put_all(query_to_relations)
+
+    def get_entity_batch_queries(self, subject_uris, object_uris):
+        """
+        Groups the entities that do not have their relations in the cache in VALUES queries.
+        :return: dict of batch query string -> dict of entity uri -> query string of the entity
+        """
+        batch_queries = dict()
+        batch_size = max(self.values_batch_size, 1)
+        for position, uris in [('subj', subject_uris), ('obj', object_uris)]:
+            entity_queries = dict()
+            for uri in uris:
+                if position == 'subj':
+                    query_string = KBEntityBasedRecommender.get_all_relations_query(subj=uri)
+                else:
+                    query_string = KBEntityBasedRecommender.get_all_relations_query(obj=uri)
+                if uri not in entity_queries and self.sparql_cache.get(query_string) is None:
+                    entity_queries[uri] = query_string
+            batch_uris = list(entity_queries.keys())
+            for start in range(0, len(batch_uris), batch_size):
+                chunk = batch_uris[start:start + batch_size]
+                batch_query_string = KBEntityBasedRecommender.get_values_relations_query(chunk, position)
+                batch_queries[batch_query_string] = {uri: entity_queries[uri] for uri in chunk}
+        return batch_queries
+
+    def get_entity_batch_relations(self, batch_query_string, result):
+        """
+        Splits the results of a VALUES query per entity.
+        :return: dict of entity uri -> list of relations, or None if the query failed or may have been truncated
+        """
+        if isinstance(result, Exception):
+            logger.warning("WARNING - SPARQL - batched query failed\n\t%s\n\t%s", batch_query_string, result)
+            return None
+        bindings = result["results"]["bindings"]
+        if len(bindings) >= self.sparql_max_rows:
+            logger.warning("WARNING - SPARQL - batched query reached %s rows and may be truncated",
+                           self.sparql_max_rows)
+            return None
+        entity_relations = dict()
+        for binding in bindings:
+            relations = entity_relations.get(binding['entity']['value'], list())
+            relations.append(KBEntityBasedRecommender.get_curie(binding['prop']['value']))
+            entity_relations[binding['entity']['value']] = relations
+        return entity_relations
+
     def get_all_relations(self, subj=None, obj=None):
 
         relations = list()
@@ -106,32 +244,15 @@ class KBEntityBasedRecommender(RelModule):
         if not subj and not obj:
             return list()
 
-        triple_pattern = ""
-        if subj and obj:
-            triple_pattern = " <{}> ?prop <{}> . ".format(subj, obj)
-        if subj:
-            triple_pattern = " <{}> ?prop ?object . ".format(subj)
-        if obj:
-            triple_pattern = " ?subject ?prop <{}> . ".format(obj)
-        query_string = "PREFIX dbo: <http://dbpedia.org/ontology/>  SELECT DISTINCT ?prop WHERE { " + triple_pattern + \
-                       " } "
+        query_string = KBEntityBasedRecommender.get_all_relations_query(subj=subj, obj=obj)
 
-        if query_string in self.sparql_cache:
-            relations += self.sparql_cache[query_string]
+        cached_relations = self.sparql_cache.get(query_string)
+        if cached_relations is not None:
+            relations += cached_relations
         else:
-            print("WARNING - SPARQL - Not found in cache\n\t{} ".format(query_string))
-            sparql = SPARQLWrapper(self.dbpedia_endpoint)
-            sparql.setQuery(query_string)
-            sparql.setReturnFormat(JSON)
-            results = sparql.query().convert()
-            for result in results["results"]["bindings"]:
-                rel_uri = KBEntityBasedRecommender.get_curie(result['prop']['value'])
-                if rel_uri.startswith("dbo:") or rel_uri.startswith("dbp:"):
-                    relations.append(rel_uri)
-
-            self.sparql_cache[query_string] = relations
-            with open(self.config["sparql_cache_path"], 'w') as f:
-                json.dump(self.sparql_cache, f)
+            logger.warning("WARNING - SPARQL - Not found in cache\n\t%s ", query_string)
+            relations += KBEntityBasedRecommender.get_result_relations(self.sparql_client.query(query_string))
+            self.sparql_cache.put(query_string, relations)
 
 
         # filtering ignored relations
@@ -141,6 +262,61 @@ class KBEntityBasedRecommender(RelModule):
     def get_strict_relations(self, subj=None, obj=None, subj_type=None, obj_type=None):
 
         relations = list()
+        query_string, weight = KBEntityBasedRecommender.get_strict_relations_query(subj=subj, obj=obj,
+                                                                                    subj_type=subj_type,
+                                                                                    obj_type=obj_type)
+
+        if not query_string:
+            return list(), 0
+
+        cached_relations = self.sparql_cache.get(query_string)
+        if cached_relations is not None:
+            relations += cached_relations
+        else:
+            logger.warning("WARNING - SPARQL - Not found in cache\n\t%s ", query_string)
+            relations += KBEntityBasedRecommender.get_result_relations(self.sparql_client.query(query_string +
+                                                                                                " LIMIT 200"))
+            self.sparql_cache.put(query_string, relations)
+
+        # filtering ignored relations
+        relations = [relation for relation in relations if relation not in KBEntityBasedRecommender.ignored_properties]
+        return relations, weight
+
+    @classmethod
+    def get_all_relations_query(cls, subj=None, obj=None):
+        if not subj and not obj:
+            return None
+
+        triple_pattern = ""
+        if subj and obj:
+            triple_pattern = " <{}> ?prop <{}> . ".format(subj, obj)
+        if subj:
+            triple_pattern = " <{}> ?prop ?object . ".format(subj)
+        if obj:
+            triple_pattern = " ?subject ?prop <{}> . ".format(obj)
+        return "PREFIX dbo: <http://dbpedia.org/ontology/>  SELECT DISTINCT ?prop WHERE { " + triple_pattern + " } "
+
+    @classmethod
+    def get_values_relations_query(cls, uris, position):
+        """
+        Query for the relations of several entities in the subject ('subj') or object ('obj') position. Only the dbo:
+        and dbp: relations that are not ignored are returned.
+        """
+        values = " ".join(["<{}>".format(uri) for uri in uris])
+        if position == 'subj':
+            triple_pattern = " ?entity ?prop ?object . "
+        else:
+            triple_pattern = " ?subject ?prop ?entity . "
+        ignored_iris = ", ".join(["<{}>".format(KBEntityBasedRecommender.get_iri(curie))
+                                  for curie in KBEntityBasedRecommender.ignored_properties])
+        return "PREFIX dbo: <http://dbpedia.org/ontology/>  SELECT ?entity ?prop WHERE { VALUES ?entity { " + values + \
+               " } " + triple_pattern + \
+               " FILTER (STRSTARTS(STR(?prop), \"http://dbpedia.org/ontology/\") || " \
+               "STRSTARTS(STR(?prop), \"http://dbpedia.org/property/\")) " + \
+               " FILTER (?prop NOT IN (" + ignored_iris + ")) } GROUP BY ?entity ?prop "
+
+    @classmethod
+    def get_strict_relations_query(cls, subj=None, obj=None, subj_type=None, obj_type=None):
         weight = 0
         triple_pattern = ""
         if subj and obj:
@@ -163,30 +339,19 @@ class KBEntityBasedRecommender(RelModule):
             triple_pattern += " ?subject ?prop ?object . ?subject a {} . ?object a {} . ".format(subj_type, obj_type)
 
         if "" == triple_pattern:
-            return list(), 0
-
-        query_string = "PREFIX dbo: <http://dbpedia.org/ontology/>  SELECT DISTINCT ?prop WHERE { " + triple_pattern + \
-                       " } "
+            return None, 0
 
-        if query_string in self.sparql_cache:
-            relations += self.sparql_cache[query_string]
-        else:
-            print("WARNINGG - SPARQL - Not found in cache\n\t{} ".format(query_string))
-            sparql = SPARQLWrapper(self.dbpedia_endpoint)
-            sparql.setQuery(query_string + " LIMIT 200")
-            sparql.setReturnFormat(JSON)
-            results = sparql.query().convert()
-            for result in results["results"]["bindings"]:
-                rel_uri = KBEntityBasedRecommender.get_curie(result['prop']['value'])
-                if rel_uri.startswith("dbo:") or rel_uri.startswith("dbp:"):
-                    relations.append(rel_uri)
-            self.sparql_cache[query_string] = relations
-            with open(self.config["sparql_cache_path"], 'w') as f:
-                json.dump(self.sparql_cache, f)
+        return "PREFIX dbo: <http://dbpedia.org/ontology/>  SELECT DISTINCT ?prop WHERE { " + triple_pattern + \
+               " } ", weight
 
-        # filtering ignored relations
-        relations = [relation for relation in relations if relation not in KBEntityBasedRecommender.ignored_properties]
-        return relations, weight
+    @classmethod
+    def get_result_relations(cls, results):
+        relations = list()
+        for result in results["results"]["bindings"]:
+            rel_uri = KBEntityBasedRecommender.get_curie(result['prop']['value'])
+            if rel_uri.startswith("dbo:") or rel_uri.startswith("dbp:"):
+                relations.append(rel_uri)
+        return relations
 
     @classmethod
     def get_curie(cls, iri):
@@ -194,5 +359,12 @@ class KBEntityBasedRecommender(RelModule):
             iri = iri.replace(ns, KBEntityBasedRecommender.prefix_map.get(ns))
         return iri
 
+    @classmethod
+    def get_iri(cls, curie):
+        for ns, prefix in KBEntityBasedRecommender.prefix_map.items():
+            if curie.startswith(prefix):
+                return ns + curie[len(prefix):]
+        return curie
+
 
 
@@ -1,4 +1,8 @@
+import hashlib
 import json
+import logging
+import os
+import numpy as np
 import torch
 from collections import Counter
 
@@ -7,10 +11,15 @@ from opennre.model.ranking_nn import RankingNN
 
 from relation_linking_core.rel_linker_modules.rel_linker_module import RelModule
 
+logger = logging.getLogger(__name__)
+
 
 class NeuralRelationLinking(RelModule):
 
     question_terms = ['what', 'when', 'which', 'who', 'how', 'list', 'give', 'show', 'do', 'does']
+    # part of the key of the saved relation embeddings, bumped when the way they are computed changes (version 1 was
+    # computed with dropout in training mode)
+    relation_embeddings_version = 2
 
     def __init__(self, config):
         self.config = config
@@ -18,11 +27,13 @@ class NeuralRelationLinking(RelModule):
         rel2id = json.load(open(rel_id_path))
         pretrain_path = self.config['neural_model']['pretrain_path']
         ckpt_path = self.config['neural_model']['ckpt_path']
+        self.batch_size = self.config['neural_model'].get('batch_size', 32)
+        self.top_k = self.config['neural_model'].get('top_k', 10)
 
         sentence_encoder = BERTEntityEncoder(max_length=80, pretrain_path=pretrain_path)
 
-        print("Loading neural model ...\n\trel2id path: {}\n\trels: {}\n\tpretrain_path: {}\n\tckpt: {}".
-              format(rel_id_path, len(rel2id), pretrain_path, ckpt_path))
+        logger.info("Loading neural model ...\n\trel2id path: %s\n\trels: %s\n\tpretrain_path: %s\n\tckpt: %s",
+                    rel_id_path, len(rel2id), pretrain_path, ckpt_path)
 
         self.neural_model = RankingNN(sentence_encoder, len(rel2id), rel2id)
 
@@ -32,14 +43,87 @@ class NeuralRelationLinking(RelModule):
         else:
             self.neural_model.load_state_dict(torch.load(ckpt_path, map_location='cpu')['state_dict'])
 
-        with torch.no_grad():
-            self.neural_model.r_hiddens = self.neural_model.forward_all_relations()
+        self.rel2id = rel2id
+        self.ckpt_path = ckpt_path
+        self.relation_embeddings_dir = self.config['neural_model'].get('relation_embeddings_dir',
+                                                                       os.path.dirname(ckpt_path))
+        self.relation_embeddings_chunk_size = self.config['neural_model'].get('relation_embeddings_chunk_size', 256)
+
+    def load_relation_embeddings(self):
+        """
+        Loads the relation embeddings (r_hiddens) saved next to the checkpoint, or computes and saves them if there is
+        no file for the current checkpoint, rel2id and tokenizer.
+        """
+        embeddings_path = self.get_relation_embeddings_path()
+        if os.path.exists(embeddings_path):
+            logger.info("Loading relation embeddings from %s", embeddings_path)
+            # copy-on-write memory map, the pages are shared between processes until they are written
+            r_hiddens = torch.from_numpy(np.load(embeddings_path, mmap_mode='c'))
+            if torch.cuda.is_available():
+                r_hiddens = r_hiddens.cuda()
+        else:
+            logger.info("Computing relation embeddings for %s relations ...", len(self.rel2id))
+            # dropout is disabled, as in infer_ranking_batch
+            self.neural_model.eval()
+            with torch.no_grad():
+                r_hiddens = self.neural_model.forward_all_relations(chunk_size=self.relation_embeddings_chunk_size)
+            try:
+                # writing to a temporary file first so that other processes never load a partial file
+                tmp_path = "{}.{}.tmp".format(embeddings_path, os.getpid())
+                with open(tmp_path, 'wb') as f:
+                    np.save(f, r_hiddens.cpu().numpy().astype(np.float32))
+                os.replace(tmp_path, embeddings_path)
+                logger.info("\tsaved to %s", embeddings_path)
+            except OSError as ex:
+                logger.warning("WARNING: relation embeddings could not be saved to %s\n\t%s", embeddings_path, ex)
+        self.neural_model.r_hiddens = r_hiddens
+
+    def get_relation_embeddings_path(self):
+        key = hashlib.sha256()
+        with open(self.ckpt_path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                key.update(block)
+        key.update(json.dumps(self.rel2id, sort_keys=True).encode('utf-8'))
+        tokenizer = self.neural_model.sentence_encoder.tokenizer
+        key.update(json.dumps(sorted(tokenizer.vocab.items())).encode('utf-8'))
+        key.update(str(NeuralRelationLinking.relation_embeddings_version).encode('utf-8'))
+        return os.path.join(self.relation_embeddings_dir, "{}.r_hiddens.{}.npy".format(
+            os.path.basename(self.ckpt_path), key.hexdigest()[:16]))
 
     def get_relation_candidates(self, triple_data, params=None):
+        return self.get_relation_candidates_batch([triple_data], [params])[0]
+
+    def get_relation_candidates_batch(self, triple_data_list, params_list=None):
+        if params_list is None:
+            params_list = [None] * len(triple_data_list)
+
+        relation_scores_list = [Counter() for _ in triple_data_list]
+
+        inputs, input_indices = list(), list()
+        for index, (triple_data, params) in enumerate(zip(triple_data_list, params_list)):
+            input = self.get_opennre_input(triple_data, params)
+            if input:
+                inputs.append(input)
+                input_indices.append(index)
+
+        if not inputs:
+            return relation_scores_list
 
-        relation_scores = Counter()
+        if self.neural_model.r_hiddens is None:
+            self.load_relation_embeddings()
 
-        normalized_to_surface_form = params['normalized_to_surface_form']
+        openre_responses = self.neural_model.infer_ranking_batch(inputs, k=self.top_k, batch_size=self.batch_size)
+        for index, openre_response in zip(input_indices, openre_responses):
+            opennre_relations = [(rel[0], rel[1]) for rel in openre_response]
+            for rel in opennre_relations:
+                relation_scores_list[index][rel[0]] += rel[1]
+            logger.debug("\topennre relations: %s", opennre_relations)
+
+        return relation_scores_list
+
+    def get_opennre_input(self, triple_data, params):
+
+        normalized_to_surface_form = params.get('normalized_to_surface_form', dict()) if params else dict()
         subj_text, subj_type = triple_data['subj_text'], triple_data['subj_type']
         obj_text, obj_type = triple_data['obj_text'], triple_data['obj_type']
 
@@ -53,19 +137,13 @@ class NeuralRelationLinking(RelModule):
         else:
             amr_unkown = None
 
-        print("OpenNRE:\n\thead: {}\n\ttail: {}\n\tamr-unknown: {}".format(head, tail, amr_unkown))
+        logger.debug("OpenNRE:\n\thead: %s\n\ttail: %s\n\tamr-unknown: %s", head, tail, amr_unkown)
         input = NeuralRelationLinking.prepare_opennre_input(triple_data['text'], head, tail, normalized_to_surface_form,
                                                   amr_unkown)
-        if input:
-            openre_response = self.neural_model.infer_ranking(input)
-            opennre_relations = [(rel[0], rel[1]) for rel in openre_response[:10]]
-            for rel in opennre_relations:
-                relation_scores[rel[0]] += rel[1]
-            print("\topennre relations: {}".format(opennre_relations))
-        else:
-            print("\topennre input error:\n\tsent: {}\n\th: {} \t: {}".format(triple_data['text'], head, tail))
+        if not input:
+            logger.debug("\topennre input error:\n\tsent: %s\n\th: %s \t: %s", triple_data['text'], head, tail)
 
-        return relation_scores
+        return input
 
     @classmethod
     def prepare_opennre_input(cls, sentence, head, tail, normalized_to_surface_form, amr_unkown):
@@ -1,38 +1,83 @@
 from collections import Counter
+import logging
 from gensim.parsing.preprocessing import remove_stopwords
 import nltk
 import numpy as np
-import scipy
 import re
 import pickle
 
 from nltk.tokenize import RegexpTokenizer, WordPunctTokenizer
 from fuzzywuzzy import fuzz
+from fuzzywuzzy.utils import full_process
 
+from relation_linking_core.logging_utils import lazy_scores
+from relation_linking_core.rel_linker_modules.embedding_store import EmbeddingStore
 from relation_linking_core.rel_linker_modules.rel_linker_module import RelModule
 
+logger = logging.getLogger(__name__)
+
 
 class QuestionSimilarityBasedRelRecommender(RelModule):
 
     def __init__(self, config=None):
 
-        print("Initializing Question Similarity Based Rel Recommender ....")
+        logger.info("Initializing Question Similarity Based Rel Recommender ....")
 
-        self.prop_map = QuestionSimilarityBasedRelRecommender.readPropertyMap("/Users/nandana.sampath.mihindukulasooriya@ibm.com/data/rel_ranking/similarity/all_relationship_labels_lemma.tsv")
-        with open('/Users/nandana.sampath.mihindukulasooriya@ibm.com/Src/relation-linking/data/glove/glove_vocab.pkl', 'rb') as filein:
-            embedding_dict = pickle.load(filein)
+        self.prop_map = QuestionSimilarityBasedRelRecommender.readPropertyMap(config['predicate_map'])
+        if 'embedding_store_path' in config:
+            # memory-mapped embeddings created with embedding_store.py
+            embeddings = EmbeddingStore.load(config['embedding_store_path'])
+        else:
+            with open(config['glove_vocab'], 'rb') as filein:
+                embeddings = pickle.load(filein)
 
         self.fuzzywuzzysimExtractor = FuzzyWuzzySimilarityCalc(self.prop_map)
-        self.similarityExtractor = SimilarityCalc(self.prop_map, embedding_dict)
+        self.similarityExtractor = SimilarityCalc(self.prop_map, embeddings)
 
-        print("\tInitialized ...")
+        logger.info("\tInitialized ...")
 
     def get_relation_candidates(self, triple_data, params=None):
-        relation_scores = Counter()
-
-        print("\n\t ------------ Checking word_embedding similarities:  ------------ ")
+        return self.get_relation_candidates_batch([triple_data], [params])[0]
+
+    def get_relation_candidates_batch(self, triple_data_list, params_list=None):
+        """
+        The scores only depend on the question context (the question without the linked entities) and the candidate
+        relations, so the triples with the same context, such as the direct and inverse triples of a triple, are scored
+        together: the context is processed once and each of their candidate relations is scored once.
+        """
+        logger.debug("\n\t ------------ Checking word_embedding similarities:  ------------ ")
+        if params_list is None:
+            params_list = [None] * len(triple_data_list)
+
+        # question context -> indices of its triples
+        context_triples = dict()
+        for index, triple_data in enumerate(triple_data_list):
+            context_triples.setdefault(QuestionSimilarityBasedRelRecommender.get_question_context(triple_data),
+                                       list()).append(index)
+
+        relation_scores_list = [None] * len(triple_data_list)
+        for word_embd_sim_q, indices in context_triples.items():
+            # a triple without params has no candidate relations
+            relation_lists = {index: list(params_list[index]["listOfRelations"]) if params_list[index] else list()
+                              for index in indices}
+            all_relations = list(dict.fromkeys([rel for index in indices for rel in relation_lists[index]]))
+            similarity_scores = dict(zip(all_relations,
+                                         self.similarityExtractor.similarities(word_embd_sim_q, all_relations)))
+            exact_match_scores = dict(self.fuzzywuzzysimExtractor.extract(word_embd_sim_q, all_relations))
+
+            for index in indices:
+                relation_scores_list[index] = QuestionSimilarityBasedRelRecommender.combine_scores(
+                    relation_lists[index], similarity_scores, exact_match_scores)
+                logger.debug("\t\tQuestion text: %s", triple_data_list[index]['text'])
+                logger.debug("\t\tQuestion word embedding scores with question text: %s\n",
+                             lazy_scores(relation_scores_list[index]))
+
+        logger.debug("\n\t ------------ Checking word embedding similarities done  ------------ ")
+
+        return relation_scores_list
 
-        listOfRelations = params["listOfRelations"]
+    @classmethod
+    def get_question_context(cls, triple_data):
         subj_text, subj_uri = triple_data['subj_text'], triple_data['subj_uri']
         obj_text, obj_uri = triple_data['obj_text'], triple_data['obj_uri']
         question = triple_data['text']
@@ -40,72 +85,81 @@ class QuestionSimilarityBasedRelRecommender(RelModule):
         word_embd_sim_q = remove_stopwords(str(question).lower()).replace('?', '')
 
         if subj_uri:
-            print(f'\t\tsubj_uri exists, replace {subj_text.lower()} in question')
+            logger.debug('\t\tsubj_uri exists, replace %s in question', subj_text.lower())
             word_embd_sim_q = word_embd_sim_q.replace(subj_text.lower(), '')
         if obj_uri:
-            print(f'\t\tobj_uri exists, replace {obj_text.lower()} in question')
+            logger.debug('\t\tobj_uri exists, replace %s in question', obj_text.lower())
             word_embd_sim_q = word_embd_sim_q.replace(obj_text.lower(), '')
+        return word_embd_sim_q
 
-        reranked_relations = self.similarityExtractor.extract(word_embd_sim_q, listOfRelations)
-        exact_match_reranked_relations = self.fuzzywuzzysimExtractor.extract(word_embd_sim_q, listOfRelations)
-
-        rel_scores_combined = Counter()
-        for (rel, score) in reranked_relations:
-            rel_scores_combined[rel] = score
-        for (rel, score) in exact_match_reranked_relations:
-            if rel in rel_scores_combined:
-                rel_scores_combined[rel] += score
-            else:
-                rel_scores_combined[rel] = score
-        reranked_relations = [(key, value) for key, value in rel_scores_combined.items()]
-
-        for (rel, score) in reranked_relations:
-            relation_scores[rel] = score
-
-        print("\t\tQuestion text: {}".format(question))
-        print("\t\tQuestion word embedding scores with question text: {}\n".format(", ".join(
-            ["{} ({:.2f})".format(rel, score) for (rel, score) in relation_scores.most_common(10)])))
-
-        print("\n\t ------------ Checking word embedding similarities done  ------------ ")
-
-        return relation_scores
+    @classmethod
+    def combine_scores(cls, relations, similarity_scores, exact_match_scores):
+        """
+        Sums the embedding similarity and exact match scores of the relations.
+        :return: Counter of relation scores, ordered by similarity score as SimilarityCalc.extract (the exact match
+        scores are added to relations that are all already in the Counter, so their order does not matter)
+        """
+        ranked_relations = sorted(relations, key=similarity_scores.__getitem__, reverse=True)
+        return Counter({rel: similarity_scores[rel] + exact_match_scores[rel] for rel in ranked_relations})
 
     @classmethod
     def readPropertyMap(cls, fname):
-        with open(fname, "r") as filein:
-            prop_map = {}
-            for line in filein:
-                prop, label = [x.strip() for x in line.split("\t")]
-                if 'dbpedia.org' in prop:
-                    prop = prop.replace('http://dbpedia.org/ontology/', 'dbo:').replace('http://dbpedia.org/property/',
-                                                                                        'dbp:')
-                    if prop not in prop_map:
-                        prop_map[prop] = label
-        print("Total number of unique properties {}".format(len(prop_map)))
-        return prop_map
+        return RelModule.read_property_map(fname)
 
 
 class FuzzyWuzzySimilarityCalc:
+    """
+    Scores a relation with the number of tokens in its label when the label matches a question n-gram exactly, i.e.,
+    with a fuzzywuzzy token sort ratio of 100. The normalized, token-sorted labels are indexed once, grouped by their
+    token count, so scoring only has to look up the normalized n-grams of the question.
+    """
+
+    # unequal strings this long can get a (rounded) ratio of 100, so these labels are still scored with fuzzywuzzy
+    max_indexed_length = 100
+
     def __init__(self, prop_map):
         self.prop_map = prop_map
+        self.tokenizer = WordPunctTokenizer()
+        # relation -> number of tokens in the label
+        self.relation_sizes = dict()
+        # number of tokens -> normalized label -> relations
+        self.label_index = dict()
+        self.unindexed_relations = set()
+        for relation, label in prop_map.items():
+            relation_label = FuzzyWuzzySimilarityCalc.remove_text_in_brackets(label)
+            rel_tokens_size = len(self.tokenizer.tokenize(relation_label.lower()))
+            self.relation_sizes[relation] = rel_tokens_size
+            normalized_label = FuzzyWuzzySimilarityCalc.normalize(relation_label)
+            if len(normalized_label) >= FuzzyWuzzySimilarityCalc.max_indexed_length:
+                self.unindexed_relations.add(relation)
+            else:
+                self.label_index.setdefault(rel_tokens_size, dict()).setdefault(normalized_label, set()).add(relation)
 
-    def similarity(self, context, relation):
-        try:
-            relation_label = self.prop_map[relation]
-            txt_in_brackets = re.findall(r'\(.*\)', relation_label)
-            for txt in txt_in_brackets:
-                relation_label = relation_label.replace(txt, '').strip()
-        except:
-            return 0.0
-        tokenizer = WordPunctTokenizer()
-        rel_tokens_size = len(tokenizer.tokenize(relation_label.lower()))
-        context_tokens = tokenizer.tokenize(context.lower())
+    @classmethod
+    def remove_text_in_brackets(cls, relation_label):
+        txt_in_brackets = re.findall(r'\(.*\)', relation_label)
+        for txt in txt_in_brackets:
+            relation_label = relation_label.replace(txt, '').strip()
+        return relation_label
+
+    @classmethod
+    def normalize(cls, text):
+        """ the processing done by fuzz.token_sort_ratio before comparing the strings """
+        return " ".join(sorted(full_process(text, force_ascii=True).split()))
+
+    def get_context_ngrams(self, context_tokens, rel_tokens_size):
         if rel_tokens_size > 1:
-            context_ngram_tokens = [context_tokens[i:i + rel_tokens_size] for i in
-                                    range(len(context_tokens) - rel_tokens_size + 1)]
-            context_tokens = context_ngram_tokens
+            # n-grams are compared as lists, which fuzzywuzzy converts with str()
+            return [str(context_tokens[i:i + rel_tokens_size]) for i in
+                    range(len(context_tokens) - rel_tokens_size + 1)]
+        return context_tokens
+
+    def fuzzy_similarity(self, context, relation):
+        relation_label = FuzzyWuzzySimilarityCalc.remove_text_in_brackets(self.prop_map[relation])
+        rel_tokens_size = self.relation_sizes[relation]
+        context_tokens = self.tokenizer.tokenize(context.lower())
         max_similarity = 0
-        for c_token in context_tokens:
+        for c_token in self.get_context_ngrams(context_tokens, rel_tokens_size):
             sim = fuzz.token_sort_ratio(relation_label, c_token)
             if sim > max_similarity:
                 max_similarity = sim
@@ -113,97 +167,144 @@ class FuzzyWuzzySimilarityCalc:
             return max_similarity * rel_tokens_size / 100
         return 0
 
+    def get_matched_relations(self, context, rel_tokens_sizes):
+        context_tokens = self.tokenizer.tokenize(context.lower())
+        matched_relations = set()
+        for rel_tokens_size in rel_tokens_sizes:
+            size_index = self.label_index.get(rel_tokens_size)
+            if not size_index:
+                continue
+            for ngram in set(self.get_context_ngrams(context_tokens, rel_tokens_size)):
+                matched_relations.update(size_index.get(FuzzyWuzzySimilarityCalc.normalize(ngram), ()))
+        return matched_relations
+
+    def similarity(self, context, relation):
+        return self.extract(context, [relation])[0][1]
+
     def extract(self, context, relationList):
+        relations = list(relationList)
+        rel_tokens_sizes = {self.relation_sizes[rel] for rel in relations if rel in self.relation_sizes}
+        matched_relations = self.get_matched_relations(context, rel_tokens_sizes)
         res = []
-        for rel in relationList:
-            score = self.similarity(context, rel)
+        for rel in relations:
+            if rel not in self.relation_sizes:
+                score = 0.0
+            elif rel in self.unindexed_relations:
+                score = self.fuzzy_similarity(context, rel)
+            elif rel in matched_relations:
+                score = 100 * self.relation_sizes[rel] / 100
+            else:
+                score = 0
             res.append((rel, score))
         res.sort(key=lambda x: x[1], reverse=True)
         return res
 
 
 class SimilarityCalc:
+    """
+    Scores relations by the similarity of their label tokens with the question tokens. Each relation token is scored
+    with its most similar question token and the relation score is the mean of its token scores. All candidate
+    relations are scored together, each distinct relation token once.
+    """
     def __init__(self, prop_map, embedding_dict=None, similarity_fn='cosine'):
-
-        self.embeddings = embedding_dict
+        """
+        :param prop_map: dict of relation -> label
+        :param embedding_dict: dict of word -> vector or an EmbeddingStore
+        :param similarity_fn: 'cosine' or 'dot'
+        """
+        if similarity_fn not in ['cosine', 'dot']:
+            raise NotImplementedError('"{}" not implemented'.format(similarity_fn))
         # self.vocab = set(nltk.corpus.words.words())
         self.prop_map = prop_map
-        self.local_aggregation_fn = max
-        self.global_aggregation_fn = lambda x: sum(x) / len(x)
-        if similarity_fn == 'cosine':
-            self.token_similarity_fn = lambda x, y: (1.0 - scipy.spatial.distance.cosine(x, y))
-        elif similarity_fn == 'dot':
-            self.token_similarity_fn = np.dot
-        else:
-            raise NotImplementedError('"{}" not implemented'.format(similarity_fn))
         self.stopwords = set(nltk.corpus.stopwords.words('english'))
+        self.tokenizer = RegexpTokenizer(r'\w+')
+        self.normalized = similarity_fn == 'cosine'
+        if isinstance(embedding_dict, EmbeddingStore):
+            self.embeddings = embedding_dict
+        else:
+            self.embeddings = EmbeddingStore.from_dict(embedding_dict if embedding_dict else dict())
+
+        relation_tokens = [SimilarityCalc.get_relation_tokens(label) for label in prop_map.values()]
+        all_token_ids = self.embeddings.get_ids([token for tokens in relation_tokens for token in tokens])
+        split_points = np.cumsum([len(tokens) for tokens in relation_tokens])[:-1]
+        self.relation_token_ids = dict(zip(prop_map.keys(), np.split(all_token_ids, split_points)))
+
+    @classmethod
+    def get_relation_tokens(cls, relation_label):
+        txt_in_brackets = re.findall(r'\(.*\)', relation_label)
+        for txt in txt_in_brackets:
+            relation_label = relation_label.replace(txt, '').strip()
+        return relation_label.split()
+
+    def get_vectors(self, token_ids):
+        vectors = self.embeddings.vectors[token_ids].astype(np.float64)
+        if self.normalized:
+            norms = self.embeddings.norms[token_ids].astype(np.float64)[:, None]
+            # zero vectors are not similar to anything
+            vectors = np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0)
+        return vectors
 
     def token_similarity(self, x, y):
-        try:
-            score = self.token_similarity_fn(self.embeddings[x], self.embeddings[y])
-        except Exception as E:
-            #             print('Exception in token_similarity', E)
-            score = 0.0
-        return score
+        x_id, y_id = self.embeddings.get_ids([x, y])
+        if x_id < 0 or y_id < 0:
+            return 0.0
+        if self.normalized and x == y:
+            return 1.0
+        score = float(np.dot(*self.get_vectors(np.array([x_id, y_id]))))
+        return min(max(score, -1.0), 1.0) if self.normalized else score
 
     def similarity(self, context, relation):
-        tokenizer = RegexpTokenizer(r'\w+')
-        context_words = tokenizer.tokenize(context)
-        contextTokens = [x for x in context_words if x.lower() not in self.stopwords]
-        # contextTokens = [x for x in context.split() if x.lower() not in self.stopwords]
-        try:
-            relationString = self.prop_map[relation]
-            txt_in_brackets = re.findall(r'\(.*\)', relationString)
-            for txt in txt_in_brackets:
-                relationString = relationString.replace(txt, '').strip()
-        except:
-            return 0.0
-        relationTokens = [x for x in relationString.split()]
-
-        global_similarities = []
-        for relToken in relationTokens:
-            local_similarities = []
-            # if relToken not in self.vocab:
-            #     continue
-            for contextToken in contextTokens:
-                local_similarities.append(self.token_similarity(relToken, contextToken))
-            try:
-                global_similarities.append(self.local_aggregation_fn(local_similarities))
-            except Exception as E:
-                #                 print('Exception in local aggregation', E)
-                global_similarities.append(0.0)
-        try:
-            result = self.global_aggregation_fn(global_similarities)
-        except Exception as E:
-            #             print('Exception in global aggregation', E)
-            result = 0.0
-        return result
-
-    # def fuzzy_wuzzy_similarity(self, context, relation):
-    #     if relation in self.prop_map:
-    #         relation_label = self.prop_map[relation]
-    #     else:
-    #         return 0
-    #     rel_tokens_size = len(nltk.WordPunctTokenizer.tokenize(relation_label))
-    #     context_tokens = ngrams(nltk.WordPunctTokenizer.tokenize(context), rel_tokens_size)
-    #     max_similarity = 0
-    #     for c_token in context_tokens:
-    #         sim = fuzz.token_sort_ratio(relation_label, context_tokens)
-    #         if sim > max_similarity:
-    #             max_similarity = sim
-    #     if max_similarity == 100:
-    #         return max_similarity * rel_tokens_size
-    #     return 0
+        return self.similarities(context, [relation])[0]
+
+    def similarities(self, context, relations):
+        """
+        Scores all the relations against the context.
+        :return: list of scores in the order of relations
+        """
+        context_words = self.tokenizer.tokenize(context)
+        context_ids = self.embeddings.get_ids([x for x in context_words if x.lower() not in self.stopwords])
+        known_context_ids = context_ids[context_ids >= 0]
+        # tokens without an embedding have a similarity of 0 with every other token
+        has_unknown_context = len(known_context_ids) < len(context_ids)
+
+        token_ids, segment_ids = list(), list()
+        for index, relation in enumerate(relations):
+            # relations without a label get a score of 0
+            relation_ids = self.relation_token_ids.get(relation)
+            if relation_ids is not None:
+                token_ids.append(relation_ids)
+                segment_ids.append(np.full(len(relation_ids), index, dtype=np.int64))
+        if not token_ids or len(context_ids) == 0:
+            return [0.0] * len(relations)
+        token_ids, segment_ids = np.concatenate(token_ids), np.concatenate(segment_ids)
+
+        # best similarity of each relation token with the context tokens
+        local_similarities = np.zeros(len(token_ids))
+        known_tokens = token_ids >= 0
+        if len(known_context_ids) > 0 and known_tokens.any():
+            # each distinct token is scored once, so that relations with the same label tokens get the same score
+            unique_token_ids, token_positions = np.unique(token_ids[known_tokens], return_inverse=True)
+            # einsum sums each dot product on its own, unlike a BLAS matrix product whose rounding depends on the
+            # position of the row, so a score does not depend on the other relations scored with it
+            similarities = np.einsum('ik,jk->ij', self.get_vectors(unique_token_ids),
+                                     self.get_vectors(known_context_ids))
+            if self.normalized:
+                # keeping exact matches at exactly 1.0 so that they tie as they do without rounding errors
+                similarities = np.clip(similarities, -1.0, 1.0)
+                similarities[unique_token_ids[:, None] == known_context_ids[None, :]] = 1.0
+            max_similarities = similarities.max(axis=1)
+            if has_unknown_context:
+                max_similarities = np.maximum(max_similarities, 0.0)
+            local_similarities[known_tokens] = max_similarities[token_positions]
+
+        # mean of the token similarities of each relation
+        sums = np.bincount(segment_ids, weights=local_similarities, minlength=len(relations))
+        counts = np.bincount(segment_ids, minlength=len(relations))
+        scores = np.divide(sums, counts, out=np.zeros(len(relations)), where=counts > 0)
+        return scores.tolist()
 
     def extract(self, context, relationList):
-        res = []
-        for rel in relationList:
-            score = self.similarity(context, rel)
-            res.append((rel, score))
+        relations = list(relationList)
+        res = list(zip(relations, self.similarities(context, relations)))
         res.sort(key=lambda x: x[1], reverse=True)
         return res
-
-
-
-
-
@@ -1,3 +1,8 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+
 # Interface which relation linking candidates with scores
 class RelModule:
     """
@@ -13,4 +18,35 @@ class RelModule:
         :param params
         :return: Counter a counter where the key is the candidate relation and count is the score
         """
-        raise NotImplementedError('Please implement REL function')
\ No newline at end of file
+        raise NotImplementedError('Please implement REL function')
+
+    def get_relation_candidates_batch(self, triple_data_list, params_list=None):
+        """
+        Takes in a list of triples and returns a list of candidate relation Counters, one per triple. Modules that can
+        process several triples at once (e.g., neural models) should override this.
+        :param triple_data_list
+        :param params_list a list of params, one per triple
+        :return: list of Counters
+        """
+        if params_list is None:
+            params_list = [None] * len(triple_data_list)
+        return [self.get_relation_candidates(triple_data, params) for triple_data, params in
+                zip(triple_data_list, params_list)]
+
+    @classmethod
+    def read_property_map(cls, fname):
+        """
+        :param fname: TSV file of property URIs and labels (predicate_map)
+        :return: dict of the DBpedia properties (as dbo: and dbp: prefixed names) -> label
+        """
+        with open(fname, "r") as filein:
+            prop_map = {}
+            for line in filein:
+                prop, label = [x.strip() for x in line.split("\t")]
+                if 'dbpedia.org' in prop:
+                    prop = prop.replace('http://dbpedia.org/ontology/', 'dbo:').replace('http://dbpedia.org/property/',
+                                                                                        'dbp:')
+                    if prop not in prop_map:
+                        prop_map[prop] = label
+        logger.info("Total number of unique properties %s", len(prop_map))
+        return prop_map
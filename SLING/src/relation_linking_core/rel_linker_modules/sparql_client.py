@@ -0,0 +1,57 @@
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class SparqlClient:
+    """
+    Runs SPARQL SELECT queries over a pool of keep-alive HTTP connections. Several queries can be sent at once, with a
+    bounded number of requests in flight and a timeout for each query.
+    """
+
+    # longer queries are sent in a POST body to stay below URL length limits of the endpoints
+    max_get_query_length = 2000
+
+    def __init__(self, endpoint, max_concurrency=8, timeout=30):
+        self.endpoint = endpoint
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_concurrency)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrency)
+
+    def query(self, query_string):
+        """
+        Runs a single query
+        :param query_string:
+        :return: the JSON results of the query
+        """
+        headers = {'Accept': 'application/sparql-results+json'}
+        if len(query_string) > SparqlClient.max_get_query_length:
+            response = self.session.post(self.endpoint, data={'query': query_string}, headers=headers,
+                                         timeout=self.timeout)
+        else:
+            response = self.session.get(self.endpoint, params={'query': query_string}, headers=headers,
+                                        timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def query_all(self, query_strings):
+        """
+        Runs the queries concurrently
+        :param query_strings:
+        :return: dict of query string -> JSON results, or the exception raised if the query failed or timed out
+        """
+        futures = {query_string: self.executor.submit(self.query, query_string) for query_string in set(query_strings)}
+        results = dict()
+        for query_string, future in futures.items():
+            try:
+                results[query_string] = future.result()
+            except Exception as ex:
+                results[query_string] = ex
+        return results
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+        self.session.close()
@@ -1,23 +1,34 @@
+import logging
 import pickle
 from collections import Counter
+from relation_linking_core.resource_store import ResourceStore
+from relation_linking_core.logging_utils import lazy_scores
 from relation_linking_core.rel_linker_modules.rel_linker_module import RelModule
 
+logger = logging.getLogger(__name__)
+
 
 class StatisticalRelationMapping(RelModule):
 
     def __init__(self, config=None):
 
-        print("Initializing Statistical Relation Mapping ....")
+        logger.info("Initializing Statistical Relation Mapping ....")
 
-        with open('../data/probbank-dbpedia.pkl', 'rb') as f:
-            db = pickle.load(f)
+        config = config if config else dict()
+        # a .pkl file or the prefix of the resource stores converted from its tables
+        path = config.get('statistical_mappings_path', '../data/probbank-dbpedia.pkl')
+        if path.endswith('.pkl'):
+            with open(path, 'rb') as f:
+                db = pickle.load(f)
+        else:
+            db = {table: ResourceStore.load_resource(path, table)
+                  for table in ['relation_scores', 'rel_arg_scores', 'binary_relation_scores']}
         self.relation_scores = db['relation_scores']
         self.rel_arg_scores = db['rel_arg_scores']
         self.binary_relation_scores = db['binary_relation_scores']
-        print("Statistical Mappings: {} rel arg, {} binary, {} predicates".format(len(self.rel_arg_scores),
-                                                                                  len(self.binary_relation_scores),
-                                                                                  len(self.relation_scores)))
-        print("\tStatistical Relation Mapping Initialized.")
+        logger.info("Statistical Mappings: %s rel arg, %s binary, %s predicates", len(self.rel_arg_scores),
+                    len(self.binary_relation_scores), len(self.relation_scores))
+        logger.info("\tStatistical Relation Mapping Initialized.")
 
     def get_relation_candidates(self, triple_data, params=None):
 
@@ -25,7 +36,7 @@ class StatisticalRelationMapping(RelModule):
         rel_list = list()
         reified_to_rel = params['reified_to_rel']
 
-        print("\n\t ------------ AMR statistical mapping ------------")
+        logger.debug("\n\t ------------ AMR statistical mapping ------------")
 
         rel_split = triple_data['rel_split']
         rel_args_predicate = '.'.join(rel_split)
@@ -65,9 +76,8 @@ class StatisticalRelationMapping(RelModule):
         for rel in rel_list:
             relation_scores[rel['rel']] += float(rel['score'])
 
-        print("\n\t\tStatistical relation scores: {}".format(", ".join(
-            ["{} ({:.2f})".format(count[0], count[1]) for count in relation_scores.most_common(10)])))
+        logger.debug("\n\t\tStatistical relation scores: %s", lazy_scores(relation_scores))
 
-        print("\t ------------ AMR statistical mapping done ------------\n")
+        logger.debug("\t ------------ AMR statistical mapping done ------------\n")
 
         return relation_scores
\ No newline at end of file
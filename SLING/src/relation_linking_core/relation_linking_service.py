@@ -1,203 +1,442 @@
+import importlib
+import logging
+import os
+import time
 from collections import Counter
-import traceback
 
 from relation_linking_core.metadata_generator.amr_utils import AMRUtils
 from relation_linking_core.metadata_generator.amr_graph_to_triples import AMR2Triples
-from relation_linking_core.rel_linker_modules.kg_entity_based_recommender import KBEntityBasedRecommender
-from relation_linking_core.rel_linker_modules.statistical_mappings import StatisticalRelationMapping
-from relation_linking_core.rel_linker_modules.neural_relation_linking import NeuralRelationLinking
-from relation_linking_core.rel_linker_modules.question_similarity_based_relations import QuestionSimilarityBasedRelRecommender
+from relation_linking_core.metadata_generator.amr_cache import AMRCache
+from relation_linking_core.rel_linker_modules.rel_linker_module import RelModule
 from relation_linking_core.metadata_generator.entity_utils import EntityUtils
 from relation_linking_core.metadata_generator.answer_type_prediction import AnswerTypePredictionService
-from relation_linking_core.metadata_generator.contextual_relations import ContextualRelationsModule
 from relation_linking_core.candidate_aggregators.simple_aggregator import SimpleAggregator
 from relation_linking_core.triple_scorers.simple_triple_scorer import SimpleTripleScorer
+from relation_linking_core.tracing import Tracer
+from relation_linking_core.stage_scheduler import Stage, StageScheduler
+from relation_linking_core.score_capture import ScoreCapture
+from relation_linking_core.logging_utils import lazy_scores
+
+logger = logging.getLogger(__name__)
 
 
 class KBQARelationLinkingService:
 
+    # scores of each module in module_weights -> (python module, class), only imported if the module is enabled
+    relation_linking_modules = {
+        'kg_entity_recommender_scores': ('relation_linking_core.rel_linker_modules.kg_entity_based_recommender',
+                                         'KBEntityBasedRecommender'),
+        'contextual_rel_recommender_scores': ('relation_linking_core.metadata_generator.contextual_relations',
+                                              'ContextualRelationsModule'),
+        'statistical_rel_mapping_scores': ('relation_linking_core.rel_linker_modules.statistical_mappings',
+                                           'StatisticalRelationMapping'),
+        'neural_model_scores': ('relation_linking_core.rel_linker_modules.neural_relation_linking',
+                                'NeuralRelationLinking'),
+        'similarity_based_scores': ('relation_linking_core.rel_linker_modules.question_similarity_based_relations',
+                                    'QuestionSimilarityBasedRelRecommender')
+    }
+
     def __init__(self, config):
-        self.kb_entity_based_linking = KBEntityBasedRecommender(config)
-        self.statistical_mapping_module = StatisticalRelationMapping(config)
-        self.neural_relation_linking = NeuralRelationLinking(config)
-        self.similarity_based_relation_linking = QuestionSimilarityBasedRelRecommender(config)
-        self.contextual_relations_module = ContextualRelationsModule(config)
+        # "entity_annotation_path" aligns the manually annotated entities of the questions (e.g., of LC-QuAD) instead of
+        # the entities of the EAMR, a missing file is reported before the modules are loaded
+        self.entity_annotation_path = config.get('entity_annotation_path')
+        if self.entity_annotation_path and not os.path.exists(self.entity_annotation_path):
+            raise ValueError('entity_annotation_path {} does not exist'.format(self.entity_annotation_path))
+
+        # seconds spent loading each module (including its imports)
+        self.load_times = dict()
+        self.enabled_modules = KBQARelationLinkingService.get_enabled_modules(config)
+        self.kb_entity_based_linking = self.load_module('kg_entity_recommender_scores', config)
+        self.statistical_mapping_module = self.load_module('statistical_rel_mapping_scores', config)
+        self.neural_relation_linking = self.load_module('neural_model_scores', config)
+        self.similarity_based_relation_linking = self.load_module('similarity_based_scores', config)
+        self.contextual_relations_module = self.load_module('contextual_rel_recommender_scores', config)
         self.answer_type_prediction_module = AnswerTypePredictionService(config)
 
-        self.aggregator = SimpleAggregator(config)
+        # the labels of the DBpedia properties, also needed without the similarity module for the final relation list
+        if self.similarity_based_relation_linking is not None:
+            self.prop_map = self.similarity_based_relation_linking.prop_map
+        else:
+            self.prop_map = RelModule.read_property_map(config['predicate_map'])
+
+        # "aggregator": "dense" aggregates with NumPy arrays, with the same results
+        if config.get('aggregator', 'simple') == 'dense':
+            from relation_linking_core.candidate_aggregators.dense_aggregator import DenseAggregator
+            self.aggregator = DenseAggregator(config)
+        else:
+            self.aggregator = SimpleAggregator(config)
         self.triple_scorer = SimpleTripleScorer()
 
-    def process(self, question_text, amr_graph):
+        # the independent relation linking modules run concurrently in "module_workers" threads, 1 runs them in turn
+        self.stage_scheduler = StageScheduler(config.get('module_workers', 3))
 
-        print(f"Text: {question_text}")
-        print(f"EAMR: {amr_graph}")
+        # per-stage timings, enabled with "tracing": true in the config
+        self.tracer = Tracer(config.get('tracing', False))
 
-        output_relations = list()
+        # triples and entity alignments of the EAMRs already seen, "amr_cache_size": 0 disables the in-memory cache
+        amr_cache_size, amr_cache_dir = config.get('amr_cache_size', 10000), config.get('amr_cache_dir')
+        self.amr_cache = AMRCache(amr_cache_size, amr_cache_dir) if amr_cache_size > 0 or amr_cache_dir else None
+
+        # lemmas of the question tokens and entity surface forms, optionally seeded with a precomputed table
+        AMR2Triples.lemmatizer.max_size = config.get('lemma_cache_size', AMR2Triples.lemmatizer.max_size)
+        if config.get('lemma_table_path'):
+            AMR2Triples.lemmatizer.load_table(config['lemma_table_path'])
+
+        # module scores of each question for replaying the aggregation, enabled with "capture_scores": true
+        self.score_capture = ScoreCapture(self.prop_map) if config.get('capture_scores', False) else None
+
+    @classmethod
+    def get_enabled_modules(cls, config):
+        """
+        A relation linking module is enabled unless its weight in module_weights is 0 (the modules without a weight
+        have a weight of 1) or it is listed in disabled_modules.
+        :return: set of the enabled modules (their score names in module_weights)
+        """
+        module_weights = config.get('module_weights', dict())
+        disabled_modules = set(config.get('disabled_modules', list()))
+        return {name for name in KBQARelationLinkingService.relation_linking_modules
+                if module_weights.get(name, 1) != 0 and name not in disabled_modules}
+
+    def load_module(self, name, config):
+        """
+        Imports and creates the module if it is enabled.
+        :return: the module or None
+        """
+        module_path, class_name = KBQARelationLinkingService.relation_linking_modules[name]
+        if name not in self.enabled_modules:
+            logger.info("%s disabled", class_name)
+            return None
+        start = time.perf_counter()
+        module = getattr(importlib.import_module(module_path), class_name)(config)
+        self.load_times[class_name] = time.perf_counter() - start
+        return module
+
+    def load_lazy_resources(self):
+        """
+        Loads the resources that are otherwise loaded on first use (the relation embeddings of the neural model and the
+        question indexes of the fallbacks), e.g., before forking workers that share them.
+        """
+        if self.neural_relation_linking is not None and self.neural_relation_linking.neural_model.r_hiddens is None:
+            self.neural_relation_linking.load_relation_embeddings()
+        fallbacks = [self.answer_type_prediction_module.fallback]
+        if self.contextual_relations_module is not None:
+            fallbacks.append(self.contextual_relations_module.fallback)
+        for fallback in fallbacks:
+            if fallback is not None:
+                fallback.get_index()
 
+    def process(self, question_text, amr_graph):
+        return self.process_batch([(question_text, amr_graph)])[0]
+
+    def process_batch(self, questions):
+        """
+        Links the relations of a list of questions. Triples of all questions are collected first so that each relation
+        linking module is called once per stage with the whole batch, and the scores are then split back per question.
+        :param questions: list of (question_text, amr_graph) tuples
+        :return: list of relation lists, one per question
+        """
         try:
-            amr_graph = AMRUtils.fix_amr_graph(amr_graph)
-            triple_info, names, reified_to_rel, top_node = AMR2Triples.get_flat_triples(question_text, amr_graph)
-            entities = EntityUtils.get_entities(amr_graph)
+            with self.tracer.span('process_batch', questions=len(questions)):
+                return self.do_process_batch(questions)
 
-            amr_nodes = set()
-            print("\nTriples:")
-            for triple in triple_info:
-                amr_nodes.update({triple['subj_text'].lower(), triple['subj_type'].lower(), triple['obj_text'].lower(),
-                                  triple['obj_type'].lower()})
-                print("\t{}\t{}\t{}\t{}\t{}\t{}\t{}\n".format(triple['subj_id'], triple['subj_text'], triple['subj_type'],
-                    triple['predicate'], triple['obj_id'], triple['obj_text'], triple['obj_type']))
+        except Exception as ex:
+            logger.exception("ERROR - %s", ex)
+            raise ex
 
-            amr_entity_alignments, normalized_to_surface_form = EntityUtils.align_entities(amr_nodes, entities)
-            #amr_entity_alignments, normalized_to_surface_form = EntityUtils.align_entities_annotated(question_text, amr_nodes, entities)
+    def do_process_batch(self, questions):
+        # all the tokens of the batch are lemmatized in one pass, if the lemma cache can hold them
+        AMR2Triples.lemmatizer.prefetch([token for question_text, _ in questions
+                                         for token in AMR2Triples.get_tokens(question_text)])
 
-            print("Entity alignment:")
-            for alignment in amr_entity_alignments:
-                print("\t{}: {}".format(alignment, amr_entity_alignments[alignment]))
-            print('\n')
+        question_contexts = list()
+        for question_text, amr_graph in questions:
+            with self.tracer.span('prepare_question'):
+                question_contexts.append(self.prepare_question(question_text, amr_graph))
 
-            answer_types = self.answer_type_prediction_module.get_answer_types(question_text)
-            print("Answer Types:\n{}".format(answer_types))
+        linking_inputs = list()
+        for context in question_contexts:
+            for triple, inverse_triple in context['triple_pairs']:
+                for triple_data in [triple, inverse_triple]:
+                    linking_inputs.append((triple_data, context['contextual_relation_scores'],
+                                           context['normalized_to_surface_form'], context['reified_to_rel']))
 
-            # check if answer type was a literal/data type
-            answer_datatype = None
-            if len(answer_types) > 0 and answer_types[0][0]:
-                answer_type = answer_types[0][0]
-                if answer_type in ['AGE', 'CARDINAL', 'DATE', 'MEASURE']:
-                    answer_datatype = answer_type
+        all_scores = self.do_relation_linking_batch(linking_inputs)
 
-            contextual_relations = self.contextual_relations_module.get_contextual_relations(question_text)
-            contextual_relation_scores = Counter()
-            for index, rel in enumerate(contextual_relations):
-                contextual_relation_scores[rel] = 0.6 if index < 5 else 0.4
-                if index + 1 == len(contextual_relations): contextual_relation_scores[rel] = 0.3
+        output_relations = list()
+        offset = 0
+        for context in question_contexts:
+            triple_count = len(context['triple_pairs'])
+            question_scores = all_scores[offset:offset + 2 * triple_count]
+            offset += 2 * triple_count
+            scores_pairs = list(zip(question_scores[0::2], question_scores[1::2]))
+            with self.tracer.span('rank_triples'):
+                output_relations.append(self.rank_triples(context, scores_pairs))
 
-            response_list = list()
+        return output_relations
 
-            triple_id = 0
-            for triple in triple_info:
+    def prepare_question(self, question_text, amr_graph):
+        """
+        Extracts the triples from the AMR graph, links their entities and types and collects the question level
+        features (answer types, contextual relations) needed for relation linking.
+        :return: dict with the (direct, inverse) triple pairs to be linked and the question level features
+        """
+        logger.debug("Text: %s", question_text)
+        logger.debug("EAMR: %s", amr_graph)
+
+        amr_info = self.get_amr_info(question_text, amr_graph)
+        triple_info, reified_to_rel = amr_info['triple_info'], amr_info['reified_to_rel']
+        amr_entity_alignments = amr_info['amr_entity_alignments']
+        normalized_to_surface_form = amr_info['normalized_to_surface_form']
+
+        logger.debug("\nTriples:")
+        for triple in triple_info:
+            logger.debug("\t%s\t%s\t%s\t%s\t%s\t%s\t%s\n", triple['subj_id'], triple['subj_text'], triple['subj_type'],
+                         triple['predicate'], triple['obj_id'], triple['obj_text'], triple['obj_type'])
+
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Entity alignment:")
+            for alignment in amr_entity_alignments:
+                logger.debug("\t%s: %s", alignment, amr_entity_alignments[alignment])
+            logger.debug('\n')
 
-                if triple['subj_type'] == 'multi-sentence':
-                    continue
+        with self.tracer.span('get_answer_types'):
+            answer_types = self.answer_type_prediction_module.get_answer_types(question_text)
+        logger.debug("Answer Types:\n%s", answer_types)
+
+        # check if answer type was a literal/data type
+        answer_datatype = None
+        if len(answer_types) > 0 and answer_types[0][0]:
+            answer_type = answer_types[0][0]
+            if answer_type in ['AGE', 'CARDINAL', 'DATE', 'MEASURE']:
+                answer_datatype = answer_type
+
+        contextual_relations = list()
+        if self.contextual_relations_module is not None:
+            with self.tracer.span('get_contextual_relations'):
+                contextual_relations = self.contextual_relations_module.get_contextual_relations(question_text)
+        contextual_relation_scores = Counter()
+        for index, rel in enumerate(contextual_relations):
+            contextual_relation_scores[rel] = 0.6 if index < 5 else 0.4
+            if index + 1 == len(contextual_relations): contextual_relation_scores[rel] = 0.3
+
+        triple_pairs = list()
+
+        triple_id = 0
+        for triple in triple_info:
+
+            if triple['subj_type'] == 'multi-sentence':
+                continue
 
-                triple_id += 1
-                rel = triple['predicate']
-                triple['rel_split'] = rel.split('.')
-                triple['text'] = question_text
+            triple_id += 1
+            rel = triple['predicate']
+            triple['rel_split'] = rel.split('.')
+            triple['text'] = question_text
 
-                if triple['rel_split'][0] == 'give-01' or triple['rel_split'][0] == 'list-01':
-                    # TODO handle imperative cases better, check for imperative
-                    continue
+            if triple['rel_split'][0] == 'give-01' or triple['rel_split'][0] == 'list-01':
+                # TODO handle imperative cases better, check for imperative
+                continue
 
-                # try to link subject, subject type, object and object type to KB entities
-                EntityUtils.link_entities_types(triple, amr_entity_alignments, answer_types)
+            # try to link subject, subject type, object and object type to KB entities
+            EntityUtils.link_entities_types(triple, amr_entity_alignments, answer_types)
 
-                if answer_datatype:
-                    triple['answer_datatype'] = answer_datatype
+            if answer_datatype:
+                triple['answer_datatype'] = answer_datatype
 
-                KBQARelationLinkingService.print_triple(triple_id, "direct", triple)
-                scores_dict = self.do_relation_linking(triple, contextual_relation_scores, normalized_to_surface_form,
-                                                       reified_to_rel)
+            KBQARelationLinkingService.print_triple(triple_id, "direct", triple)
+            inverse_triple = KBQARelationLinkingService.get_inverse_triple(triple)
+            KBQARelationLinkingService.print_triple(triple_id, "inverse", inverse_triple)
 
+            triple_pairs.append((triple, inverse_triple))
+
+        return {
+            'question_text': question_text,
+            'triple_pairs': triple_pairs,
+            'contextual_relation_scores': contextual_relation_scores,
+            'normalized_to_surface_form': normalized_to_surface_form,
+            'reified_to_rel': reified_to_rel
+        }
+
+    def get_amr_info(self, question_text, amr_graph):
+        """
+        Parses the EAMR, extracts its triples and aligns its entities, or returns them from the AMR cache if the same
+        question and EAMR have been seen before.
+        :return: dict with triple_info, names, reified_to_rel, top_node, amr_entity_alignments and
+        normalized_to_surface_form
+        """
+        if self.amr_cache is not None:
+            key = AMRCache.get_key(question_text, amr_graph, self.entity_annotation_path)
+            amr_info = self.amr_cache.get(key)
+            if amr_info is not None:
+                return amr_info
+
+        with self.tracer.span('fix_amr_graph'):
+            amr_graph = AMRUtils.fix_amr_graph(amr_graph)
+        with self.tracer.span('get_flat_triples'):
+            triple_info, names, reified_to_rel, top_node = AMR2Triples.get_flat_triples(question_text, amr_graph)
+        entities = EntityUtils.get_entities(amr_graph)
+
+        amr_nodes = set()
+        for triple in triple_info:
+            amr_nodes.update({triple['subj_text'].lower(), triple['subj_type'].lower(), triple['obj_text'].lower(),
+                              triple['obj_type'].lower()})
+
+        with self.tracer.span('align_entities'):
+            if self.entity_annotation_path:
+                amr_entity_alignments, normalized_to_surface_form = EntityUtils.align_entities_annotated(
+                    question_text, amr_nodes, entities, self.entity_annotation_path)
+            else:
+                amr_entity_alignments, normalized_to_surface_form = EntityUtils.align_entities(amr_nodes, entities)
+
+        amr_info = {
+            'triple_info': triple_info,
+            'names': names,
+            'reified_to_rel': reified_to_rel,
+            'top_node': top_node,
+            'amr_entity_alignments': amr_entity_alignments,
+            'normalized_to_surface_form': normalized_to_surface_form
+        }
+        if self.amr_cache is not None:
+            # the entry is pickled when it is put, so linking the triples later does not modify it
+            self.amr_cache.put(key, amr_info)
+        return amr_info
 
-                inverse_triple = KBQARelationLinkingService.get_inverse_triple(triple)
-                KBQARelationLinkingService.print_triple(triple_id, "inverse", inverse_triple)
-                inverse_scores_dict = self.do_relation_linking(inverse_triple, contextual_relation_scores,
-                                                               normalized_to_surface_form, reified_to_rel)
+    def rank_triples(self, question_context, scores_pairs):
+        """
+        Picks a direction for each triple based on the aggregated relation scores and prepares the final relation list.
+        :param question_context: the output of prepare_question
+        :param scores_pairs: list of (scores_dict, inverse_scores_dict) tuples, one per triple pair
+        :return: list of relations
+        """
+        response_list = list()
 
-                # Do min-max normalization of scores from each dict here (from the union of direct and inverse directions,
-                # to get a better triple scoring)
-                scores_dict, inverse_scores_dict = KBQARelationLinkingService.do_normalization(scores_dict, inverse_scores_dict)
+        if self.score_capture is not None:
+            self.score_capture.add(question_context['question_text'], scores_pairs)
 
-                direct_amr_scores = scores_dict['statistical_rel_mapping_scores']
-                inverse_amr_scores = inverse_scores_dict['statistical_rel_mapping_scores']
-                union_amr_scores = Counter()
-                for rel, score in direct_amr_scores.items():
-                    union_amr_scores[rel] = score
-                    for rel, score in inverse_amr_scores.items():
-                        union_amr_scores[rel] = max(score, union_amr_scores[rel])
-                    scores_dict['statistical_rel_mapping_scores'] = union_amr_scores
-                    inverse_scores_dict['statistical_rel_mapping_scores'] = union_amr_scores
+        for (triple, inverse_triple), (scores_dict, inverse_scores_dict) in zip(question_context['triple_pairs'],
+                                                                              scores_pairs):
 
+            scores_dict, inverse_scores_dict = self.aggregator.prepare_scores(scores_dict, inverse_scores_dict)
+
+            with self.tracer.span('aggregate'):
                 relations_with_scores = self.aggregator.aggregate(scores_dict)
                 triple_score = self.triple_scorer.score(scores_dict, relations_with_scores)
 
                 inverse_relations_with_scores = self.aggregator.aggregate(inverse_scores_dict)
                 inverse_triple_score = self.triple_scorer.score(inverse_scores_dict, inverse_relations_with_scores)
 
-                KBQARelationLinkingService.print_relation_scores(triple_score, inverse_triple_score, relations_with_scores,
-                                                  inverse_relations_with_scores)
+            KBQARelationLinkingService.print_relation_scores(triple_score, inverse_triple_score, relations_with_scores,
+                                              inverse_relations_with_scores)
 
 
-                # we only pick one direction for each triple based on the score
-                if triple_score > inverse_triple_score:
-                    response_list.append([triple, relations_with_scores, triple_score])
-                else:
-                    response_list.append([inverse_triple, inverse_relations_with_scores, inverse_triple_score])
+            # we only pick one direction for each triple based on the score
+            if triple_score > inverse_triple_score:
+                response_list.append([triple, relations_with_scores, triple_score])
+            else:
+                response_list.append([inverse_triple, inverse_relations_with_scores, inverse_triple_score])
 
-            # sort the response list based on
-            response_list = sorted(response_list, reverse=True, key=lambda x: x[2])
+        # sort the response list based on
+        response_list = sorted(response_list, reverse=True, key=lambda x: x[2])
 
-            pruned_triple_count = KBQARelationLinkingService.pruned_triple_count(response_list)
+        pruned_triple_count = KBQARelationLinkingService.pruned_triple_count(response_list)
 
-            for response_item in response_list:
-                print('{} {}\n'.format(response_item[0]['predicate'], ", ".join(
-                    ["{} ({:.2f})".format(rel[0], rel[1]) for rel in response_item[1].most_common(10)])))
+        for response_item in response_list:
+            logger.debug('%s %s\n', response_item[0]['predicate'], lazy_scores(response_item[1]))
 
+        with self.tracer.span('prepare_final_relation_list'):
             return self.prepare_final_relation_list(response_list, pruned_triple_count)
 
-        except Exception as ex:
-            print("ERROR - {}".format(str(ex)))
-            print(traceback.format_exc())
-            raise ex
-
-        return output_relations
-
     def do_relation_linking(self, triple_data, contextual_relations, normalized_to_surface_form, reified_to_rel):
-
-        # if the subject is a literal, we don't consider that triple
-        if (triple_data['subj_id'] == triple_data['amr_unknown_var'] and 'answer_datatype' in triple_data) or triple_data['subj_type'] == 'ordinal-entity':
-            if 'answer_datatype' in triple_data:
-                print("\t skipping the triple with datatype subject: {}".format(triple_data['answer_datatype']))
-            empty_scores_dict = {
-                'kg_entity_recommender_scores': Counter(),
-                'contextual_rel_recommender_scores': Counter(),
-                'statistical_rel_mapping_scores': Counter(),
-                'neural_model_scores': Counter(),
-                'similarity_based_scores': Counter()
+        return self.do_relation_linking_batch([(triple_data, contextual_relations, normalized_to_surface_form,
+                                                reified_to_rel)])[0]
+
+    def do_relation_linking_batch(self, linking_inputs):
+        """
+        Runs the relation linking modules over a list of triples. Each module is called once per stage with all the
+        triples of the batch.
+        :param linking_inputs: list of (triple_data, contextual_relations, normalized_to_surface_form, reified_to_rel)
+        :return: list of scores dicts, one per triple
+        """
+        scores_dicts = [None] * len(linking_inputs)
+        active_indices = list()
+
+        for index, (triple_data, _, _, _) in enumerate(linking_inputs):
+            # if the subject is a literal, we don't consider that triple
+            if (triple_data['subj_id'] == triple_data['amr_unknown_var'] and 'answer_datatype' in triple_data) or triple_data['subj_type'] == 'ordinal-entity':
+                if 'answer_datatype' in triple_data:
+                    logger.debug("\t skipping the triple with datatype subject: %s", triple_data['answer_datatype'])
+                scores_dicts[index] = KBQARelationLinkingService.get_empty_scores_dict()
+            else:
+                active_indices.append(index)
+
+        if not active_indices:
+            return scores_dicts
+
+        active_triples = [linking_inputs[index][0] for index in active_indices]
+
+        def run_module(name, module, params_list):
+            with self.tracer.span(name, triples=len(active_triples)):
+                return module.get_relation_candidates_batch(active_triples, params_list)
+
+        # the KG entity, statistical and neural modules are independent, the similarity module needs their relations
+        candidate_modules = ['kg_entity_recommender_scores', 'statistical_rel_mapping_scores', 'neural_model_scores']
+
+        def get_similarity_based_scores(results):
+            similarity_params = list()
+            for position in range(len(active_triples)):
+                list_of_relations = set().union(*[set(results[name][position].keys()) for name in candidate_modules
+                                                  if name in results])
+                similarity_params.append({"listOfRelations": list_of_relations})
+
+            # if kg_entity_recommender_scores.keys():
+            #     list_of_relations = kg_entity_recommender_scores.keys()
+            # else:
+            #     list_of_relations = set().union(set(statistical_rel_mapping_scores.keys()),
+            #                               set(neural_model_scores.keys()))
+
+            return run_module('QuestionSimilarityBasedRelRecommender', self.similarity_based_relation_linking,
+                              similarity_params)
+
+        stages = [
+            Stage('kg_entity_recommender_scores',
+                  lambda _: run_module('KBEntityBasedRecommender', self.kb_entity_based_linking,
+                                       [{} for _ in active_indices])),
+            Stage('statistical_rel_mapping_scores',
+                  lambda _: run_module('StatisticalRelationMapping', self.statistical_mapping_module,
+                                       [{"reified_to_rel": linking_inputs[index][3]} for index in active_indices])),
+            Stage('neural_model_scores',
+                  lambda _: run_module('NeuralRelationLinking', self.neural_relation_linking,
+                                       [{"normalized_to_surface_form": linking_inputs[index][2]}
+                                        for index in active_indices])),
+            Stage('similarity_based_scores', get_similarity_based_scores,
+                  [name for name in candidate_modules if name in self.enabled_modules])
+        ]
+        results = self.stage_scheduler.run([stage for stage in stages if stage.name in self.enabled_modules])
+        # the disabled modules are not run and have no candidate relations
+        for stage in stages:
+            if stage.name not in results:
+                results[stage.name] = [Counter() for _ in active_indices]
+
+        for position, index in enumerate(active_indices):
+            scores_dicts[index] = {
+                'kg_entity_recommender_scores': results['kg_entity_recommender_scores'][position],
+                'contextual_rel_recommender_scores': linking_inputs[index][1],
+                'statistical_rel_mapping_scores': results['statistical_rel_mapping_scores'][position],
+                'neural_model_scores': results['neural_model_scores'][position],
+                'similarity_based_scores': results['similarity_based_scores'][position]
             }
-            return empty_scores_dict
 
-        kg_entity_recommender_scores = self.kb_entity_based_linking.get_relation_candidates(triple_data, {})
+        return scores_dicts
 
-        statistical_rel_mapping_scores = self.statistical_mapping_module.get_relation_candidates(triple_data, {
-            "reified_to_rel": reified_to_rel})
-
-        neural_model_scores = self.neural_relation_linking.get_relation_candidates(triple_data, {
-            "normalized_to_surface_form": normalized_to_surface_form })
-
-        list_of_relations = set().union(set(kg_entity_recommender_scores.keys()),
-                                      set(statistical_rel_mapping_scores.keys()),
-                                      set(neural_model_scores.keys()))
-
-        # if kg_entity_recommender_scores.keys():
-        #     list_of_relations = kg_entity_recommender_scores.keys()
-        # else:
-        #     list_of_relations = set().union(set(statistical_rel_mapping_scores.keys()),
-        #                               set(neural_model_scores.keys()))
-
-        similarity_based_scores = self.similarity_based_relation_linking.get_relation_candidates(triple_data, {
-            "listOfRelations": list_of_relations})
-
-        scores_dict = {
-            'kg_entity_recommender_scores': kg_entity_recommender_scores,
-            'contextual_rel_recommender_scores': contextual_relations,
-            'statistical_rel_mapping_scores': statistical_rel_mapping_scores,
-            'neural_model_scores': neural_model_scores,
-            'similarity_based_scores': similarity_based_scores
+    @classmethod
+    def get_empty_scores_dict(cls):
+        return {
+            'kg_entity_recommender_scores': Counter(),
+            'contextual_rel_recommender_scores': Counter(),
+            'statistical_rel_mapping_scores': Counter(),
+            'neural_model_scores': Counter(),
+            'similarity_based_scores': Counter()
         }
 
-        return scores_dict
-
     @classmethod
     def get_inverse_triple(cls, triple):
         inverse_triple = dict()
@@ -226,44 +465,6 @@ class KBQARelationLinkingService:
 
         return inverse_triple
 
-    @classmethod
-    def do_normalization(cls, scores_dict, inverse_scores_dict):
-        normalized_scores_dict, normalized_inverse_scores_dict = {}, {}
-
-        if set(scores_dict.keys()) != set(inverse_scores_dict.keys()):
-            raise ValueError('There is a scoring measure that is not common to both direct and inverse mappings')
-
-        for module_name in scores_dict.keys():
-            if module_name != 'corrected_question_similarity_based_rel_recommender_scores':
-                normalized_scores_dict[module_name] = scores_dict[module_name]
-                normalized_inverse_scores_dict[module_name] = inverse_scores_dict[module_name]
-                continue
-
-            direct_scores, inverse_scores = scores_dict[module_name], inverse_scores_dict[module_name]
-            normalized_direct_scores, normalized_inverse_scores = Counter(), Counter()
-
-            direct_scores_set = set(direct_scores.values())
-            inverse_scores_set = set(inverse_scores.values())
-            all_scores = direct_scores_set.union(inverse_scores_set)
-
-            if len(all_scores) == 0:
-                normalized_scores_dict[module_name] = normalized_direct_scores
-                normalized_inverse_scores_dict[module_name] = normalized_inverse_scores
-                continue
-
-            max_val, min_val = max(all_scores), min(all_scores)
-            for rel, score in direct_scores.items():
-                normalized_direct_scores[rel] = 0.0 if (max_val - min_val == 0) else (score - min_val) / (
-                            max_val - min_val)
-            for rel, score in inverse_scores.items():
-                normalized_inverse_scores[rel] = 0.0 if (max_val - min_val == 0) else (score - min_val) / (
-                            max_val - min_val)
-
-            normalized_scores_dict[module_name] = normalized_direct_scores
-            normalized_inverse_scores_dict[module_name] = normalized_inverse_scores
-
-        return normalized_scores_dict, normalized_inverse_scores_dict
-
     def prepare_final_relation_list(self, response_list, relation_count):
 
         output_relation_list = list()
@@ -288,7 +489,7 @@ class KBQARelationLinkingService:
         for rel in output_relation_list:
             if rel.startswith("dbp:"):
                 dbo_rel = rel.replace("dbp:", "dbo:")
-                if dbo_rel in self.similarity_based_relation_linking.prop_map:
+                if dbo_rel in self.prop_map:
                     dbo_rels.append(dbo_rel)
 
         return output_relation_list + dbo_rels
@@ -312,20 +513,18 @@ class KBQARelationLinkingService:
 
     @classmethod
     def print_triple(cls, triple_id, comment, triple_data):
-        print(
-            "triple_{}_{}:\n\t\tpredicate: {}\n\t\tsubj: {},\t{},\t{},\t{}\n\t\tobject: {},\t{},\t{},\t{}\n".format(
-                triple_id,
-                comment,
-                triple_data['predicate'],
-                triple_data['subj_text'], triple_data['subj_type'], triple_data['subj_uri'],
-                triple_data['subj_type_uri'],
-                triple_data['obj_text'], triple_data['obj_type'], triple_data['obj_uri'],
-                triple_data['obj_type_uri']))
+        logger.debug(
+            "triple_%s_%s:\n\t\tpredicate: %s\n\t\tsubj: %s,\t%s,\t%s,\t%s\n\t\tobject: %s,\t%s,\t%s,\t%s\n",
+            triple_id,
+            comment,
+            triple_data['predicate'],
+            triple_data['subj_text'], triple_data['subj_type'], triple_data['subj_uri'],
+            triple_data['subj_type_uri'],
+            triple_data['obj_text'], triple_data['obj_type'], triple_data['obj_uri'],
+            triple_data['obj_type_uri'])
 
     @classmethod
     def print_relation_scores(cls, triple_score, inverse_triple_score, direct_scores, inverse_scorees):
-        print("\nTriple score:\n\tdirect: {}\n\t\t{}\n\tinverse: {}\n\t\t{}\n".format(triple_score,
-              ", ".join([ "{} ({:.2f})".format(count[0], count[1]) for count in direct_scores.most_common(10)]),
-                                                                                      inverse_triple_score,
-              ", ".join(["{} ({:.2f})".format(count[0], count[1]) for count in inverse_scorees.most_common(10)])))
+        logger.debug("\nTriple score:\n\tdirect: %s\n\t\t%s\n\tinverse: %s\n\t\t%s\n", triple_score,
+                     lazy_scores(direct_scores), inverse_triple_score, lazy_scores(inverse_scorees))
 
@@ -0,0 +1,141 @@
+import argparse
+import hashlib
+import logging
+import mmap
+import os
+import pickle
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class ResourceStore:
+    """
+    Read-only str -> value store for the precomputed resources (answer types, contextual relations, statistical
+    mappings), converted once from their pickled dicts by convert. A store with prefix P is made of
+
+        P.hashes.npy    sorted 64-bit hashes of the keys
+        P.offsets.npy   start of the record of each hash in P.data, and the end of the last record
+        P.data          the pickled (key, value) records
+
+    which are memory-mapped by load, so the worker processes share one page-cache copy and only the records that are
+    looked up are read and unpickled. Lookups return a new value every time.
+    """
+
+    def __init__(self, hashes, offsets, data):
+        self.hashes = hashes
+        self.offsets = offsets
+        self.data = data
+
+    @classmethod
+    def get_hash(cls, key):
+        return int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'little')
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def __contains__(self, key):
+        return self.get_record(key) is not None
+
+    def __getitem__(self, key):
+        record = self.get_record(key)
+        if record is None:
+            raise KeyError(key)
+        return record[1]
+
+    def get(self, key, default=None):
+        record = self.get_record(key)
+        return record[1] if record is not None else default
+
+    def keys(self):
+        """
+        :return: generator of all the keys, in the order of their hashes
+        """
+        for index in range(len(self.hashes)):
+            yield pickle.loads(self.data[int(self.offsets[index]):int(self.offsets[index + 1])])[0]
+
+    def get_record(self, key):
+        """
+        :return: the (key, value) record of the key or None
+        """
+        if not isinstance(key, str) or len(self.hashes) == 0:
+            return None
+        key_hash = np.uint64(ResourceStore.get_hash(key))
+        index = int(np.searchsorted(self.hashes, key_hash))
+        # keys with the same hash are next to each other
+        while index < len(self.hashes) and self.hashes[index] == key_hash:
+            record = pickle.loads(self.data[int(self.offsets[index]):int(self.offsets[index + 1])])
+            if record[0] == key:
+                return record
+            index += 1
+        return None
+
+    @classmethod
+    def load(cls, prefix):
+        hashes = np.load(prefix + '.hashes.npy', mmap_mode='r')
+        offsets = np.load(prefix + '.offsets.npy', mmap_mode='r')
+        data = b''
+        if len(hashes) > 0:
+            with open(prefix + '.data', 'rb') as data_file:
+                data = memoryview(mmap.mmap(data_file.fileno(), 0, access=mmap.ACCESS_READ))
+        return ResourceStore(hashes, offsets, data)
+
+    @classmethod
+    def convert(cls, resource, prefix):
+        """
+        :param resource: dict with str keys
+        :param prefix: prefix of the store files
+        """
+        keys = list(resource.keys())
+        for key in keys:
+            if not isinstance(key, str):
+                raise ValueError("only str keys are supported, found {}".format(repr(key)))
+        hashes = np.array([ResourceStore.get_hash(key) for key in keys], dtype=np.uint64)
+        order = np.argsort(hashes, kind='stable')
+
+        offsets = [0]
+        tmp_path = "{}.data.{}.tmp".format(prefix, os.getpid())
+        with open(tmp_path, 'wb') as data_file:
+            for index in order.tolist():
+                record = pickle.dumps((keys[index], resource[keys[index]]), protocol=pickle.HIGHEST_PROTOCOL)
+                data_file.write(record)
+                offsets.append(offsets[-1] + len(record))
+        np.save(prefix + '.hashes.npy', hashes[order])
+        np.save(prefix + '.offsets.npy', np.array(offsets, dtype=np.int64))
+        os.replace(tmp_path, prefix + '.data')
+
+    @classmethod
+    def load_resource(cls, path, table=None):
+        """
+        Loads a resource either from a pickle (path ending with .pkl) as before, or from a store converted from it.
+        :param path: .pkl path or store prefix
+        :param table: key of the resource in a pickled dict of resources, which is converted as the store
+        "prefix.table"
+        :return: dict or ResourceStore
+        """
+        if path.endswith('.pkl'):
+            with open(path, 'rb') as f:
+                resource = pickle.load(f)
+            return resource[table] if table else resource
+        return ResourceStore.load("{}.{}".format(path, table) if table else path)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='converts a pickled dict (e.g., ../data/answer-types.pkl) to a '
+                                                 'memory-mapped resource store')
+    parser.add_argument('--pickle_path', help='pickled dict')
+    parser.add_argument('--output_prefix', help='prefix of the store files, to be set as the resource path')
+    parser.add_argument('--tables', nargs='*',
+                        help='keys of the pickled dict to convert as separate stores (e.g., relation_scores '
+                             'rel_arg_scores binary_relation_scores of the statistical mappings)')
+    args = parser.parse_args()
+
+    with open(args.pickle_path, 'rb') as f:
+        resources = pickle.load(f)
+    if args.tables:
+        for table in args.tables:
+            ResourceStore.convert(resources[table], "{}.{}".format(args.output_prefix, table))
+            print("{}: {} entries converted to {}.{}".format(table, len(resources[table]), args.output_prefix, table))
+    else:
+        ResourceStore.convert(resources, args.output_prefix)
+        print("{} entries converted to {}".format(len(resources), args.output_prefix))
@@ -0,0 +1,92 @@
+import json
+import numpy as np
+
+
+class ScoreCapture:
+    """
+    Records the module scores (scores_dict) of both directions of every triple of the linked questions, so that the
+    aggregation can be replayed with other module weights without running the relation linking modules again
+    (see score_replay.py).
+
+    The captures are saved as a .npz file with one row per (triple direction, module, relation) score:
+
+        entry_triple    index of the triple direction, 2 * pair index (+ 1 for the inverse direction)
+        entry_module    index into modules
+        entry_relation  index into relations
+        entry_score     the module score
+
+    Rows are kept in the insertion order of the Counters, so that ties are broken the same way when replayed. The
+    pairs of each question are counted in pair_counts.
+    """
+
+    def __init__(self, prop_map=None):
+        self.prop_map = prop_map if prop_map is not None else dict()
+        self.records = list()
+
+    def add(self, question_text, scores_pairs):
+        """
+        :param question_text: question text
+        :param scores_pairs: list of (scores_dict, inverse_scores_dict) tuples, one per triple pair
+        """
+        modules = list()
+        entries = list()
+        dbo_aliases = dict()
+        for pair_index, pair in enumerate(scores_pairs):
+            for direction, scores_dict in enumerate(pair):
+                if not modules:
+                    modules = list(scores_dict.keys())
+                for module, relation_scores in scores_dict.items():
+                    for rel, score in relation_scores.items():
+                        entries.append((2 * pair_index + direction, module, rel, float(score)))
+                        if rel.startswith("dbp:") and rel.replace("dbp:", "dbo:") in self.prop_map:
+                            dbo_aliases[rel] = rel.replace("dbp:", "dbo:")
+        self.records.append({'question_text': question_text, 'pair_count': len(scores_pairs), 'modules': modules,
+                             'entries': entries, 'dbo_aliases': dbo_aliases})
+
+    def drain(self):
+        """
+        :return: the records captured since the last call
+        """
+        records = self.records
+        self.records = list()
+        return records
+
+    @classmethod
+    def save(cls, path, records, module_weights=None):
+        """
+        :param path: .npz path
+        :param records: records returned by drain(), optionally with 'q_id', 'gold' and 'predicted' keys added
+        :param module_weights: module weights used when capturing
+        """
+        modules, module_ids = list(), dict()
+        relation_ids = dict()
+        entry_triple, entry_module, entry_relation, entry_score = list(), list(), list(), list()
+        triple_offset = 0
+        for record in records:
+            # the order of the modules is the order of the aggregation
+            for module in record['modules']:
+                if module not in module_ids:
+                    module_ids[module] = len(modules)
+                    modules.append(module)
+            for triple_index, module, rel, score in record['entries']:
+                entry_triple.append(triple_offset + triple_index)
+                entry_module.append(module_ids[module])
+                entry_relation.append(relation_ids.setdefault(rel, len(relation_ids)))
+                entry_score.append(score)
+            triple_offset += 2 * record['pair_count']
+
+        np.savez_compressed(
+            path,
+            q_ids=np.array([str(record.get('q_id', index)) for index, record in enumerate(records)]),
+            question_texts=np.array([record['question_text'] for record in records]),
+            gold=np.array([json.dumps(record.get('gold', list())) for record in records]),
+            predicted=np.array([json.dumps(record.get('predicted', list())) for record in records]),
+            dbo_aliases=np.array([json.dumps(record['dbo_aliases']) for record in records]),
+            pair_counts=np.array([record['pair_count'] for record in records], dtype=np.int32),
+            modules=np.array(modules),
+            relations=np.array(list(relation_ids.keys())),
+            module_weights=np.array(json.dumps(module_weights if module_weights else dict())),
+            entry_triple=np.array(entry_triple, dtype=np.int32),
+            entry_module=np.array(entry_module, dtype=np.int16),
+            entry_relation=np.array(entry_relation, dtype=np.int32),
+            entry_score=np.array(entry_score, dtype=np.float64))
@@ -0,0 +1,229 @@
+import json
+from collections import Counter
+
+import numpy as np
+
+from relation_linking_core.candidate_aggregators.aggregator import Aggregator
+
+
+class ScoreReplay:
+    """
+    Replays the aggregation, triple scoring, direction choice and final relation list preparation of
+    KBQARelationLinkingService.rank_triples from the module scores saved by ScoreCapture, for many module weight
+    configurations at once. The normalization does not depend on the weights and is done once when loading; the
+    weighted sums and triple scores of all configurations are computed together as (configurations x relations) arrays.
+
+    The replay follows SimpleAggregator and SimpleTripleScorer, including their tie breaking, so the captured weights
+    reproduce the captured predictions.
+    """
+
+    def __init__(self, capture_path):
+        capture = np.load(capture_path)
+        self.q_ids = capture['q_ids'].tolist()
+        self.question_texts = capture['question_texts'].tolist()
+        self.gold = [json.loads(gold) for gold in capture['gold'].tolist()]
+        self.predicted = [json.loads(predicted) for predicted in capture['predicted'].tolist()]
+        self.module_weights = json.loads(str(capture['module_weights']))
+        self.modules = capture['modules'].tolist()
+        relations = capture['relations'].tolist()
+
+        entry_triple = capture['entry_triple'].tolist()
+        entry_module = capture['entry_module'].tolist()
+        entry_relation = capture['entry_relation'].tolist()
+        entry_score = capture['entry_score'].tolist()
+
+        # per question, per pair, per direction: (relation names, modules x relations score matrix)
+        self.questions = list()
+        pair_counts = capture['pair_counts'].tolist()
+        dbo_aliases = capture['dbo_aliases'].tolist()
+        entry_index, triple_offset = 0, 0
+        for pair_count, aliases in zip(pair_counts, dbo_aliases):
+            scores_dicts = [{module: Counter() for module in self.modules} for _ in range(2 * pair_count)]
+            while entry_index < len(entry_triple) and entry_triple[entry_index] < triple_offset + 2 * pair_count:
+                scores_dict = scores_dicts[entry_triple[entry_index] - triple_offset]
+                scores_dict[self.modules[entry_module[entry_index]]][relations[entry_relation[entry_index]]] = \
+                    entry_score[entry_index]
+                entry_index += 1
+            triple_offset += 2 * pair_count
+
+            pairs = list()
+            question_relation_ids = dict()
+            for pair_index in range(pair_count):
+                scores_dict, inverse_scores_dict = Aggregator.prepare_scores_dicts(
+                    scores_dicts[2 * pair_index], scores_dicts[2 * pair_index + 1])
+                pairs.append((ScoreReplay.get_score_matrix(scores_dict, question_relation_ids),
+                              ScoreReplay.get_score_matrix(inverse_scores_dict, question_relation_ids)))
+            self.questions.append({'pairs': pairs, 'relations': list(question_relation_ids.keys()),
+                                   'dbo_aliases': json.loads(aliases)})
+
+    @classmethod
+    def get_score_matrix(cls, scores_dict, question_relation_ids):
+        """
+        :param scores_dict: dict of module -> Counter of relation scores
+        :param question_relation_ids: dict of relation -> id shared by all the triples of the question, updated
+        :return: (list of relation names in the insertion order of the aggregated Counter, array of their question
+        relation ids, modules x relations array)
+        """
+        relation_ids = dict()
+        for relation_scores in scores_dict.values():
+            for rel in relation_scores:
+                relation_ids.setdefault(rel, len(relation_ids))
+        matrix = np.zeros((len(scores_dict), len(relation_ids)), dtype=np.float64)
+        for module_index, relation_scores in enumerate(scores_dict.values()):
+            for rel, score in relation_scores.items():
+                matrix[module_index, relation_ids[rel]] = score
+        relations = list(relation_ids.keys())
+        ids = np.array([question_relation_ids.setdefault(rel, len(question_relation_ids)) for rel in relations],
+                       dtype=np.int64)
+        return relations, ids, matrix
+
+    def get_weight_matrix(self, weights_list):
+        """
+        :param weights_list: list of module_weights dicts, modules without a weight get 1 as in SimpleAggregator
+        :return: configurations x modules array
+        """
+        return np.array([[weights[module] if module in weights else 1 for module in self.modules]
+                         for weights in weights_list], dtype=np.float64)
+
+    def replay(self, weights_list, chunk_size=256):
+        """
+        :param weights_list: list of module_weights dicts
+        :param chunk_size: number of configurations replayed together
+        :return: generator of (module_weights, list of predicted relation lists, one per question)
+        """
+        for chunk_start in range(0, len(weights_list), chunk_size):
+            chunk = weights_list[chunk_start:chunk_start + chunk_size]
+            weights = self.get_weight_matrix(chunk)
+            predictions = [list() for _ in chunk]
+            for question in self.questions:
+                for config_index, relations in enumerate(self.replay_question(question, weights)):
+                    predictions[config_index].append(relations)
+            for module_weights, config_predictions in zip(chunk, predictions):
+                yield module_weights, config_predictions
+
+    @classmethod
+    def aggregate(cls, matrix, weights):
+        """
+        :return: configurations x relations array, summed module by module in the order of SimpleAggregator
+        """
+        aggregated_scores = np.zeros((weights.shape[0], matrix.shape[1]), dtype=np.float64)
+        for module_index in range(matrix.shape[0]):
+            aggregated_scores = aggregated_scores + weights[:, module_index, None] * matrix[module_index][None, :]
+        return aggregated_scores
+
+    @classmethod
+    def top_two(cls, aggregated_scores):
+        """
+        :return: the indices of the two highest scores of every configuration, the first index among ties as in
+        Counter.most_common(2), -1 if there are fewer relations
+        """
+        config_count, relation_count = aggregated_scores.shape
+        if relation_count == 0:
+            return [-1] * config_count, [-1] * config_count
+        first = np.argmax(aggregated_scores, axis=1)
+        if relation_count == 1:
+            return first.tolist(), [-1] * config_count
+        masked_scores = aggregated_scores.copy()
+        masked_scores[np.arange(config_count), first] = -np.inf
+        return first.tolist(), np.argmax(masked_scores, axis=1).tolist()
+
+    def replay_question(self, question, weights):
+        """
+        :return: list of predicted relation lists, one per configuration
+        """
+        config_count = weights.shape[0]
+        pairs = question['pairs']
+        if not pairs:
+            return [list() for _ in range(config_count)]
+
+        # per pair: aggregated scores, relation names and top two indices of the direction picked in each configuration
+        pair_scores, pair_choices = list(), list()
+        for (relations, ids, matrix), (inverse_relations, inverse_ids, inverse_matrix) in pairs:
+            aggregated_scores = ScoreReplay.aggregate(matrix, weights)
+            inverse_aggregated_scores = ScoreReplay.aggregate(inverse_matrix, weights)
+            triple_score = aggregated_scores.max(axis=1) if relations else np.zeros(config_count)
+            inverse_triple_score = inverse_aggregated_scores.max(axis=1) if inverse_relations \
+                else np.zeros(config_count)
+            direct = triple_score > inverse_triple_score
+            pair_scores.append(np.where(direct, triple_score, inverse_triple_score))
+            pair_choices.append((direct.tolist(),
+                                 (relations, ids, aggregated_scores) + ScoreReplay.top_two(aggregated_scores),
+                                 (inverse_relations, inverse_ids, inverse_aggregated_scores) +
+                                 ScoreReplay.top_two(inverse_aggregated_scores)))
+
+        # stable descending order, as sorted(reverse=True)
+        orders = np.argsort(-np.stack(pair_scores, axis=1), axis=1, kind='stable').tolist()
+
+        predictions = list()
+        for config_index in range(config_count):
+            response_list = list()
+            for pair_index in orders[config_index]:
+                direct, direct_response, inverse_response = pair_choices[pair_index]
+                relations, ids, aggregated_scores, first, second = direct_response if direct[config_index] \
+                    else inverse_response
+                response_list.append((relations, ids, aggregated_scores[config_index], first[config_index],
+                                      second[config_index]))
+            predictions.append(ScoreReplay.prepare_final_relation_list(response_list, question['relations'],
+                                                                       question['dbo_aliases']))
+        return predictions
+
+    @classmethod
+    def prepare_final_relation_list(cls, response_list, question_relations, dbo_aliases):
+        """
+        Same as KBQARelationLinkingService.pruned_triple_count followed by prepare_final_relation_list.
+        :param response_list: sorted list of (relation names, question relation ids, aggregated scores, top index,
+        second index) tuples
+        :param question_relations: relations of the question, indexed by the question relation ids
+        :param dbo_aliases: dict of dbp relations to the dbo relation with the same name
+        """
+        relation_count = 0
+        seen_relations = set()
+        for relations, _, _, first, second in response_list:
+            top_k = {relations[index] for index in (first, second) if index != -1}
+            if len(seen_relations.intersection(top_k)) == len(top_k):
+                continue
+            relation_count += 1
+            seen_relations.update(top_k)
+
+        output_relation_list = list()
+        for relations, _, _, first, _ in response_list:
+            if relations:
+                if relations[first] not in output_relation_list:
+                    output_relation_list.append(relations[first])
+                if len(output_relation_list) == relation_count:
+                    break
+
+        if len(output_relation_list) < relation_count:
+            # the loop above did not break, so all the non-empty responses are summed
+            for rel in ScoreReplay.get_unified_relations(response_list, question_relations):
+                if len(output_relation_list) < relation_count and rel not in output_relation_list:
+                    output_relation_list.append(rel)
+
+        return output_relation_list + [dbo_aliases[rel] for rel in output_relation_list if rel in dbo_aliases]
+
+    @classmethod
+    def get_unified_relations(cls, response_list, question_relations):
+        """
+        :return: the relations of the sum of the aggregated Counters of the responses, in Counter.most_common() order
+        """
+        responses = [response for response in response_list if response[0]]
+        if any([aggregated_scores.min() < 0 for _, _, aggregated_scores, _, _ in responses]):
+            # Counter addition drops non-positive counts at every step, replayed as is for negative scores
+            unified_counter = Counter()
+            for relations, _, aggregated_scores, _, _ in responses:
+                unified_counter += Counter(dict(zip(relations, aggregated_scores.tolist())))
+            return [rel for rel, _ in unified_counter.most_common()]
+
+        # with non-negative scores, a relation is in the sum from the first response where it is positive, summed in
+        # the response order, and most_common() keeps that insertion order among ties
+        totals = np.zeros(len(question_relations), dtype=np.float64)
+        insertion_order = np.full(len(question_relations), np.inf)
+        position = 0
+        for relations, ids, aggregated_scores, _, _ in responses:
+            totals[ids] += aggregated_scores
+            inserted = (aggregated_scores > 0) & np.isinf(insertion_order[ids])
+            insertion_order[ids[inserted]] = position + np.flatnonzero(inserted)
+            position += len(relations)
+        candidates = np.flatnonzero(~np.isinf(insertion_order))
+        ranked = candidates[np.lexsort((insertion_order[candidates], -totals[candidates]))]
+        return [question_relations[rel_id] for rel_id in ranked.tolist()]
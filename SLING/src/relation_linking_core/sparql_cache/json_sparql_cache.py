@@ -0,0 +1,39 @@
+import json
+import os
+from threading import Lock
+
+from relation_linking_core.sparql_cache.sparql_cache import SparqlCache
+
+
+class JsonSparqlCache(SparqlCache):
+    """
+    Keeps all the cached queries in memory and rewrites the whole JSON file on every new entry. The file is replaced
+    atomically, but the entries added by other processes meanwhile are overwritten, so several processes should share
+    a SqliteSparqlCache instead.
+    """
+
+    def __init__(self, config=None):
+        self.cache_path = config['sparql_cache_path']
+        with open(self.cache_path) as f:
+            self.cache = json.load(f)
+        self.lock = Lock()
+
+    def get(self, query_string):
+        return self.cache.get(query_string)
+
+    def put(self, query_string, relations):
+        self.put_all({query_string: relations})
+
+    def put_all(self, query_to_relations):
+        if not query_to_relations:
+            return
+        with self.lock:
+            self.cache.update(query_to_relations)
+            # written to a temporary file first so that an interrupted write never leaves an invalid file
+            tmp_path = "{}.{}.tmp".format(self.cache_path, os.getpid())
+            with open(tmp_path, 'w') as f:
+                json.dump(self.cache, f)
+            os.replace(tmp_path, self.cache_path)
+
+    def __len__(self):
+        return len(self.cache)
@@ -0,0 +1,60 @@
+# Interface for storing the results of SPARQL queries
+class SparqlCache:
+    """
+    Basic Interface for SPARQL result caches. A cache maps a SPARQL query string to the list of relations it returned.
+    """
+    def __init__(self, config=None):
+        pass
+
+    def get(self, query_string):
+        """
+        Returns the cached relations of the query
+        :param query_string:
+        :return: list of relations or None if the query is not cached
+        """
+        raise NotImplementedError('Please implement the get function')
+
+    def put(self, query_string, relations):
+        """
+        Stores the relations returned by the query
+        :param query_string:
+        :param relations: list of relations
+        """
+        raise NotImplementedError('Please implement the put function')
+
+    def put_all(self, query_to_relations):
+        """
+        Stores the relations of several queries
+        :param query_to_relations: dict of query string -> list of relations
+        """
+        for query_string, relations in query_to_relations.items():
+            self.put(query_string, relations)
+
+    def __contains__(self, query_string):
+        return self.get(query_string) is not None
+
+    def __len__(self):
+        raise NotImplementedError('Please implement the len function')
+
+
+def get_sparql_cache(config):
+    """
+    Creates the SPARQL cache configured with 'sparql_cache_backend' ('json' or 'sqlite', defaults to 'json').
+    """
+    backend = config.get('sparql_cache_backend', 'json')
+    if backend == 'json':
+        from relation_linking_core.sparql_cache.json_sparql_cache import JsonSparqlCache
+        return JsonSparqlCache(config)
+    elif backend == 'sqlite':
+        from relation_linking_core.sparql_cache.sqlite_sparql_cache import SqliteSparqlCache
+        return SqliteSparqlCache(config)
+    else:
+        raise NotImplementedError('"{}" SPARQL cache backend not implemented'.format(backend))
+
+
+def is_shared_by_processes(config):
+    """
+    :return: True if the configured SPARQL cache can be written by several processes at once (the SQLite backend), the
+    JSON cache of each process would overwrite the entries added by the others
+    """
+    return config.get('sparql_cache_backend', 'json') == 'sqlite'
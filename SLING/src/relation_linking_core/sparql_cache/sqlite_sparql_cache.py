@@ -0,0 +1,78 @@
+import argparse
+import json
+import os
+import sqlite3
+import threading
+
+from relation_linking_core.sparql_cache.sparql_cache import SparqlCache
+
+
+class SqliteSparqlCache(SparqlCache):
+    """
+    Stores one row per query in a SQLite database. Entries are read and written individually, so nothing is loaded at
+    startup and a cache miss only appends the new row. The database runs in WAL mode, so several processes can read
+    and write the same cache file concurrently.
+    """
+
+    def __init__(self, config=None):
+        self.db_path = config['sparql_cache_path']
+        self.timeout = config.get('sparql_cache_timeout', 30)
+        # sqlite connections can not be shared between threads
+        self.local = threading.local()
+        self.pid = os.getpid()
+        conn = self.get_connection()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('CREATE TABLE IF NOT EXISTS sparql_cache (query TEXT PRIMARY KEY, relations TEXT NOT NULL)')
+        conn.commit()
+
+    def get_connection(self):
+        if self.pid != os.getpid():
+            # a connection can not be used after a fork either, a forked worker opens its own
+            self.local = threading.local()
+            self.pid = os.getpid()
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=self.timeout)
+            self.local.conn = conn
+        return conn
+
+    def get(self, query_string):
+        row = self.get_connection().execute('SELECT relations FROM sparql_cache WHERE query = ?',
+                                            (query_string,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, query_string, relations):
+        conn = self.get_connection()
+        with conn:
+            conn.execute('INSERT OR REPLACE INTO sparql_cache (query, relations) VALUES (?, ?)',
+                         (query_string, json.dumps(relations)))
+
+    def put_all(self, query_to_relations):
+        conn = self.get_connection()
+        with conn:
+            conn.executemany('INSERT OR REPLACE INTO sparql_cache (query, relations) VALUES (?, ?)',
+                             ((query, json.dumps(relations)) for query, relations in query_to_relations.items()))
+
+    def __len__(self):
+        return self.get_connection().execute('SELECT COUNT(*) FROM sparql_cache').fetchone()[0]
+
+    @classmethod
+    def import_json_cache(cls, json_path, db_path):
+        """
+        One-time import of a JSON SPARQL cache (query -> relations) into a SQLite cache.
+        """
+        with open(json_path) as f:
+            json_cache = json.load(f)
+        sqlite_cache = SqliteSparqlCache({'sparql_cache_path': db_path})
+        sqlite_cache.put_all(json_cache)
+        return len(json_cache)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--json_path')
+    parser.add_argument('--db_path')
+    args = parser.parse_args()
+
+    count = SqliteSparqlCache.import_json_cache(args.json_path, args.db_path)
+    print("{} cached SPARQL results imported from {} to {}".format(count, args.json_path, args.db_path))
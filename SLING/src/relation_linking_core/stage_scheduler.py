@@ -0,0 +1,70 @@
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+
+class Stage:
+
+    def __init__(self, name, function, dependencies=()):
+        """
+        :param name: name of the stage, its result is passed to the stages depending on it under this name
+        :param function: function of a dict of the results of the dependencies (stage name -> result)
+        :param dependencies: names of the stages whose results are needed
+        """
+        self.name = name
+        self.function = function
+        self.dependencies = tuple(dependencies)
+
+    def run(self, results):
+        return self.function({name: results[name] for name in self.dependencies})
+
+
+class StageScheduler:
+    """
+    Runs a set of dependent stages (e.g., the relation linking modules) in a thread pool. Each stage is started as soon
+    as the stages it depends on are done, so independent I/O bound (SPARQL) and GIL releasing (PyTorch) stages overlap.
+    With max_workers <= 1, the stages are run one after another in the given order.
+    """
+
+    def __init__(self, max_workers=4):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='stage') \
+            if max_workers > 1 else None
+
+    def run(self, stages):
+        """
+        :param stages: list of Stage, in an order that respects the dependencies
+        :return: dict of stage name -> result
+        """
+        names = {stage.name for stage in stages}
+        for stage in stages:
+            for dependency in stage.dependencies:
+                if dependency not in names:
+                    raise ValueError("stage {} depends on the unknown stage {}".format(stage.name, dependency))
+
+        results = dict()
+        if self.executor is None:
+            for stage in stages:
+                results[stage.name] = stage.run(results)
+            return results
+
+        pending = list(stages)
+        running = dict()
+        try:
+            while pending or running:
+                for stage in [stage for stage in pending if all([name in results for name in stage.dependencies])]:
+                    pending.remove(stage)
+                    running[self.executor.submit(stage.run, dict(results))] = stage.name
+                if not running:
+                    raise ValueError("cyclic dependencies between the stages {}".format(
+                        [stage.name for stage in pending]))
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    # re-raises the exception of a failed stage
+                    results[running.pop(future)] = future.result()
+        finally:
+            # the stages still running are not interrupted, but their results are dropped
+            for future in running:
+                future.cancel()
+        return results
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
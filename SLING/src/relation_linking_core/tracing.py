@@ -0,0 +1,123 @@
+import json
+import os
+import threading
+import time
+
+
+class Span:
+
+    def __init__(self, tracer, name, args):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        end = time.perf_counter()
+        self.tracer.record(self.name, self.start, end - self.start, self.args)
+        return False
+
+
+class NullSpan:
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+class Tracer:
+    """
+    Collects the wall time of the stages of the pipeline. Stages are timed with
+
+        with tracer.span('stage name'):
+            ...
+
+    A disabled tracer hands out a shared no-op span, so the instrumentation costs a method call per stage.
+    """
+
+    null_span = NullSpan()
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.spans = list()
+        self.origin = time.perf_counter()
+        self.lock = threading.Lock()
+
+    def span(self, name, **args):
+        if not self.enabled:
+            return Tracer.null_span
+        return Span(self, name, args)
+
+    def record(self, name, start, duration, args):
+        span = {'name': name, 'start': start - self.origin, 'duration': duration, 'pid': os.getpid(),
+                'tid': threading.get_ident()}
+        if args:
+            span['args'] = args
+        with self.lock:
+            self.spans.append(span)
+
+    def clear(self):
+        with self.lock:
+            self.spans = list()
+
+    def summary(self):
+        """
+        :return: dict of span name -> dict with the count, total, mean, p50, p95 and max duration in seconds
+        """
+        durations = dict()
+        for span in self.spans:
+            durations.setdefault(span['name'], list()).append(span['duration'])
+        summary = dict()
+        for name, values in durations.items():
+            values = sorted(values)
+            summary[name] = {
+                'count': len(values),
+                'total': sum(values),
+                'mean': sum(values) / len(values),
+                'p50': Tracer.percentile(values, 50),
+                'p95': Tracer.percentile(values, 95),
+                'max': values[-1]
+            }
+        return summary
+
+    @classmethod
+    def percentile(cls, sorted_values, percent):
+        index = min(len(sorted_values) - 1, max(0, int(round(percent / 100 * len(sorted_values))) - 1))
+        return sorted_values[index]
+
+    def print_summary(self):
+        print("{:<60} {:>8} {:>10} {:>10} {:>10} {:>10}".format('stage', 'count', 'total(s)', 'p50(ms)', 'p95(ms)',
+                                                                'max(ms)'))
+        for name, stats in sorted(self.summary().items(), key=lambda x: x[1]['total'], reverse=True):
+            print("{:<60} {:>8} {:>10.2f} {:>10.2f} {:>10.2f} {:>10.2f}".format(
+                name, stats['count'], stats['total'], stats['p50'] * 1000, stats['p95'] * 1000, stats['max'] * 1000))
+
+    def export_jsonl(self, path):
+        with open(path, 'w') as f:
+            for span in self.spans:
+                f.write(json.dumps(span) + '\n')
+
+    def export_chrome_trace(self, path):
+        """ writes the spans in the Chrome trace event format (chrome://tracing, Perfetto) """
+        events = list()
+        for span in self.spans:
+            event = {'name': span['name'], 'ph': 'X', 'ts': span['start'] * 1e6, 'dur': span['duration'] * 1e6,
+                     'pid': span['pid'], 'tid': span['tid']}
+            if 'args' in span:
+                event['args'] = span['args']
+            events.append(event)
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+
+    def export(self, path):
+        """ exports as JSON lines if the path ends with .jsonl, as a Chrome trace otherwise """
+        if path.endswith('.jsonl'):
+            self.export_jsonl(path)
+        else:
+            self.export_chrome_trace(path)
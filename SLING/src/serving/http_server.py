@@ -0,0 +1,277 @@
+import argparse
+import json
+import logging
+import os
+import queue
+import signal
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from relation_linking_core.logging_utils import configure_logging
+
+logger = logging.getLogger(__name__)
+
+
+class PendingRequest:
+
+    def __init__(self, question_text, amr_graph):
+        self.question_text = question_text
+        self.amr_graph = amr_graph
+        self.relations = None
+        self.error = None
+        self.done = threading.Event()
+
+    def resolve(self, relations=None, error=None):
+        self.relations = relations
+        self.error = error
+        self.done.set()
+
+
+class MicroBatcher:
+    """
+    Collects the questions of concurrent requests into micro-batches for KBQARelationLinkingService.process_batch, so
+    that each relation linking module is called once per batch. A batch is started by its first question and closed
+    after batch_window_ms or when it has max_batch_size questions. The batches are linked one at a time by a single
+    thread, and the questions waiting for it are bounded by max_queue_size.
+    """
+
+    def __init__(self, service, config=None):
+        config = config if config else dict()
+        self.service = service
+        self.batch_window = config.get('batch_window_ms', 10) / 1000.0
+        self.max_batch_size = config.get('max_batch_size', 16)
+        self.requests = queue.Queue(maxsize=config.get('max_queue_size', 64))
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name='micro-batcher', daemon=True)
+        self.thread.start()
+
+    def submit(self, question_text, amr_graph):
+        """
+        :return: PendingRequest, resolved once its batch is linked
+        :raise queue.Full: if max_queue_size questions are already waiting
+        """
+        request = PendingRequest(question_text, amr_graph)
+        self.requests.put_nowait(request)
+        return request
+
+    def get_batch(self):
+        """
+        :return: list of PendingRequest, empty if no question arrived within a second
+        """
+        try:
+            batch = [self.requests.get(timeout=1.0)]
+        except queue.Empty:
+            return list()
+        deadline = time.perf_counter() + self.batch_window
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                batch.append(self.requests.get(timeout=remaining) if remaining > 0 else self.requests.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def run(self):
+        while self.running:
+            batch = self.get_batch()
+            if batch:
+                self.link_batch(batch)
+
+    def link_batch(self, batch):
+        start = time.perf_counter()
+        try:
+            predictions = self.service.process_batch([(request.question_text, request.amr_graph) for request in batch])
+        except Exception as ex:
+            if len(batch) == 1:
+                batch[0].resolve(error=ex)
+                return
+            # a single malformed question fails the whole batch, the two halves are linked separately to isolate it
+            logger.warning("WARNING: batch of %d questions failed (%s), linking its halves separately", len(batch), ex)
+            middle = len(batch) // 2
+            self.link_batch(batch[:middle])
+            self.link_batch(batch[middle:])
+            return
+        finally:
+            # the spans and captures of a long-running service are not exported, they would only accumulate
+            self.service.tracer.clear()
+            if self.service.score_capture is not None:
+                self.service.score_capture.drain()
+
+        for request, relations in zip(batch, predictions):
+            request.resolve(relations=relations)
+        logger.info("%d questions linked in %.1f ms, %d waiting", len(batch), (time.perf_counter() - start) * 1000,
+                    self.requests.qsize())
+
+    def close(self):
+        self.running = False
+        self.thread.join()
+        while True:
+            try:
+                self.requests.get_nowait().resolve(error=RuntimeError("the service is shutting down"))
+            except queue.Empty:
+                break
+
+
+class RelationLinkingRequestHandler(BaseHTTPRequestHandler):
+    """
+    GET  /health  200 as long as the server is up
+    GET  /ready   200 once the service is loaded, 503 before
+    POST /link    {"text": question text, "extended_amr": EAMR} -> {"relations": [...]}, 400 if they are not strings,
+                  503 with Retry-After if the queue is full, 504 after request_timeout
+    """
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+    def send_json(self, status, body, headers=None):
+        content = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        if self.server.batcher is None:
+            # keep-alive connections accepted while loading would stay with the parent of pre-forked workers
+            self.send_header('Connection', 'close')
+        for name, value in (headers if headers else dict()).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+    def do_GET(self):
+        if self.path == '/health':
+            self.send_json(200, {'status': 'ok'})
+        elif self.path == '/ready':
+            if self.server.batcher is not None:
+                self.send_json(200, {'status': 'ready'})
+            else:
+                self.send_json(503, {'status': 'loading'}, {'Retry-After': '5'})
+        else:
+            self.send_json(404, {'error': 'unknown path {}'.format(self.path)})
+
+    def do_POST(self):
+        try:
+            content = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        except ValueError:
+            self.send_json(411, {'error': 'Content-Length is required'})
+            return
+        if self.path != '/link':
+            self.send_json(404, {'error': 'unknown path {}'.format(self.path)})
+            return
+        batcher = self.server.batcher
+        if batcher is None:
+            self.send_json(503, {'error': 'the service is loading'}, {'Retry-After': '5'})
+            return
+
+        try:
+            question = json.loads(content)
+            question_text, amr_graph = question['text'], question['extended_amr']
+            if not isinstance(question_text, str) or not isinstance(amr_graph, str):
+                raise TypeError('"text" and "extended_amr" must be strings')
+        except (ValueError, TypeError, KeyError):
+            self.send_json(400, {'error': 'expected a JSON object with "text" and "extended_amr"'})
+            return
+
+        try:
+            request = batcher.submit(question_text, amr_graph)
+        except queue.Full:
+            self.send_json(503, {'error': 'too many pending requests'}, {'Retry-After': '1'})
+            return
+
+        if not request.done.wait(self.server.request_timeout):
+            # the question is still linked with its batch, only the response is dropped
+            self.send_json(504, {'error': 'timed out'})
+        elif request.error is not None:
+            self.send_json(500, {'error': str(request.error)})
+        else:
+            self.send_json(200, {'relations': request.relations})
+
+
+class RelationLinkingHTTPServer(ThreadingHTTPServer):
+
+    daemon_threads = True
+
+    def __init__(self, address, request_timeout=60.0):
+        super().__init__(address, RelationLinkingRequestHandler)
+        self.request_timeout = request_timeout
+        # set once the service is loaded, the server answers /health and /ready while loading
+        self.batcher = None
+
+
+def serve(server, service, config):
+    """
+    Serves the requests with the loaded service until SIGTERM or Ctrl-C.
+    """
+    stopped = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopped.set())
+    server.batcher = MicroBatcher(service, config)
+    server_thread = threading.Thread(target=server.serve_forever, name='http-server', daemon=True)
+    server_thread.start()
+    logger.info("process %d ready", os.getpid())
+    try:
+        stopped.wait()
+    except KeyboardInterrupt:
+        pass
+    server.shutdown()
+    server.batcher.close()
+    service.stage_scheduler.close()
+    server.server_close()
+
+
+if __name__ == '__main__':
+    from relation_linking_core.relation_linking_service import KBQARelationLinkingService
+    from relation_linking_core.sparql_cache.sparql_cache import is_shared_by_processes
+    from serving.prefork import PreforkWorkers
+
+    parser = argparse.ArgumentParser(description='serves KBQARelationLinkingService over HTTP, with the concurrent '
+                                                 'requests linked in micro-batches')
+    parser.add_argument('--config_path')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--workers', type=int, default=1,
+                        help='number of worker processes forked after loading the service once, which share its '
+                             'memory copy-on-write')
+    parser.add_argument('--torch_threads', type=int, default=1, help='intra-op torch threads of each worker')
+    parser.add_argument('--memory_report_interval', type=int, default=0,
+                        help='logs the shared and private memory of the workers every N seconds (also on SIGUSR1)')
+    parser.add_argument('--log_level', default='INFO')
+    args = parser.parse_args()
+
+    configure_logging(args.log_level)
+
+    with open(args.config_path) as json_file:
+        config = json.load(json_file)
+
+    # the KG entity module is the only one that queries (and caches) SPARQL results
+    if args.workers > 1 and not is_shared_by_processes(config) and \
+            'kg_entity_recommender_scores' in KBQARelationLinkingService.get_enabled_modules(config):
+        parser.error('--workers > 1 requires "sparql_cache_backend": "sqlite", the workers would overwrite each '
+                     'other\'s entries in the JSON SPARQL cache (see the README to import it once)')
+
+    # the server answers /health and /ready while the service is loading
+    server = RelationLinkingHTTPServer((args.host, args.port), config.get('request_timeout', 60))
+    server_thread = threading.Thread(target=server.serve_forever, name='http-server', daemon=True)
+    server_thread.start()
+    logger.info("listening on %s:%d, loading the service", args.host, args.port)
+
+    if args.workers > 1:
+        PreforkWorkers.prepare_parent()
+
+    # the models and caches are loaded once, all requests (and workers) share the service
+    start = time.perf_counter()
+    service = KBQARelationLinkingService(config)
+    # the relation embeddings and fallback indexes are loaded before serving, not by the first requests
+    service.load_lazy_resources()
+    logger.info("service loaded in %.1f s", time.perf_counter() - start)
+
+    if args.workers > 1:
+        # the parent stops accepting, the connections wait in the listening socket until the workers accept them
+        server.shutdown()
+        workers = PreforkWorkers(args.workers, lambda index: serve(server, service, config), args.torch_threads)
+        workers.start()
+        workers.run(args.memory_report_interval)
+        server.server_close()
+    else:
+        server.shutdown()
+        serve(server, service, config)
@@ -0,0 +1,221 @@
+import gc
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryReport:
+    """
+    Shared and private resident memory of processes, read from /proc/<pid>/smaps_rollup (Linux). The shared pages of
+    the pre-forked workers are the copy-on-write pages of the parent that none of them has written to.
+    """
+
+    fields = ['Rss', 'Pss', 'Shared_Clean', 'Shared_Dirty', 'Private_Clean', 'Private_Dirty']
+
+    @classmethod
+    def get_memory_usage(cls, pid):
+        """
+        :return: dict with rss, pss, shared and private in kB, None if the process is gone
+        """
+        usage = {field: 0 for field in MemoryReport.fields}
+        try:
+            with open('/proc/{}/smaps_rollup'.format(pid)) as smaps_file:
+                for line in smaps_file:
+                    parts = line.split()
+                    if len(parts) >= 2 and parts[0].rstrip(':') in usage:
+                        usage[parts[0].rstrip(':')] = int(parts[1])
+        except (FileNotFoundError, ProcessLookupError):
+            return None
+        return {'rss': usage['Rss'], 'pss': usage['Pss'],
+                'shared': usage['Shared_Clean'] + usage['Shared_Dirty'],
+                'private': usage['Private_Clean'] + usage['Private_Dirty']}
+
+    @classmethod
+    def log(cls, processes):
+        """
+        :param processes: dict of process name -> pid
+        """
+        total_pss, total_rss = 0, 0
+        for name, pid in processes.items():
+            usage = MemoryReport.get_memory_usage(pid)
+            if usage is None:
+                continue
+            total_pss += usage['pss']
+            total_rss += usage['rss']
+            logger.info("%s (pid %d): RSS %.0f MB, shared %.0f MB, private %.0f MB, PSS %.0f MB", name, pid,
+                        usage['rss'] / 1024, usage['shared'] / 1024, usage['private'] / 1024, usage['pss'] / 1024)
+        # the PSS splits each shared page between the processes sharing it, its sum is the memory actually used
+        logger.info("total: PSS %.0f MB (RSS %.0f MB)", total_pss / 1024, total_rss / 1024)
+
+
+class PreforkWorkers:
+    """
+    Forks worker processes from a parent that has loaded the service once. The parent's objects are moved to the
+    permanent generation with gc.freeze before forking, so that the garbage collector of the workers does not write to
+    (and un-share) their pages. The workers are restarted if they die.
+    """
+
+    def __init__(self, worker_count, run_worker, torch_threads=1, torch_interop_threads=1):
+        """
+        :param worker_count: number of worker processes
+        :param run_worker: function of the worker index that serves until the worker is stopped
+        :param torch_threads: intra-op torch threads of each worker
+        :param torch_interop_threads: inter-op torch threads of each worker
+        """
+        self.worker_count = worker_count
+        self.run_worker = run_worker
+        self.torch_threads = torch_threads
+        self.torch_interop_threads = torch_interop_threads
+        self.workers = dict()
+        self.stopped = threading.Event()
+        self.report_requested = threading.Event()
+
+    @classmethod
+    def prepare_parent(cls):
+        """
+        To be called before loading the service: the collections while loading would only move the objects around, and
+        an OpenMP thread pool started by torch in the parent does not survive the fork, so the parent uses one thread.
+        CUDA can not be used in forked processes either, so the GPUs are hidden and the models are loaded on the CPU.
+        """
+        gc.disable()
+        # read by torch when CUDA is first initialized, torch.cuda.is_available() is then False
+        os.environ['CUDA_VISIBLE_DEVICES'] = ''
+        PreforkWorkers.set_torch_threads(1, None)
+
+    @classmethod
+    def check_cuda_not_initialized(cls):
+        """
+        :raise RuntimeError: if the parent has initialized CUDA, the workers would fail on their first request
+        """
+        torch = sys.modules.get('torch')
+        if torch is not None and torch.cuda.is_initialized():
+            raise RuntimeError("CUDA is initialized in the parent process, it can not be used by forked workers "
+                               "(call PreforkWorkers.prepare_parent before loading the service)")
+
+    def start(self):
+        PreforkWorkers.check_cuda_not_initialized()
+        gc.collect()
+        gc.freeze()
+        logger.info("%d objects frozen, forking %d workers", gc.get_freeze_count(), self.worker_count)
+        for index in range(self.worker_count):
+            self.spawn(index)
+
+    def spawn(self, index):
+        pid = os.fork()
+        if pid > 0:
+            self.workers[pid] = index
+            return
+
+        # worker process, it never returns to the caller
+        exit_code = 0
+        try:
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            signal.signal(signal.SIGUSR1, signal.SIG_DFL)
+            gc.enable()
+            PreforkWorkers.set_torch_threads(self.torch_threads, self.torch_interop_threads)
+            self.run_worker(index)
+        except Exception:
+            logger.exception("ERROR - worker %d failed", index)
+            exit_code = 1
+        finally:
+            logging.shutdown()
+            os._exit(exit_code)
+
+    def run(self, report_interval=0):
+        """
+        Waits for the workers until SIGTERM, SIGINT or Ctrl-C, restarting the workers that die. The memory report is
+        logged once all workers are started, every report_interval seconds if > 0, and on SIGUSR1.
+        """
+        signal.signal(signal.SIGTERM, lambda signum, frame: self.stopped.set())
+        signal.signal(signal.SIGUSR1, lambda signum, frame: self.report_requested.set())
+        self.report_requested.set()
+        last_report = time.monotonic()
+        try:
+            while not self.stopped.is_set():
+                self.reap(restart=True)
+                if self.report_requested.is_set() or \
+                        (report_interval > 0 and time.monotonic() - last_report >= report_interval):
+                    self.report_requested.clear()
+                    last_report = time.monotonic()
+                    try:
+                        self.log_memory_report()
+                    except Exception:
+                        logger.exception("ERROR - memory report failed")
+                self.stopped.wait(1.0)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            # also if the supervisor loop fails, the workers must not be left running without it
+            self.stop()
+
+    def reap(self, restart=False):
+        while self.workers:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+            if pid == 0:
+                return
+            index = self.workers.pop(pid, None)
+            if index is None:
+                continue
+            if restart and not self.stopped.is_set():
+                try:
+                    logger.warning("WARNING: worker %d (pid %d) %s, restarting it", index, pid,
+                                   PreforkWorkers.describe_status(status))
+                finally:
+                    self.spawn(index)
+
+    @classmethod
+    def describe_status(cls, status):
+        """
+        :param status: exit status returned by os.waitpid
+        """
+        if os.WIFSIGNALED(status):
+            return "was killed by signal {}".format(os.WTERMSIG(status))
+        if os.WIFEXITED(status):
+            return "exited with code {}".format(os.WEXITSTATUS(status))
+        return "exited with status {}".format(status)
+
+    def stop(self, timeout=30):
+        logger.info("stopping %d workers", len(self.workers))
+        for pid in self.workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        deadline = time.monotonic() + timeout
+        while self.workers and time.monotonic() < deadline:
+            self.reap()
+            time.sleep(0.1)
+        for pid in self.workers:
+            logger.warning("WARNING: worker %d (pid %d) did not stop, killing it", self.workers[pid], pid)
+            os.kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+        self.workers.clear()
+
+    def log_memory_report(self):
+        processes = {'parent': os.getpid()}
+        for pid, index in sorted(self.workers.items(), key=lambda item: item[1]):
+            processes['worker {}'.format(index)] = pid
+        MemoryReport.log(processes)
+
+    @classmethod
+    def set_torch_threads(cls, threads, interop_threads):
+        """
+        Sets the torch threads of the current process, if torch is installed.
+        """
+        try:
+            import torch
+        except ImportError:
+            return
+        if threads:
+            torch.set_num_threads(threads)
+        if interop_threads:
+            try:
+                torch.set_num_interop_threads(interop_threads)
+            except RuntimeError as ex:
+                # the inter-op pool can only be configured before it is started
+                logger.warning("WARNING: torch inter-op threads could not be set to %d\n\t%s", interop_threads, ex)
@@ -0,0 +1,117 @@
+import hashlib
+import json
+import os
+import random
+import sys
+from collections import Counter
+
+import pytest
+
+SLING_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC_DIR = os.path.join(SLING_DIR, 'src')
+# the modules are imported as in src, e.g., relation_linking_core.relation_linking_service
+sys.path.insert(0, SRC_DIR)
+
+from relation_linking_core.metadata_generator.amr_graph_to_triples import AMR2Triples  # noqa: E402
+from relation_linking_core.metadata_generator.lemma_cache import LemmaCache  # noqa: E402
+from relation_linking_core.rel_linker_modules.rel_linker_module import RelModule  # noqa: E402
+
+RELATIONS = ['dbo:publisher', 'dbo:director', 'dbo:writer', 'dbo:birthPlace', 'dbp:birthPlace', 'dbo:starring',
+             'dbo:author', 'dbo:country', 'dbp:country', 'dbo:population', 'dbo:spouse', 'dbo:child', 'dbo:capital',
+             'dbo:language', 'dbo:leader', 'dbp:leaderName', 'dbo:founder', 'dbo:location', 'dbo:team', 'dbo:owner']
+
+
+class SuffixLemmatizer:
+    """
+    Stands in for the WordNet lemmatizer, whose corpus may not be downloaded.
+    """
+
+    def lemmatize(self, word):
+        return word[:-1] if word.endswith('s') and len(word) > 3 else word
+
+
+class FakeRelModule(RelModule):
+    """
+    Scores a few relations per triple, derived from a hash of the triple so that the scores are deterministic. The
+    scores are rounded to one decimal to have ties.
+    """
+
+    def __init__(self, name):
+        super().__init__(None)
+        self.name = name
+
+    def get_relation_candidates(self, triple_data, params=None):
+        seed = '|'.join([self.name, triple_data['text'], triple_data['subj_text'], triple_data['predicate'],
+                         triple_data['obj_text']])
+        rnd = random.Random(hashlib.md5(seed.encode('utf-8')).hexdigest())
+        relations = sorted(params['listOfRelations']) if params and 'listOfRelations' in params else RELATIONS
+        return Counter({rel: round(rnd.random(), 1) for rel in rnd.sample(relations, min(4, len(relations)))})
+
+
+def load_questions(dataset='qald_9', limit=60):
+    """
+    :return: list of (question text, EAMR) of the first questions of data/input/<dataset>.json
+    """
+    with open(os.path.join(SLING_DIR, 'data', 'input', '{}.json'.format(dataset))) as json_file:
+        questions = json.load(json_file)
+    return [(question['text'], question['extended_amr']) for question in list(questions.values())[:limit]]
+
+
+class Stopwords:
+    """
+    Stands in for the NLTK stopwords corpus, which may not be downloaded.
+    """
+
+    def words(self, language):
+        return ['a', 'an', 'the', 'of', 'in', 'is', 'was', 'who', 'what', 'which', 'by', 'to', 'did', 'does']
+
+
+@pytest.fixture
+def stopwords(monkeypatch):
+    import nltk
+    monkeypatch.setattr(nltk.corpus, 'stopwords', Stopwords())
+
+
+@pytest.fixture
+def lemmatizer(monkeypatch):
+    monkeypatch.setattr(AMR2Triples, 'lemmatizer', LemmaCache(SuffixLemmatizer()))
+
+
+@pytest.fixture
+def make_service(monkeypatch, tmp_path, lemmatizer):
+    """
+    Builds KBQARelationLinkingService with the contextual relations and answer types of data, and hash based fake
+    modules instead of the KG entity, statistical, neural and similarity based modules, which need external models
+    and a SPARQL endpoint.
+    :return: function of the config overrides that returns the service
+    """
+    from relation_linking_core.relation_linking_service import KBQARelationLinkingService
+
+    # the data paths are relative to src
+    monkeypatch.chdir(SRC_DIR)
+    predicate_map_path = tmp_path / 'predicate_map.tsv'
+    predicate_map_path.write_text(''.join(['{}\t{}\n'.format(rel.replace('dbo:', 'http://dbpedia.org/ontology/')
+                                                             .replace('dbp:', 'http://dbpedia.org/property/'),
+                                                             rel.split(':')[1]) for rel in RELATIONS]))
+    fake_modules = {'kb_entity_based_linking': 'kg_entity_recommender_scores',
+                    'statistical_mapping_module': 'statistical_rel_mapping_scores',
+                    'neural_relation_linking': 'neural_model_scores',
+                    'similarity_based_relation_linking': 'similarity_based_scores'}
+    services = list()
+
+    def make(overrides=None):
+        with open(os.path.join(SLING_DIR, 'config', 'qald9_config.json')) as json_file:
+            module_weights = json.load(json_file)['module_weights']
+        config = {'module_weights': module_weights, 'predicate_map': str(predicate_map_path),
+                  'disabled_modules': list(fake_modules.values())}
+        config.update(overrides if overrides else dict())
+        service = KBQARelationLinkingService(config)
+        for attribute, name in fake_modules.items():
+            setattr(service, attribute, FakeRelModule(name))
+        service.enabled_modules = set(KBQARelationLinkingService.relation_linking_modules)
+        services.append(service)
+        return service
+
+    yield make
+    for service in services:
+        service.stage_scheduler.close()
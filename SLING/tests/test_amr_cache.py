@@ -0,0 +1,47 @@
+from conftest import load_questions
+from relation_linking_core.metadata_generator.amr_cache import AMRCache
+
+
+def test_cached_linking_matches_uncached(make_service):
+    questions = load_questions()
+    expected = make_service({'amr_cache_size': 0}).process_batch(questions)
+    service = make_service()
+    assert service.process_batch(questions) == expected
+    assert service.amr_cache.hits == 0
+    # the second pass takes the triples from the cache, which are not modified by linking them the first time
+    assert service.process_batch(questions) == expected
+    assert service.amr_cache.hits == len(questions)
+
+
+def test_disk_cache_is_shared(make_service, tmp_path):
+    questions = load_questions(limit=20)
+    expected = make_service({'amr_cache_size': 0}).process_batch(questions)
+    cache_dir = str(tmp_path / 'amr_cache')
+    assert make_service({'amr_cache_size': 0, 'amr_cache_dir': cache_dir}).process_batch(questions) == expected
+    service = make_service({'amr_cache_dir': cache_dir})
+    assert service.process_batch(questions) == expected
+    assert service.amr_cache.hits == len(questions) and service.amr_cache.misses == 0
+
+
+def test_cache_entries():
+    amr_cache = AMRCache(max_size=2)
+    key = AMRCache.get_key('Who wrote it?', '(w / write-01)')
+    assert AMRCache.get_key('Who wrote it?', '\n(w / write-01)  \n') == key
+    assert AMRCache.get_key('Who wrote it?', '(w / write-01)', None) == key
+    assert AMRCache.get_key('Who wrote it?', '(w / write-01)', 'annotations.json') != key
+    assert AMRCache.get_key('Who wrote this?', '(w / write-01)') != key
+
+    value = {'triple_info': [{'subj_text': 'it'}]}
+    amr_cache.put(key, value)
+    cached = amr_cache.get(key)
+    assert cached == value
+    # the callers get a copy
+    cached['triple_info'][0]['subj_text'] = 'changed'
+    assert amr_cache.get(key) == value
+
+    # least recently used entries are evicted
+    amr_cache.put('a', 1)
+    amr_cache.get(key)
+    amr_cache.put('b', 2)
+    assert amr_cache.get('a') is None
+    assert amr_cache.get(key) == value and amr_cache.get('b') == 2
@@ -0,0 +1,31 @@
+from relation_linking_core.metadata_generator.amr_graph_to_triples import AMR2Triples
+
+
+class ClearedMemo(dict):
+    """
+    A memo that another thread clears right after each insert.
+    """
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.clear()
+
+
+def test_memo_cleared_by_another_thread(monkeypatch):
+    for memo in ['op_positions', 'arg_roles', 'frame_names']:
+        monkeypatch.setattr(AMR2Triples, memo, ClearedMemo())
+    assert AMR2Triples.get_frame_name('play-01') == 'play-'
+    assert AMR2Triples.get_frame_name('person') is None
+    assert AMR2Triples.get_op_position('op2') == 2
+    assert AMR2Triples.get_op_position('mod') is None
+    assert AMR2Triples.is_arg_role('ARG1')
+    assert not AMR2Triples.is_arg_role('name')
+
+
+def test_memo_is_bounded(monkeypatch):
+    monkeypatch.setattr(AMR2Triples, 'max_memoized_values', 3)
+    monkeypatch.setattr(AMR2Triples, 'frame_names', dict())
+    for index in range(10):
+        assert AMR2Triples.get_frame_name('play-{:02d}'.format(index)) == 'play-'
+        assert len(AMR2Triples.frame_names) <= 3
+    assert AMR2Triples.get_frame_name('play-09') == 'play-'
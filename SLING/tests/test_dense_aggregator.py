@@ -0,0 +1,61 @@
+import hashlib
+from collections import Counter
+
+from conftest import FakeRelModule, load_questions
+
+# the neural model scores have weight 0, but the module stays enabled in the fake service
+MODULE_WEIGHTS = {'kg_entity_recommender_scores': 1, 'contextual_rel_recommender_scores': 0.5,
+                  'statistical_rel_mapping_scores': 2, 'neural_model_scores': 0, 'similarity_based_scores': 1.5}
+
+
+class SparseFakeRelModule(FakeRelModule):
+    """
+    Returns no relations for about half of the triples.
+    """
+
+    def get_relation_candidates(self, triple_data, params=None):
+        seed = '|'.join([self.name, triple_data['subj_text'], triple_data['predicate'], triple_data['obj_text']])
+        if int(hashlib.md5(seed.encode('utf-8')).hexdigest(), 16) % 2 == 0:
+            return Counter()
+        return super().get_relation_candidates(triple_data, params)
+
+
+def link_and_record(make_service, aggregator):
+    """
+    :return: (predictions, list of the (scores_dict, ordered aggregated relation scores) of each aggregate call)
+    """
+    service = make_service({'amr_cache_size': 0, 'aggregator': aggregator, 'module_weights': MODULE_WEIGHTS})
+    service.statistical_mapping_module = SparseFakeRelModule('statistical_rel_mapping_scores')
+    service.similarity_based_relation_linking = SparseFakeRelModule('similarity_based_scores')
+    calls = list()
+    aggregate = service.aggregator.aggregate
+
+    def recording_aggregate(scores_dict, params=None):
+        relations_with_scores = aggregate(scores_dict, params)
+        calls.append((scores_dict, list(relations_with_scores.items())))
+        return relations_with_scores
+
+    service.aggregator.aggregate = recording_aggregate
+    return service.process_batch(load_questions()), calls
+
+
+def test_dense_aggregator_matches_simple_aggregator(make_service):
+    expected_predictions, expected_calls = link_and_record(make_service, 'simple')
+    predictions, calls = link_and_record(make_service, 'dense')
+
+    # the batch covers the cases the dense aggregator handles separately
+    scores_dicts = [scores_dict for scores_dict, _ in expected_calls]
+    # relations scored only by the module with weight 0 are kept, with a score of 0
+    assert any(set(scores_dict['neural_model_scores']) - set().union(*[scores_dict[module] for module in scores_dict
+                                                                       if module != 'neural_model_scores'])
+               for scores_dict in scores_dicts)
+    assert any(not scores_dict['statistical_rel_mapping_scores'] for scores_dict in scores_dicts)
+    assert any(not scores_dict['similarity_based_scores'] for scores_dict in scores_dicts)
+    # aggregate is called for the direct and then for the inverse direction of each triple
+    assert any(set(direct['kg_entity_recommender_scores']) & set(inverse['kg_entity_recommender_scores'])
+               for direct, inverse in zip(scores_dicts[::2], scores_dicts[1::2]))
+
+    assert len(calls) == len(expected_calls)
+    for (_, relations_with_scores), (_, expected_relations_with_scores) in zip(calls, expected_calls):
+        assert relations_with_scores == expected_relations_with_scores
+    assert predictions == expected_predictions
@@ -0,0 +1,101 @@
+import difflib
+import json
+import random
+
+import pytest
+
+from conftest import load_questions
+from relation_linking_core.metadata_generator.amr_graph_to_triples import AMR2Triples
+from relation_linking_core.metadata_generator.amr_utils import AMRUtils
+from relation_linking_core.metadata_generator.entity_utils import EntityUtils
+
+
+def get_close_match(term, candidates, cutoff):
+    close_matches = difflib.get_close_matches(term, candidates, 1, cutoff)
+    return close_matches[0] if close_matches else None
+
+
+def get_amr_nodes(question_text, amr_graph):
+    triple_info, _, _, _ = AMR2Triples.get_flat_triples(question_text, AMRUtils.fix_amr_graph(amr_graph))
+    amr_nodes = set()
+    for triple in triple_info:
+        amr_nodes.update({triple['subj_text'].lower(), triple['subj_type'].lower(), triple['obj_text'].lower(),
+                          triple['obj_type'].lower()})
+    return amr_nodes
+
+
+def test_get_close_match_matches_difflib():
+    rnd = random.Random(0)
+    words = ['ab', 'abc', 'bca', 'cab', 'abcd', 'dcba', 'person', 'persona', 'company', 'companies', 'film', 'films',
+             'country', 'county', 'a', '']
+    for _ in range(3000):
+        candidates = rnd.sample(words, rnd.randint(0, 8))
+        if rnd.random() < 0.5:
+            # random strings over a small alphabet, with many ties
+            candidates += [''.join(rnd.choice('abcd') for _ in range(rnd.randint(0, 6))) for _ in range(5)]
+        term = rnd.choice(words + [''.join(rnd.choice('abcd') for _ in range(rnd.randint(0, 6)))])
+        for cutoff in [0.0, 0.2, 0.6, 1.0]:
+            assert EntityUtils.get_close_match(term, candidates, cutoff) == get_close_match(term, candidates, cutoff)
+
+
+def test_annotated_alignment(lemmatizer, tmp_path, monkeypatch):
+    questions = load_questions(limit=30)
+    annotated, unannotated = questions[:20], questions[20:]
+    annotations = list()
+    for question_text, amr_graph in annotated:
+        entities = EntityUtils.get_entities(AMRUtils.fix_amr_graph(amr_graph))
+        annotations.append({'question': question_text,
+                            'entity mapping': [{'label': surface_form, 'uri': entity['uri']}
+                                               for surface_form, entity in entities.items()],
+                            'predicate mapping': [{'label': 'person', 'uri': 'http://dbpedia.org/ontology/Person'},
+                                                  {'label': 'wrote', 'uri': 'http://dbpedia.org/ontology/author'}]})
+    annotation_path = str(tmp_path / 'annotations.json')
+    with open(annotation_path, 'w') as json_file:
+        json.dump(annotations, json_file)
+
+    loads = list()
+    load_entity_annotation_map = EntityUtils.load_entity_annotation_map
+    monkeypatch.setattr(EntityUtils, 'entity_annotation_maps', dict())
+    monkeypatch.setattr(EntityUtils, 'load_entity_annotation_map',
+                        lambda path: loads.append(path) or load_entity_annotation_map(path))
+
+    entity_map = EntityUtils.get_entity_annotation_map(annotation_path)
+    for question_text, amr_graph in annotated:
+        amr_nodes = get_amr_nodes(question_text, amr_graph)
+        entities = EntityUtils.get_entities(AMRUtils.fix_amr_graph(amr_graph))
+        # the closest AMR node of each annotated entity, as with difflib before
+        expected_alignments, expected_surface_forms = dict(), dict()
+        amr_nodes_copy = list(amr_nodes)
+        for entity, uri in entity_map[question_text].items():
+            close_match = get_close_match(entity, amr_nodes_copy, 0.2)
+            if close_match:
+                expected_alignments[close_match] = uri
+                expected_surface_forms[close_match] = entity
+                amr_nodes_copy.remove(close_match)
+        assert EntityUtils.align_entities_annotated(question_text, amr_nodes, entities, annotation_path) == \
+            (expected_alignments, expected_surface_forms)
+    assert 'http://dbpedia.org/ontology/Person' in entity_map[annotated[0][0]].values()
+    assert 'http://dbpedia.org/ontology/author' not in entity_map[annotated[0][0]].values()
+
+    # the questions that are not annotated are aligned with the EAMR entities
+    for question_text, amr_graph in unannotated:
+        amr_nodes = get_amr_nodes(question_text, amr_graph)
+        entities = EntityUtils.get_entities(AMRUtils.fix_amr_graph(amr_graph))
+        assert EntityUtils.align_entities_annotated(question_text, amr_nodes, entities, annotation_path) == \
+            EntityUtils.align_entities(amr_nodes, entities)
+
+    # the file is loaded once
+    assert loads == [annotation_path]
+
+
+def test_annotated_alignment_without_path(lemmatizer):
+    question_text, amr_graph = load_questions(limit=1)[0]
+    amr_nodes = get_amr_nodes(question_text, amr_graph)
+    entities = EntityUtils.get_entities(AMRUtils.fix_amr_graph(amr_graph))
+    with pytest.raises(ValueError, match='entity_annotation_path'):
+        EntityUtils.align_entities_annotated(question_text, amr_nodes, entities, None)
+
+
+def test_service_with_missing_annotation_file(make_service, tmp_path):
+    with pytest.raises(ValueError, match='entity_annotation_path'):
+        make_service({'entity_annotation_path': str(tmp_path / 'annotations.json')})
@@ -0,0 +1,149 @@
+import http.client
+import json
+import threading
+
+import pytest
+
+from serving.http_server import MicroBatcher, RelationLinkingHTTPServer
+
+
+class FakeTracer:
+
+    def clear(self):
+        pass
+
+
+class FakeService:
+    """
+    Links each question to [question text] and records the batches. Fails the batches with the question 'bad', and
+    blocks while the gate is closed.
+    """
+
+    def __init__(self):
+        self.tracer = FakeTracer()
+        self.score_capture = None
+        self.batches = list()
+        self.started = threading.Event()
+        self.gate = threading.Event()
+        self.gate.set()
+
+    def process_batch(self, questions):
+        self.started.set()
+        self.gate.wait(10)
+        question_texts = [question_text for question_text, _ in questions]
+        self.batches.append(question_texts)
+        if 'bad' in question_texts:
+            raise ValueError('malformed EAMR')
+        return [[question_text] for question_text in question_texts]
+
+
+@pytest.fixture
+def make_batcher():
+    batchers = list()
+
+    def make(service, config):
+        batcher = MicroBatcher(service, config)
+        batchers.append(batcher)
+        return batcher
+
+    yield make
+    for batcher in batchers:
+        batcher.close()
+
+
+@pytest.fixture
+def server(make_batcher):
+    server = RelationLinkingHTTPServer(('127.0.0.1', 0), request_timeout=0.2)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def post(server, body):
+    connection = http.client.HTTPConnection(*server.server_address, timeout=10)
+    try:
+        connection.request('POST', '/link', json.dumps(body))
+        response = connection.getresponse()
+        return response.status, dict(response.getheaders()), json.loads(response.read())
+    finally:
+        connection.close()
+
+
+def wait_all(requests):
+    for request in requests:
+        assert request.done.wait(10)
+
+
+def test_questions_within_the_window_are_linked_together(make_batcher):
+    service = FakeService()
+    batcher = make_batcher(service, {'batch_window_ms': 500, 'max_batch_size': 16})
+    requests = [batcher.submit('q{}'.format(index), 'eamr') for index in range(5)]
+    wait_all(requests)
+    assert service.batches == [['q0', 'q1', 'q2', 'q3', 'q4']]
+    assert [request.relations for request in requests] == [['q0'], ['q1'], ['q2'], ['q3'], ['q4']]
+
+
+def test_batches_are_closed_at_max_batch_size(make_batcher):
+    service = FakeService()
+    batcher = make_batcher(service, {'batch_window_ms': 1000, 'max_batch_size': 2})
+    requests = [batcher.submit('q{}'.format(index), 'eamr') for index in range(5)]
+    wait_all(requests[:4])
+    assert service.batches == [['q0', 'q1'], ['q2', 'q3']]
+    # the last batch waits for the end of its window
+    wait_all(requests)
+    assert service.batches[2:] == [['q4']]
+
+
+def test_the_failing_question_is_isolated(make_batcher):
+    service = FakeService()
+    batcher = make_batcher(service, {'batch_window_ms': 500, 'max_batch_size': 8})
+    question_texts = ['q0', 'q1', 'q2', 'q3', 'q4', 'bad', 'q6', 'q7']
+    requests = [batcher.submit(question_text, 'eamr') for question_text in question_texts]
+    wait_all(requests)
+    for request in requests:
+        if request.question_text == 'bad':
+            assert isinstance(request.error, ValueError)
+        else:
+            assert request.error is None and request.relations == [request.question_text]
+    # the halves of the failing batches, instead of the 8 questions one by one
+    assert service.batches == [question_texts, ['q0', 'q1', 'q2', 'q3'], ['q4', 'bad', 'q6', 'q7'], ['q4', 'bad'],
+                               ['q4'], ['bad'], ['q6', 'q7']]
+
+
+def test_post_link(server, make_batcher):
+    server.batcher = make_batcher(FakeService(), {'batch_window_ms': 1})
+    status, _, body = post(server, {'text': 'q0', 'extended_amr': 'eamr'})
+    assert (status, body) == (200, {'relations': ['q0']})
+    status, _, body = post(server, {'text': 'bad', 'extended_amr': 'eamr'})
+    assert (status, body) == (500, {'error': 'malformed EAMR'})
+    # rejected before they reach a batch
+    for question in [{'text': 'q0'}, {'text': 'q0', 'extended_amr': {'op1': 'eamr'}}, ['q0', 'eamr']]:
+        assert post(server, question)[0] == 400
+
+
+def test_post_link_when_the_queue_is_full(server, make_batcher):
+    service = FakeService()
+    service.gate.clear()
+    server.batcher = make_batcher(service, {'batch_window_ms': 1, 'max_batch_size': 1, 'max_queue_size': 1})
+    linked = server.batcher.submit('q0', 'eamr')
+    assert service.started.wait(10)
+    # q0 is being linked, q1 waits in the queue
+    waiting = server.batcher.submit('q1', 'eamr')
+    status, headers, _ = post(server, {'text': 'q2', 'extended_amr': 'eamr'})
+    assert status == 503 and headers['Retry-After'] == '1'
+    service.gate.set()
+    wait_all([linked, waiting])
+    assert post(server, {'text': 'q2', 'extended_amr': 'eamr'})[0] == 200
+
+
+def test_post_link_timeout(server, make_batcher):
+    service = FakeService()
+    service.gate.clear()
+    server.batcher = make_batcher(service, {'batch_window_ms': 1})
+    status, _, body = post(server, {'text': 'q0', 'extended_amr': 'eamr'})
+    assert (status, body) == (504, {'error': 'timed out'})
+    # the question is still linked
+    service.gate.set()
+    assert post(server, {'text': 'q1', 'extended_amr': 'eamr'})[0] == 200
+    assert service.batches == [['q0'], ['q1']]
@@ -0,0 +1,142 @@
+import json
+import os
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from conftest import SLING_DIR
+from relation_linking_core.rel_linker_modules.kg_entity_based_recommender import KBEntityBasedRecommender
+
+rdflib = pytest.importorskip('rdflib')
+
+KG = """
+@prefix dbo: <http://dbpedia.org/ontology/> .
+@prefix dbr: <http://dbpedia.org/resource/> .
+@prefix rdfs: <http://www.w3.org/2000/01/rdf-schema#> .
+dbr:The_Hobbit a dbo:Book ; dbo:author dbr:Tolkien ; dbo:publisher dbr:Allen_Unwin ; dbo:wikiPageID 1 ;
+    rdfs:label "The Hobbit" .
+dbr:The_Silmarillion a dbo:Book ; dbo:author dbr:Tolkien .
+dbr:Tolkien a dbo:Writer ; dbo:birthPlace dbr:Bloemfontein ; dbo:birthDate "1892-01-03" .
+"""
+
+DBR = 'http://dbpedia.org/resource/'
+
+
+class StubSparqlHandler(BaseHTTPRequestHandler):
+    """
+    Answers the SPARQL queries over a small RDF graph with rdflib.
+    """
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def reply(self, query):
+        # rdflib graphs are not thread safe
+        with self.server.lock:
+            self.server.queries.append(query)
+            body = self.server.graph.query(query).serialize(format='json')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/sparql-results+json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self.reply(parse_qs(urlparse(self.path).query)['query'][0])
+
+    def do_POST(self):
+        self.reply(parse_qs(self.rfile.read(int(self.headers['Content-Length'])).decode('utf-8'))['query'][0])
+
+
+@pytest.fixture
+def endpoint():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubSparqlHandler)
+    server.daemon_threads = True
+    server.graph = rdflib.Graph().parse(data=KG, format='turtle')
+    server.queries = list()
+    server.lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def make_recommender(endpoint, tmp_path):
+    recommenders = list()
+
+    def make(name, values_batch_size=50):
+        cache_path = str(tmp_path / '{}.json'.format(name))
+        with open(cache_path, 'w') as cache_file:
+            json.dump(dict(), cache_file)
+        recommender = KBEntityBasedRecommender({
+            'dbpedia_endpoint': 'http://127.0.0.1:{}/sparql'.format(endpoint.server_address[1]),
+            'sparql_cache_path': cache_path, 'sparql_values_batch_size': values_batch_size,
+            'datatype_rels_path': os.path.join(SLING_DIR, 'data', 'datatype_relations.pkl')})
+        recommenders.append(recommender)
+        return recommender
+
+    yield make
+    for recommender in recommenders:
+        recommender.sparql_client.close()
+
+
+def make_triple(subj_uri=None, subj_type_uri=None, obj_uri=None, obj_type_uri=None, answer_datatype=None):
+    triple = {'subj_text': 'subject', 'subj_type': '', 'subj_uri': subj_uri, 'subj_type_uri': subj_type_uri,
+              'obj_text': 'object', 'obj_type': '', 'obj_uri': obj_uri, 'obj_type_uri': obj_type_uri,
+              'subj_id': 's', 'obj_id': 'o', 'amr_unknown_var': 'o'}
+    if answer_datatype:
+        triple['answer_datatype'] = answer_datatype
+    return triple
+
+
+TRIPLES = [
+    # who wrote the Hobbit: the relations of the Hobbit, those to a writer have a weight of 2
+    make_triple(subj_uri=DBR + 'The_Hobbit', obj_type_uri='dbo:Writer'),
+    # the books of Tolkien
+    make_triple(subj_type_uri='dbo:Book', obj_uri=DBR + 'Tolkien'),
+    # when was Tolkien born: the date relations of Tolkien have a weight of 2
+    make_triple(subj_uri=DBR + 'Tolkien', answer_datatype='DATE'),
+    # no entity
+    make_triple(),
+    # the same entity again
+    make_triple(subj_uri=DBR + 'The_Hobbit', obj_type_uri='dbo:Writer'),
+]
+
+EXPECTED_SCORES = [
+    Counter({'dbo:author': 2, 'dbo:publisher': 1}),
+    Counter({'dbo:author': 2}),
+    Counter({'dbo:birthDate': 2, 'dbo:birthPlace': 1}),
+    Counter(),
+    Counter({'dbo:author': 2, 'dbo:publisher': 1}),
+]
+
+
+@pytest.mark.parametrize('values_batch_size', [0, 1, 50])
+def test_batch_matches_the_triples_one_by_one(make_recommender, endpoint, values_batch_size):
+    batch_scores = make_recommender('batch', values_batch_size).get_relation_candidates_batch(TRIPLES)
+    assert batch_scores == EXPECTED_SCORES
+    batch_queries = list(endpoint.queries)
+    if values_batch_size > 0:
+        assert any('VALUES ?entity' in query for query in batch_queries)
+
+    endpoint.queries.clear()
+    recommender = make_recommender('one_by_one')
+    scores = [recommender.get_relation_candidates(triple_data) for triple_data in TRIPLES]
+    assert [list(triple_scores.items()) for triple_scores in scores] == \
+        [list(triple_scores.items()) for triple_scores in batch_scores]
+    # the batch sends each query once
+    assert len(set(batch_queries)) == len(batch_queries)
+
+
+def test_batch_uses_the_cache(make_recommender, endpoint):
+    recommender = make_recommender('batch')
+    recommender.get_relation_candidates_batch(TRIPLES)
+    endpoint.queries.clear()
+    assert recommender.get_relation_candidates_batch(TRIPLES) == EXPECTED_SCORES
+    assert endpoint.queries == list()
@@ -0,0 +1,42 @@
+import json
+
+from conftest import SuffixLemmatizer
+from relation_linking_core.metadata_generator.lemma_cache import LemmaCache
+
+
+class CountingLemmatizer(SuffixLemmatizer):
+
+    def __init__(self):
+        self.tokens = list()
+
+    def lemmatize(self, word):
+        self.tokens.append(word)
+        return super().lemmatize(word)
+
+
+def test_prefetch_without_cache_does_not_lemmatize():
+    lemmatizer = CountingLemmatizer()
+    lemma_cache = LemmaCache(lemmatizer, max_size=0)
+    assert not lemma_cache.prefetch(['books', 'written', 'books'])
+    assert lemmatizer.tokens == list()
+    assert lemma_cache.lemmatize_many(['books', 'written']) == ['book', 'written']
+    assert lemmatizer.tokens == ['books', 'written']
+
+
+def test_prefetch_when_the_tokens_do_not_fit():
+    lemmatizer = CountingLemmatizer()
+    lemma_cache = LemmaCache(lemmatizer, max_size=2)
+    assert not lemma_cache.prefetch(['books', 'written', 'authors'])
+    assert lemmatizer.tokens == list()
+
+
+def test_prefetch(tmp_path):
+    lemma_table_path = tmp_path / 'lemmas.json'
+    lemma_table_path.write_text(json.dumps({'written': 'write'}))
+    lemmatizer = CountingLemmatizer()
+    # the tokens of the lemma table do not need a place in the cache
+    lemma_cache = LemmaCache(lemmatizer, max_size=2, lemma_table_path=str(lemma_table_path))
+    assert lemma_cache.prefetch(['books', 'written', 'authors', 'books'])
+    assert lemmatizer.tokens == ['books', 'authors']
+    assert [lemma_cache.lemmatize(token) for token in ['authors', 'written', 'books']] == ['author', 'write', 'book']
+    assert lemmatizer.tokens == ['books', 'authors']
@@ -0,0 +1,64 @@
+from collections import Counter
+
+import pytest
+
+from relation_linking_core.rel_linker_modules.neural_relation_linking import NeuralRelationLinking
+
+
+class FakeRankingModel:
+    """
+    Ranks two relations by the positions of the head and the tail, and records the batches it is called with.
+    """
+
+    def __init__(self):
+        self.r_hiddens = 'loaded'
+        self.batches = list()
+
+    def infer_ranking_batch(self, items, k=None, batch_size=32):
+        self.batches.append(items)
+        return [[('dbo:author', item['h']['pos'][0] / 100 + 0.5), ('dbo:writer', item['t']['pos'][0] / 100)][:k]
+                for item in items]
+
+
+def make_triple(text, subj_text, obj_text, subj_id='a', obj_id='b', amr_unknown_var='a'):
+    return {'text': text, 'subj_text': subj_text, 'subj_type': '', 'obj_text': obj_text, 'obj_type': '',
+            'subj_id': subj_id, 'obj_id': obj_id, 'amr_unknown_var': amr_unknown_var}
+
+
+@pytest.fixture
+def neural_relation_linking():
+    module = NeuralRelationLinking.__new__(NeuralRelationLinking)
+    module.neural_model = FakeRankingModel()
+    module.batch_size = 2
+    module.top_k = 10
+    return module
+
+
+def test_batch_matches_the_triples_one_by_one(neural_relation_linking):
+    triples = [make_triple('Who wrote the Hobbit?', 'amr-unknown', 'hobbit'),
+               make_triple('Who wrote the Hobbit?', 'hobbit', 'amr-unknown', amr_unknown_var='b'),
+               # no position for the tail, the triple is not sent to the model
+               make_triple('Who wrote the Hobbit?', 'amr-unknown', 'tolkien'),
+               make_triple('Which book did Tolkien write?', 'amr-unknown', 'jrr tolkien')]
+    params_list = [{'normalized_to_surface_form': dict()}] * 3 + \
+        [{'normalized_to_surface_form': {'jrr tolkien': 'Tolkien'}}]
+
+    scores = neural_relation_linking.get_relation_candidates_batch(triples, params_list)
+    # who: 0, hobbit: 14, which: 0, tolkien: 15
+    assert scores == [Counter({'dbo:author': 0.5, 'dbo:writer': 0.14}),
+                      Counter({'dbo:author': 0.64, 'dbo:writer': 0.0}),
+                      Counter(),
+                      Counter({'dbo:author': 0.5, 'dbo:writer': 0.15})]
+    assert neural_relation_linking.neural_model.batches[0] == [
+        {'text': 'who wrote the hobbit?', 'h': {'pos': (0, 4)}, 't': {'pos': (14, 21)}},
+        {'text': 'who wrote the hobbit?', 'h': {'pos': (14, 21)}, 't': {'pos': (0, 4)}},
+        {'text': 'which book did tolkien write?', 'h': {'pos': (0, 6)}, 't': {'pos': (15, 27)}}]
+    assert [neural_relation_linking.get_relation_candidates(triple, params)
+            for triple, params in zip(triples, params_list)] == scores
+
+
+def test_batch_without_params(neural_relation_linking):
+    triples = [make_triple('Who wrote the Hobbit?', 'amr-unknown', 'hobbit'),
+               make_triple('Which book did Tolkien write?', 'amr-unknown', 'jrr tolkien')]
+    assert neural_relation_linking.get_relation_candidates_batch(triples) == [
+        Counter({'dbo:author': 0.5, 'dbo:writer': 0.14}), Counter()]
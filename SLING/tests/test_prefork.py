@@ -0,0 +1,94 @@
+import gc
+import os
+import signal
+import sys
+import time
+import types
+
+import pytest
+
+from serving.prefork import PreforkWorkers
+
+
+def test_prepare_parent_hides_the_gpus(monkeypatch):
+    monkeypatch.setenv('CUDA_VISIBLE_DEVICES', '0')
+    monkeypatch.setattr(PreforkWorkers, 'set_torch_threads', classmethod(lambda cls, threads, interop_threads: None))
+    try:
+        PreforkWorkers.prepare_parent()
+        assert os.environ['CUDA_VISIBLE_DEVICES'] == ''
+    finally:
+        gc.enable()
+
+
+def test_workers_are_not_forked_after_cuda_is_initialized(monkeypatch):
+    torch = types.SimpleNamespace(cuda=types.SimpleNamespace(is_initialized=lambda: True))
+    monkeypatch.setitem(sys.modules, 'torch', torch)
+    spawned = list()
+    workers = PreforkWorkers(2, lambda index: None)
+    monkeypatch.setattr(workers, 'spawn', spawned.append)
+    with pytest.raises(RuntimeError):
+        workers.start()
+    assert spawned == list()
+
+
+def wait_for_exit(pid):
+    return os.waitpid(pid, 0)[1]
+
+
+def test_describe_status():
+    pid = os.fork()
+    if pid == 0:
+        os._exit(3)
+    assert PreforkWorkers.describe_status(wait_for_exit(pid)) == 'exited with code 3'
+
+    pid = os.fork()
+    if pid == 0:
+        time.sleep(60)
+        os._exit(0)
+    os.kill(pid, signal.SIGKILL)
+    assert PreforkWorkers.describe_status(wait_for_exit(pid)) == 'was killed by signal {}'.format(signal.SIGKILL)
+
+
+def test_dead_workers_are_restarted(monkeypatch):
+    workers = PreforkWorkers(1, lambda index: None)
+    spawned = list()
+    monkeypatch.setattr(workers, 'spawn', spawned.append)
+    pid = os.fork()
+    if pid == 0:
+        os._exit(1)
+    workers.workers[pid] = 0
+    deadline = time.monotonic() + 10
+    while workers.workers and time.monotonic() < deadline:
+        workers.reap(restart=True)
+        time.sleep(0.01)
+    assert spawned == [0]
+
+
+def test_workers_are_stopped_if_the_supervisor_fails(monkeypatch):
+    workers = PreforkWorkers(1, lambda index: None)
+    pid = os.fork()
+    if pid == 0:
+        time.sleep(60)
+        os._exit(0)
+    workers.workers[pid] = 0
+
+    reap = workers.reap
+
+    def failing_reap(restart=False):
+        if restart:
+            raise OSError("reap failed")
+        reap(restart)
+
+    monkeypatch.setattr(workers, 'reap', failing_reap)
+    monkeypatch.setattr(workers, 'log_memory_report', lambda: None)
+    # the signal handlers installed by run are restored afterwards
+    handlers = {signum: signal.getsignal(signum) for signum in [signal.SIGTERM, signal.SIGUSR1]}
+    try:
+        with pytest.raises(OSError):
+            workers.run()
+    finally:
+        for signum, handler in handlers.items():
+            signal.signal(signum, handler)
+    assert workers.workers == dict()
+    with pytest.raises(ChildProcessError):
+        os.waitpid(pid, os.WNOHANG)
@@ -0,0 +1,41 @@
+import threading
+
+from relation_linking_core.metadata_generator.answer_type_prediction import AnswerTypePredictionService
+from relation_linking_core.metadata_generator.question_fallback import QuestionFallback
+
+CACHE = {
+    'Who wrote the Hobbit?': [['dbo:Writer', 0.9], ['dbo:Person', 0.1]],
+    'Who wrote Dune?': [['dbo:Writer', 0.8], ['dbo:Person', 0.2]],
+    'Where was Tolkien born?': [['dbo:Place', 1.0]]
+}
+
+
+def test_predict():
+    fallback = QuestionFallback(CACHE, AnswerTypePredictionService.merge_answer_types, {'fallback_min_similarity': 0.1})
+    prediction = fallback.predict('Who wrote the Silmarillion?')
+    assert [answer_type for answer_type, _ in prediction] == ['dbo:Writer', 'dbo:Person']
+    assert fallback.predict('Who wrote the Silmarillion?') is prediction
+    assert fallback.predict('Why?') is None
+
+
+def test_predictions_are_stored(tmp_path):
+    config = {'fallback_min_similarity': 0.1, 'fallback_store_path': str(tmp_path / 'fallback.db')}
+    prediction = QuestionFallback(CACHE, AnswerTypePredictionService.merge_answer_types, config,
+                                  'answer_types').predict('Who wrote the Silmarillion?')
+
+    # another process (or run) with the same store does not build the index for the stored question
+    fallback = QuestionFallback(CACHE, AnswerTypePredictionService.merge_answer_types, config, 'answer_types')
+    assert fallback.predict('Who wrote the Silmarillion?') == prediction
+    assert fallback.index is None
+    # also from other threads, which open their own connection
+    predictions = list()
+    thread = threading.Thread(target=lambda: predictions.append(fallback.predict('Who wrote the Silmarillion?')))
+    thread.start()
+    thread.join()
+    assert predictions == [prediction]
+
+    # the predictions of another feature or with other settings are not reused
+    for feature, settings in [('contextual_relations', config), ('answer_types', dict(config, fallback_neighbours=1))]:
+        fallback = QuestionFallback(CACHE, AnswerTypePredictionService.merge_answer_types, settings, feature)
+        fallback.predict('Who wrote the Silmarillion?')
+        assert fallback.index is not None
@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+from relation_linking_core.rel_linker_modules.question_similarity_based_relations import \
+    FuzzyWuzzySimilarityCalc, QuestionSimilarityBasedRelRecommender, SimilarityCalc
+
+PROP_MAP = {'dbo:author': 'author', 'dbo:writer': 'writer', 'dbo:birthPlace': 'birth place (of a person)'}
+
+
+def make_triple(text, subj_text, subj_uri, obj_text, obj_uri):
+    return {'text': text, 'subj_text': subj_text, 'subj_uri': subj_uri, 'obj_text': obj_text, 'obj_uri': obj_uri}
+
+
+@pytest.fixture
+def recommender(stopwords):
+    # orthogonal unit vectors, so that the similarities are exactly 0 or 1
+    unit_vectors = np.eye(3, dtype=np.float32)
+    embeddings = {'author': unit_vectors[0], 'writer': unit_vectors[0], 'place': unit_vectors[1],
+                  'birth': unit_vectors[2], 'born': unit_vectors[2]}
+    module = QuestionSimilarityBasedRelRecommender.__new__(QuestionSimilarityBasedRelRecommender)
+    module.prop_map = PROP_MAP
+    module.fuzzywuzzysimExtractor = FuzzyWuzzySimilarityCalc(PROP_MAP)
+    module.similarityExtractor = SimilarityCalc(PROP_MAP, embeddings)
+    return module
+
+
+def test_batch_matches_the_triples_one_by_one(recommender):
+    triple = make_triple('Who is the author of the Hobbit?', 'amr-unknown', None, 'Hobbit', 'dbr:The_Hobbit')
+    inverse_triple = make_triple('Who is the author of the Hobbit?', 'Hobbit', 'dbr:The_Hobbit', 'amr-unknown', None)
+    other_triple = make_triple('Where was Tolkien born?', 'Tolkien', 'dbr:Tolkien', 'amr-unknown', None)
+    triples = [triple, inverse_triple, other_triple, other_triple]
+    relations = ['dbo:writer', 'dbo:birthPlace', 'dbo:author', 'dbo:unlabelled']
+    params_list = [{'listOfRelations': relations}, {'listOfRelations': relations[:3]},
+                   {'listOfRelations': ['dbo:author', 'dbo:birthPlace']}, None]
+
+    scores = recommender.get_relation_candidates_batch(triples, params_list)
+    # context "author": writer and author are similar (author also matches exactly), ordered by similarity
+    assert list(scores[0].items()) == [('dbo:writer', 1.0), ('dbo:author', 2.0), ('dbo:birthPlace', 0.0),
+                                       ('dbo:unlabelled', 0.0)]
+    assert list(scores[1].items()) == [('dbo:writer', 1.0), ('dbo:author', 2.0), ('dbo:birthPlace', 0.0)]
+    # context "born": one of the two tokens of birth place is similar
+    assert list(scores[2].items()) == [('dbo:birthPlace', 0.5), ('dbo:author', 0.0)]
+    # no candidate relations without params
+    assert list(scores[3].items()) == list()
+
+    for triple_data, params, triple_scores in zip(triples, params_list, scores):
+        assert list(recommender.get_relation_candidates(triple_data, params).items()) == list(triple_scores.items())
+
+
+def test_batch_without_params(recommender):
+    triple = make_triple('Who is the author of the Hobbit?', 'amr-unknown', None, 'Hobbit', 'dbr:The_Hobbit')
+    assert recommender.get_relation_candidates_batch([triple, triple]) == [{}, {}]
@@ -0,0 +1,28 @@
+from conftest import load_questions
+
+
+def test_batch_composition_does_not_change_the_relations(make_service):
+    """
+    The relations of a question do not depend on the other questions of its batch. The batch overrides of the modules
+    are tested against their per-triple results in the tests of each module.
+    """
+    # without the AMR cache, so that each call parses the EAMRs again
+    service = make_service({'amr_cache_size': 0})
+    questions = load_questions()
+    # each question in a batch of its own
+    expected = [service.process(question_text, amr_graph) for question_text, amr_graph in questions]
+    assert any(expected)
+    assert service.process_batch(questions) == expected
+    # batches of several sizes, with the same question twice in a batch
+    for batch_size in [2, 7, 16]:
+        predictions = list()
+        for start in range(0, len(questions), batch_size):
+            predictions.extend(service.process_batch(questions[start:start + batch_size]))
+        assert predictions == expected
+    assert service.process_batch([questions[3], questions[3]]) == [expected[3], expected[3]]
+
+
+def test_process_batch_sequential_modules(make_service):
+    questions = load_questions(limit=20)
+    expected = make_service({'amr_cache_size': 0}).process_batch(questions)
+    assert make_service({'amr_cache_size': 0, 'module_workers': 1}).process_batch(questions) == expected
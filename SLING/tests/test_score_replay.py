@@ -0,0 +1,40 @@
+from conftest import load_questions
+from relation_linking_core.score_capture import ScoreCapture
+from relation_linking_core.score_replay import ScoreReplay
+
+OTHER_WEIGHTS = [
+    {'kg_entity_recommender_scores': 2, 'contextual_rel_recommender_scores': 0.5, 'statistical_rel_mapping_scores': 1,
+     'neural_model_scores': 3, 'similarity_based_scores': 1},
+    {'kg_entity_recommender_scores': 0.1, 'statistical_rel_mapping_scores': 5, 'neural_model_scores': 0.2},
+    {'contextual_rel_recommender_scores': 4, 'similarity_based_scores': 0.3}
+]
+
+
+def capture(make_service, questions, tmp_path):
+    service = make_service({'capture_scores': True})
+    predictions = service.process_batch(questions)
+    records = service.score_capture.drain()
+    assert len(records) == len(questions)
+    for index, (record, predicted) in enumerate(zip(records, predictions)):
+        record.update({'q_id': index, 'predicted': predicted})
+    capture_path = str(tmp_path / 'scores.npz')
+    ScoreCapture.save(capture_path, records, service.aggregator.module_weights)
+    return capture_path, service.aggregator.module_weights, predictions
+
+
+def test_replay_reproduces_the_captured_predictions(make_service, tmp_path):
+    questions = load_questions()
+    capture_path, module_weights, predictions = capture(make_service, questions, tmp_path)
+    score_replay = ScoreReplay(capture_path)
+    assert score_replay.predicted == predictions
+    [(weights, replayed)] = list(score_replay.replay([module_weights]))
+    assert replayed == predictions
+
+
+def test_replay_matches_the_service_with_other_weights(make_service, tmp_path):
+    questions = load_questions()
+    capture_path, _, _ = capture(make_service, questions, tmp_path)
+    score_replay = ScoreReplay(capture_path)
+    # chunks of two configurations
+    for module_weights, replayed in score_replay.replay(OTHER_WEIGHTS, chunk_size=2):
+        assert replayed == make_service({'module_weights': module_weights}).process_batch(questions)
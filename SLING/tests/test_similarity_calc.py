@@ -0,0 +1,84 @@
+import random
+
+import numpy as np
+import pytest
+import scipy.spatial.distance
+
+from relation_linking_core.rel_linker_modules.question_similarity_based_relations import SimilarityCalc
+
+WORDS = ['owner', 'author', 'writer', 'birth', 'place', 'country', 'team', 'spouse', 'child', 'capital']
+
+
+def get_reference_similarity(embeddings, prop_map, context, relation, similarity_fn, stopwords):
+    """
+    Per token scores with scipy, as SimilarityCalc computed them before it scored the relations together.
+    """
+    token_similarity_fn = (lambda x, y: 1.0 - scipy.spatial.distance.cosine(x, y)) if similarity_fn == 'cosine' \
+        else np.dot
+    context_tokens = [word for word in context.split() if word.lower() not in stopwords]
+    if relation not in prop_map:
+        return 0.0
+    global_similarities = list()
+    for relation_token in prop_map[relation].split():
+        local_similarities = [token_similarity_fn(embeddings[relation_token], embeddings[context_token])
+                              if relation_token in embeddings and context_token in embeddings else 0.0
+                              for context_token in context_tokens]
+        global_similarities.append(max(local_similarities) if local_similarities else 0.0)
+    return sum(global_similarities) / len(global_similarities) if global_similarities else 0.0
+
+
+def make_prop_map(rnd, size=20):
+    # dbo:rN and dbp:rN have the same label, as the DBpedia ontology and property twins
+    prop_map = dict()
+    for index in range(size):
+        label = ' '.join(rnd.sample(WORDS + ['unknownword'], rnd.randint(1, 3)))
+        prop_map['dbo:r{}'.format(index)] = label
+        prop_map['dbp:r{}'.format(index)] = label
+    return prop_map
+
+
+@pytest.mark.parametrize('similarity_fn', ['cosine', 'dot'])
+def test_same_labels_tie_as_with_scipy(stopwords, similarity_fn):
+    rnd = random.Random(7)
+    np_random = np.random.RandomState(7)
+    # float32 vectors as in the embedding store
+    embeddings = {word: np_random.normal(size=300).astype(np.float32) for word in WORDS}
+    prop_map = make_prop_map(rnd)
+    similarity_calc = SimilarityCalc(prop_map, embeddings, similarity_fn)
+    reference_stopwords = similarity_calc.stopwords
+
+    for _ in range(300):
+        context = ' '.join(rnd.sample(WORDS + ['the', 'unknownword'], rnd.randint(1, 4)))
+        relations = rnd.sample(list(prop_map) + ['dbo:unlabelled'], rnd.randint(1, 16))
+        scores = dict(similarity_calc.extract(context, relations))
+        reference_scores = {relation: get_reference_similarity(embeddings, prop_map, context, relation,
+                                                               similarity_fn, reference_stopwords)
+                            for relation in relations}
+        for relation in relations:
+            # the reference dot products of the float32 vectors are summed in float32
+            assert scores[relation] == pytest.approx(reference_scores[relation], rel=1e-5, abs=1e-5)
+            # each score is the same when the relation is scored alone
+            assert similarity_calc.similarity(context, relation) == scores[relation]
+            twin = relation.replace('dbo:', 'dbp:') if relation.startswith('dbo:') else relation.replace('dbp:', 'dbo:')
+            if twin in scores:
+                assert scores[twin] == scores[relation]
+
+        # relations with the same label tie and keep their order, as with the reference scores
+        ranked = [relation for relation, _ in similarity_calc.extract(context, relations)]
+        reference_ranked = sorted(relations, key=lambda relation: reference_scores[relation], reverse=True)
+        for label in set(prop_map.values()):
+            assert [relation for relation in ranked if prop_map.get(relation) == label] == \
+                [relation for relation in reference_ranked if prop_map.get(relation) == label]
+
+
+def test_reported_tie(stopwords):
+    np_random = np.random.RandomState(0)
+    embeddings = {word: np_random.normal(size=300).astype(np.float32) for word in WORDS}
+    prop_map = {'dbo:r{}'.format(index): ' '.join(WORDS[index % 7:index % 7 + 2]) for index in range(20)}
+    prop_map['dbo:r4'] = prop_map['dbo:r12']
+    similarity_calc = SimilarityCalc(prop_map, embeddings)
+    relations = ['dbo:r18', 'dbo:r12', 'dbo:r4', 'dbo:r19', 'dbo:r6', 'dbo:r16', 'dbo:r0', 'dbo:r1']
+    scores = dict(similarity_calc.extract('owner', relations))
+    assert scores['dbo:r12'] == scores['dbo:r4']
+    ranked = [relation for relation, _ in similarity_calc.extract('owner', relations)]
+    assert ranked.index('dbo:r12') < ranked.index('dbo:r4')
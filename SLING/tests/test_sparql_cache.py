@@ -0,0 +1,22 @@
+import json
+import os
+
+from relation_linking_core.sparql_cache.sparql_cache import get_sparql_cache, is_shared_by_processes
+
+
+def test_json_cache_is_replaced_atomically(tmp_path):
+    cache_path = tmp_path / 'sparql.json'
+    cache_path.write_text(json.dumps({'q1': ['dbo:author']}))
+    sparql_cache = get_sparql_cache({'sparql_cache_path': str(cache_path)})
+    sparql_cache.put_all({'q2': ['dbo:writer'], 'q3': list()})
+    sparql_cache.put('q4', ['dbo:publisher'])
+    assert json.loads(cache_path.read_text()) == {'q1': ['dbo:author'], 'q2': ['dbo:writer'], 'q3': list(),
+                                                  'q4': ['dbo:publisher']}
+    assert os.listdir(str(tmp_path)) == ['sparql.json']
+
+
+def test_sqlite_cache_is_shared(tmp_path):
+    config = {'sparql_cache_backend': 'sqlite', 'sparql_cache_path': str(tmp_path / 'sparql.db')}
+    assert is_shared_by_processes(config) and not is_shared_by_processes({'sparql_cache_path': 'sparql.json'})
+    get_sparql_cache(config).put_all({'q1': ['dbo:author']})
+    assert get_sparql_cache(config).get('q1') == ['dbo:author']
@@ -0,0 +1,126 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+import requests
+
+from relation_linking_core.rel_linker_modules.sparql_client import SparqlClient
+
+
+class StubSparqlHandler(BaseHTTPRequestHandler):
+    """
+    SPARQL endpoint stub: returns one binding with the query string, sleeps on queries containing SLOW, fails with a
+    500 on queries containing FAIL and waits a bit on the others so that concurrent requests overlap.
+    """
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def reply(self, query):
+        stats = self.server.stats
+        with stats['lock']:
+            stats['connections'].add(self.client_address)
+            stats['in_flight'] += 1
+            stats['max_in_flight'] = max(stats['max_in_flight'], stats['in_flight'])
+        try:
+            time.sleep(1.0 if 'SLOW' in query else 0.05)
+            if 'FAIL' in query:
+                self.send_response(500)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            body = json.dumps({'head': {'vars': ['query']},
+                               'results': {'bindings': [{'query': {'type': 'literal', 'value': query}}]}}).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/sparql-results+json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        finally:
+            with stats['lock']:
+                stats['in_flight'] -= 1
+
+    def do_GET(self):
+        self.reply(parse_qs(urlparse(self.path).query)['query'][0])
+
+    def do_POST(self):
+        content = self.rfile.read(int(self.headers['Content-Length'])).decode('utf-8')
+        self.reply(parse_qs(content)['query'][0])
+
+
+@pytest.fixture
+def endpoint():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubSparqlHandler)
+    server.daemon_threads = True
+    server.stats = {'lock': threading.Lock(), 'connections': set(), 'in_flight': 0, 'max_in_flight': 0}
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def get_url(server):
+    return 'http://127.0.0.1:{}/sparql'.format(server.server_address[1])
+
+
+def get_value(results):
+    return results['results']['bindings'][0]['query']['value']
+
+
+def test_query(endpoint):
+    client = SparqlClient(get_url(endpoint))
+    assert get_value(client.query('SELECT ?s WHERE { ?s ?p ?o }')) == 'SELECT ?s WHERE { ?s ?p ?o }'
+    # long queries are sent in a POST body
+    long_query = 'SELECT ?s WHERE { ?s ?p ?o } #' + 'x' * SparqlClient.max_get_query_length
+    assert get_value(client.query(long_query)) == long_query
+    client.close()
+
+
+def test_query_all_reuses_pooled_connections(endpoint):
+    client = SparqlClient(get_url(endpoint), max_concurrency=4)
+    queries = ['SELECT {}'.format(index) for index in range(40)]
+    results = client.query_all(queries + queries[:5])
+    assert sorted(results) == sorted(queries)
+    assert all(get_value(results[query]) == query for query in queries)
+    # 40 queries over keep-alive connections, at most one per concurrent request
+    assert len(endpoint.stats['connections']) <= 4
+    client.close()
+
+
+def test_query_all_bounds_in_flight_requests(endpoint):
+    client = SparqlClient(get_url(endpoint), max_concurrency=3)
+    start = time.perf_counter()
+    results = client.query_all(['SELECT {}'.format(index) for index in range(12)])
+    elapsed = time.perf_counter() - start
+    assert len(results) == 12
+    assert endpoint.stats['max_in_flight'] == 3
+    # 4 rounds of 3 concurrent 50 ms requests rather than 12 sequential ones
+    assert elapsed < 12 * 0.05
+    client.close()
+
+
+def test_query_all_times_out_per_query(endpoint):
+    client = SparqlClient(get_url(endpoint), max_concurrency=4, timeout=0.2)
+    start = time.perf_counter()
+    results = client.query_all(['SELECT SLOW', 'SELECT 1', 'SELECT 2'])
+    assert time.perf_counter() - start < 1.0
+    assert isinstance(results['SELECT SLOW'], requests.exceptions.Timeout)
+    assert get_value(results['SELECT 1']) == 'SELECT 1'
+    assert get_value(results['SELECT 2']) == 'SELECT 2'
+    client.close()
+
+
+def test_query_all_returns_the_exception_of_a_failing_query(endpoint):
+    client = SparqlClient(get_url(endpoint))
+    results = client.query_all(['SELECT FAIL', 'SELECT 1'])
+    assert isinstance(results['SELECT FAIL'], requests.exceptions.HTTPError)
+    assert get_value(results['SELECT 1']) == 'SELECT 1'
+    with pytest.raises(requests.exceptions.HTTPError):
+        client.query('SELECT FAIL')
+    client.close()